@@ -0,0 +1,188 @@
+"""
+End-to-end benchmark suite over replayed sessions.
+
+Replays each session (see replay.py) through the full agent loop for a
+number of iterations with tracing on, then reports throughput and
+p50/p95/p99 latency per stage. Compared against a saved baseline, any
+stage whose p95 (or the overall throughput) is worse by more than the
+threshold fails the run — so regressions show up without a Mac,
+microphone, Logic Pro or network.
+
+Usage:
+    python src/benchmark.py                                  # all sessions
+    python src/benchmark.py --save-baseline                  # record baseline
+    python src/benchmark.py --threshold 0.15 --iterations 50
+
+LEARNING GOALS:
+- Understand why tail latency needs many samples to be meaningful
+- Learn to gate changes on performance baselines with noise tolerance
+"""
+
+import io
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import contextlib
+from typing import Dict, List
+
+import tracing
+from replay import SessionReplay, load_session
+
+
+SESSIONS_GLOB = "data/sessions/*.json"
+DEFAULT_BASELINE = "data/benchmarks/baseline.json"
+
+# A stage regresses when its p95 grows by more than this fraction...
+DEFAULT_THRESHOLD = 0.20
+# ...and by more than this many ms (sub-ms stages are mostly timer noise)
+DEFAULT_MIN_DELTA_MS = 0.5
+
+
+def run_session_benchmark(path: str, iterations: int, time_scale: float = 0.0) -> Dict:
+    """
+    Replay one session `iterations` times and summarize.
+
+    Args:
+        path: Session JSON
+        iterations: Full passes over the session's utterances
+        time_scale: Event pacing passed to the fake Realtime server
+
+    Returns:
+        Report dict: commands, throughput and per-stage percentiles (ms)
+    """
+    session = load_session(path)
+    tracer = tracing.enable()
+    # Component log lines would swamp the report (and cost time) — mute them
+    with contextlib.redirect_stdout(io.StringIO()):
+        replay = SessionReplay(session, time_scale=time_scale)
+        try:
+            replay.run()  # warm-up pass: imports, sockets, first-frame costs
+            tracer.reset()
+            commands = 0
+            start = time.perf_counter()
+            for _ in range(iterations):
+                for result in replay.run():
+                    commands += bool(result["command"])
+                    tracing.record("replay.listen", int(result["timings"]["listen"] * 1e6))
+            wall = time.perf_counter() - start
+        finally:
+            replay.close()
+    tracer.enabled = False
+
+    stages = {}
+    for name, h in sorted(tracer.histograms.items()):
+        mean_ms = h.mean() / 1e6
+        stages[name] = {
+            "count": h.count,
+            "ops_per_s": round(1000 / mean_ms, 1) if mean_ms else None,
+            "p50_ms": round(h.percentile(0.50) / 1e6, 3),
+            "p95_ms": round(h.percentile(0.95) / 1e6, 3),
+            "p99_ms": round(h.percentile(0.99) / 1e6, 3),
+        }
+    return {
+        "session": session["name"],
+        "iterations": iterations,
+        "commands": commands,
+        "wall_s": round(wall, 3),
+        "commands_per_s": round(commands / wall, 2) if wall else None,
+        "stages": stages,
+    }
+
+
+def compare_to_baseline(
+    report: Dict,
+    baseline: Dict,
+    threshold: float = DEFAULT_THRESHOLD,
+    min_delta_ms: float = DEFAULT_MIN_DELTA_MS
+) -> List[str]:
+    """
+    List regressions of one session report against its baseline.
+
+    Args:
+        report: From run_session_benchmark()
+        baseline: Same shape, from an earlier run
+        threshold: Allowed fractional slowdown
+        min_delta_ms: Ignore p95 increases smaller than this
+
+    Returns:
+        Human-readable regression descriptions (empty if none)
+    """
+    problems = []
+    old_rate, new_rate = baseline.get("commands_per_s"), report.get("commands_per_s")
+    if old_rate and new_rate and new_rate < old_rate * (1 - threshold):
+        problems.append(f"throughput {new_rate} < {old_rate} commands/s")
+
+    for name, old in baseline.get("stages", {}).items():
+        new = report["stages"].get(name)
+        if new is None:
+            continue
+        delta = new["p95_ms"] - old["p95_ms"]
+        if new["p95_ms"] > old["p95_ms"] * (1 + threshold) and delta > min_delta_ms:
+            problems.append(f"{name} p95 {old['p95_ms']:.3f} -> {new['p95_ms']:.3f} ms")
+    return problems
+
+
+def print_report(report: Dict):
+    """Print one session report as a table."""
+    print(f"\n{report['session']}: {report['commands']} commands in {report['wall_s']}s "
+          f"({report['commands_per_s']} commands/s)")
+    print(f"  {'stage':22} {'count':>6} {'ops/s':>10} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, s in report["stages"].items():
+        print(f"  {name:22} {s['count']:6d} {s['ops_per_s'] or 0:10.1f} "
+              f"{s['p50_ms']:9.3f} {s['p95_ms']:9.3f} {s['p99_ms']:9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay benchmark suite")
+    parser.add_argument("sessions", nargs="*", help=f"Session files (default: {SESSIONS_GLOB})")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--time-scale", type=float, default=0.0,
+                        help="Event pacing: 1.0 = as recorded, 0 = back to back")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Write this run as the new baseline instead of comparing")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed fractional slowdown before failing")
+    parser.add_argument("--min-delta-ms", type=float, default=DEFAULT_MIN_DELTA_MS)
+    args = parser.parse_args()
+
+    paths = args.sessions or sorted(glob.glob(SESSIONS_GLOB))
+    if not paths:
+        sys.exit(f"No sessions found ({SESSIONS_GLOB})")
+
+    reports = {}
+    for path in paths:
+        report = run_session_benchmark(path, args.iterations, args.time_scale)
+        reports[report["session"]] = report
+        print_report(report)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(reports, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline} — run with --save-baseline first")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    failed = False
+    for name, report in reports.items():
+        if name not in baseline:
+            continue
+        for problem in compare_to_baseline(report, baseline[name], args.threshold, args.min_delta_ms):
+            print(f"REGRESSION [{name}] {problem}")
+            failed = True
+    if failed:
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.threshold:.0%} of baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,86 @@ LEARNING GOALS:
 - Practice data structures for command mapping
 """
 
-from typing import Optional, List
+import re
+from typing import Dict, List, Optional, Tuple
+
+
+# Scheduling priority (lower runs first). Stopping is the most urgent
+# thing a musician asks for; transport beats everything else.
+COMMAND_PRIORITY = {
+    "stop": 0,
+    "play": 1,
+    "record": 1,
+}
+DEFAULT_PRIORITY = 5
+
+# Commands in the same group supersede each other: once "stop" arrives, a
+# still-pending "play" is obsolete.
+COMMAND_GROUPS = {
+    "play": "transport",
+    "stop": "transport",
+    "record": "transport",
+    "metronome_on": "metronome",
+    "metronome_off": "metronome",
+}
+
+# Within one utterance, settings must be in place before playback starts:
+# "hit record and turn on the metronome" turns the metronome on first.
+SETUP_GROUPS = {"metronome"}
+START_COMMANDS = {"play", "record"}
+
+# Logic Pro's default key commands for transport: Play is keypad Enter,
+# Stop is keypad 0 (Return would be "Go to Beginning", and Space toggles).
+# Key names are CursorController.press_key() names — the keypad ones are
+# posted as macOS key codes, since pyautogui has none for them. Pressing
+# a key needs neither a screenshot nor the vision model, so these still
+# work when the load governor has shed everything else (see governor.py).
+KEYBOARD_SHORTCUTS = {
+    "play": "keypad_enter",
+    "stop": "keypad_0",
+    "record": "r",
+}
+
+# Where a compound utterance splits into separate intents
+INTENT_SEPARATORS = re.compile(r"\s*(?:[,;]|\band then\b|\bthen\b|\band\b|\balso\b|\bplus\b)\s*")
+
+# Commands on a numbered track. They parse to "<command>:<track>", e.g.
+# "mute track 5" → "mute_track:5". vision is how the vision prompt is
+# phrased. row_steps is how many leading plan steps click inside the
+# track's own row (None: all of them) — the rest, like the inspector's
+# plug-in slot, stay put whichever track it is.
+TRACK_COMMANDS = {
+    "mute_track": {
+        "pattern": r"\bmute track (\w+)",
+        "description": "Muting track {track}",
+        "vision": "mute track {track}",
+        "row_steps": None,
+    },
+    "solo_track": {
+        "pattern": r"\bsolo track (\w+)",
+        "description": "Soloing track {track}",
+        "vision": "solo track {track}",
+        "row_steps": None,
+    },
+    "arm_track": {
+        "pattern": r"\b(?:arm|record enable) track (\w+)",
+        "description": "Arming track {track}",
+        "vision": "arm track {track}",
+        "row_steps": None,
+    },
+    "add_reverb": {
+        "pattern": r"\badd (?:a |some )?reverb to track (\w+)",
+        "description": "Adding reverb to track {track}",
+        "vision": "add reverb to track {track}",
+        "row_steps": 1,
+    },
+}
+
+# Transcripts spell small numbers out ("mute track two")
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
 
 
 class CommandProcessor:
@@ -17,48 +96,108 @@ class CommandProcessor:
         """
         Initialize command processor.
 
-        TODO: Think about what data structures you need
-        - How will you map different phrases to the same command?
-        - "play", "hit play", "start playing" → all mean PLAY
+        Maps many phrases onto one standard command:
+        "play", "hit play", "start playing" → all mean PLAY
         """
         # Define command patterns
-        # TODO: Fill this in
         self.command_patterns = {
             "play": ["play", "start", "hit play", "start playing"],
             "stop": ["stop", "pause", "halt"],
             "record": ["record", "hit record", "start recording"],
-            "metronome_on": ["metronome on", "click on", "turn on metronome"],
-            "metronome_off": ["metronome off", "click off", "turn off metronome"],
+            "metronome_on": ["metronome on", "click on", "turn on metronome",
+                             "turn on the metronome", "turn the metronome on"],
+            "metronome_off": ["metronome off", "click off", "turn off metronome",
+                              "turn off the metronome", "turn the metronome off"],
         }
 
     def parse_command(self, user_input: str) -> Optional[str]:
         """
         Parse user's natural language into a standard command.
 
-        TODO: Implement this
-        Hints:
-        - Convert user_input to lowercase
-        - Check if it matches any pattern
-        - Return the command key (e.g., "play", "record")
-        - Return None if no match
+        Longer phrases are tried first so "turn off metronome" wins over a
+        bare "stop"-style keyword hidden inside it, and phrases only match
+        on word boundaries ("display" does not contain "play"). Track
+        commands are checked before any of them.
+
+        Args:
+            user_input: Raw text from user
+
+        Returns:
+            Standard command string ("mute_track:5" for track commands) or None
+        """
+        if not user_input:
+            return None
+
+        text = " " + " ".join(user_input.lower().replace(",", " ").replace(".", " ").split()) + " "
+        for command, spec in TRACK_COMMANDS.items():
+            match = re.search(spec["pattern"], text)
+            if match:
+                word = match.group(1)
+                track = int(word) if word.isdigit() else NUMBER_WORDS.get(word)
+                if track:
+                    return f"{command}:{track}"
+
+        candidates = sorted(
+            ((phrase, command)
+             for command, phrases in self.command_patterns.items()
+             for phrase in phrases),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+        for phrase, command in candidates:
+            if f" {phrase} " in text:
+                return command
+        return None
+
+    def parse_intents(self, user_input: str) -> List[str]:
+        """
+        Split a compound utterance into an ordered list of commands.
 
-        Challenge: How to handle partial matches?
-        - "can you play it" should match "play"
-        - Use string contains? Fuzzy matching?
+        "turn on the metronome and hit record" → ["metronome_on", "record"].
+        Segments that don't parse are skipped, repeats collapse, and the
+        result is dependency-ordered (see order_intents()).
 
         Args:
             user_input: Raw text from user
 
         Returns:
-            Standard command string or None
+            Standard command strings (empty if nothing matched)
         """
-        pass
+        if not user_input:
+            return []
+        intents = []
+        for segment in INTENT_SEPARATORS.split(user_input.lower()):
+            command = self.parse_command(segment)
+            if command and (not intents or intents[-1] != command):
+                intents.append(command)
+        return self.order_intents(intents)
+
+    def order_intents(self, intents: List[str]) -> List[str]:
+        """
+        Order intents so their steps can run one after another.
+
+        Setup commands (metronome) spoken after a play/record move ahead of
+        it; everything else keeps the spoken order ("play then stop" stays).
+
+        Args:
+            intents: Commands in spoken order
+
+        Returns:
+            Commands in execution order
+        """
+        starts = [i for i, command in enumerate(intents) if command in START_COMMANDS]
+        if not starts:
+            return list(intents)
+        first = starts[0]
+        tail = intents[first:]
+        setup = [c for c in tail if self.get_group(c) in SETUP_GROUPS]
+        rest = [c for c in tail if self.get_group(c) not in SETUP_GROUPS]
+        return intents[:first] + setup + rest
 
     def get_command_description(self, command: str) -> str:
         """
         Get a human-readable description of what a command does.
 
-        TODO: Implement this
         Useful for confirmation messages:
         - "Playing track..."
         - "Starting recording..."
@@ -69,6 +208,9 @@ class CommandProcessor:
         Returns:
             Human description
         """
+        name, params = self.split_intent(command)
+        if name in TRACK_COMMANDS:
+            return TRACK_COMMANDS[name]["description"].format(**params)
         descriptions = {
             "play": "Playing track",
             "stop": "Stopping playback",
@@ -76,23 +218,91 @@ class CommandProcessor:
             "metronome_on": "Turning on metronome",
             "metronome_off": "Turning off metronome"
         }
-        # TODO: Return appropriate description
-        pass
+        return descriptions.get(command, command.replace("_", " ").capitalize())
+
+    def split_intent(self, command: str) -> Tuple[str, Dict[str, int]]:
+        """
+        Separate a command from its parameters.
+
+        Args:
+            command: Standard command string ("mute_track:5" or "play")
+
+        Returns:
+            Tuple of (command name, params) — ("mute_track", {"track": 5})
+        """
+        name, _, track = command.partition(":")
+        if name in TRACK_COMMANDS and track.isdigit():
+            return name, {"track": int(track)}
+        return command, {}
+
+    def get_vision_command(self, command: str) -> str:
+        """
+        Phrase a command the way the vision prompt should see it.
+
+        Args:
+            command: Standard command string
+
+        Returns:
+            "add reverb to track 5" for track commands, otherwise the
+            command itself
+        """
+        name, params = self.split_intent(command)
+        if name in TRACK_COMMANDS and params:
+            return TRACK_COMMANDS[name]["vision"].format(**params)
+        return command
+
+    def get_priority(self, command: str) -> int:
+        """
+        Scheduling priority of a command (lower runs first).
+
+        Args:
+            command: Standard command string
+
+        Returns:
+            Priority number
+        """
+        return COMMAND_PRIORITY.get(command, DEFAULT_PRIORITY)
+
+    def get_group(self, command: str) -> str:
+        """
+        Group whose members supersede each other when queued.
+
+        Commands without a group only supersede themselves.
+
+        Args:
+            command: Standard command string
+
+        Returns:
+            Group name
+        """
+        return COMMAND_GROUPS.get(command, command)
+
+    def get_shortcut(self, command: str) -> Optional[str]:
+        """
+        Key that performs a command without looking at the screen.
+
+        Args:
+            command: Standard command string
+
+        Returns:
+            pyautogui key name, or None if the command needs vision
+        """
+        return KEYBOARD_SHORTCUTS.get(command)
 
     def is_valid_command(self, command: str) -> bool:
         """
         Check if a command is valid.
 
-        TODO: Implement this
-        Simple: check if command is in self.command_patterns
-
         Args:
             command: Command to validate
 
         Returns:
             True if valid
         """
-        pass
+        name, params = self.split_intent(command)
+        if name in TRACK_COMMANDS:
+            return bool(params)
+        return command in self.command_patterns
 
 
 # Test function
@@ -100,7 +310,6 @@ def test_commands():
     """
     Test command processing.
 
-    TODO: Implement this
     Test cases:
     - "play" → should parse to "play"
     - "can you hit play please" → should parse to "play"
@@ -120,7 +329,26 @@ def test_commands():
         "metronome on"
     ]
 
-    # TODO: Test each input and print results
+    for text in test_inputs:
+        command = processor.parse_command(text)
+        print(f"  {text!r:25} -> {command}")
+
+    compound_inputs = [
+        "turn on the metronome and hit record",
+        "hit record and turn on the metronome",
+        "play, then stop",
+        "rock and roll",
+        "mute track two and solo track 3",
+        "add reverb to track 2",
+    ]
+    for text in compound_inputs:
+        print(f"  {text!r:40} -> {processor.parse_intents(text)}")
+
+    # The vision prompt sees the command the way a user would say it
+    for command in ["add_reverb:2", "mute_track:5", "play"]:
+        print(f"  vision prompt for {command!r:15} -> {processor.get_vision_command(command)!r}")
+    assert processor.get_vision_command("add_reverb:2") == "add reverb to track 2"
+    assert all("vision" in spec for spec in TRACK_COMMANDS.values())
 
 
 if __name__ == "__main__":
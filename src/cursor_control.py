@@ -7,43 +7,86 @@ LEARNING GOALS:
 - Practice safe automation (avoiding accidental clicks)
 """
 
-import pyautogui
+import os
+import re
 import time
-from typing import Dict, List
+import importlib.util
+from typing import Dict, List, Optional
+
+try:
+    import pyautogui
+except Exception:  # not installed, or no display (e.g. headless Linux replay)
+    pyautogui = None
+
+try:
+    import Quartz
+except ImportError:  # not macOS
+    Quartz = None
+
+
+# Pause after each click so the UI can respond before the next action
+CLICK_SETTLE = 0.1
+
+# Keys pyautogui can't press on macOS: its "enter" is Return (0x24) and it
+# has no keypad keys. These are posted as virtual key codes via Quartz.
+MAC_KEYCODES = {
+    "keypad_enter": 0x4C,   # kVK_ANSI_KeypadEnter
+    "keypad_0": 0x52,       # kVK_ANSI_Keypad0
+}
+
+
+def pyautogui_key_table(platform: str = "osx") -> Optional[Dict[str, Optional[int]]]:
+    """
+    Key name → key code table of one of pyautogui's platform backends.
+
+    Read from the backend's source, so the macOS table can be checked on
+    any machine pyautogui is installed on.
+
+    Returns:
+        The table, or None if pyautogui isn't installed
+    """
+    spec = importlib.util.find_spec("pyautogui")
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    path = os.path.join(list(spec.submodule_search_locations)[0], f"_pyautogui_{platform}.py")
+    with open(path) as f:
+        source = f.read()
+    return {name: int(code, 16) for name, code in re.findall(r"'([^']+)':\s*(0x[0-9a-fA-F]+)", source)}
+
+
+def key_available(key: str) -> bool:
+    """True if press_key() can actually send this key on this machine."""
+    if key in MAC_KEYCODES:
+        return Quartz is not None
+    if pyautogui is None:
+        return False
+    table = getattr(getattr(pyautogui, "platformModule", None), "keyboardMapping", None)
+    return table is None or table.get(key) is not None
 
 
 class CursorController:
     """Controls mouse cursor to execute GUI actions."""
 
-    def __init__(self, move_duration: float = 0.3):
+    def __init__(self, move_duration: float = 0.3, action_delay: float = 0.2):
         """
         Initialize cursor controller.
 
-        TODO: Implement this
-        Hints:
-        - Store move_duration for how fast cursor moves
-        - Consider PyAutoGUI safety features
-
         Args:
             move_duration: How long (seconds) cursor takes to move
+            action_delay: Pause (seconds) between actions in a sequence
         """
-        pass
+        self.move_duration = move_duration
+        self.action_delay = action_delay
+        if pyautogui is not None:
+            # Slam the mouse into a screen corner to abort a runaway plan
+            pyautogui.FAILSAFE = True
 
     def click_at(self, x: int, y: int, description: str = "") -> bool:
         """
         Move cursor to coordinates and click.
 
-        TODO: Implement this
-        Hints:
-        - Use pyautogui.moveTo(x, y, duration=self.move_duration)
-        - Use pyautogui.click()
-        - Add small delay after click (time.sleep)
-        - Print what you're clicking (helpful for debugging)
-        - Return True if successful, False if error
-
-        Why the delay?
-        - UI needs time to respond
-        - Prevents clicking too fast
+        Waits briefly after the click — the UI needs time to respond, and
+        it prevents clicking too fast.
 
         Args:
             x: X coordinate
@@ -53,23 +96,58 @@ class CursorController:
         Returns:
             True if successful
         """
-        pass
+        if pyautogui is None:
+            print("  Error: pyautogui is not available (needs a display)")
+            return False
+        print(f"  Clicking {description or 'target'} at ({x}, {y})")
+        try:
+            pyautogui.moveTo(x, y, duration=self.move_duration)
+            pyautogui.click()
+            time.sleep(CLICK_SETTLE)
+            return True
+        except pyautogui.FailSafeException:
+            print("  Failsafe triggered — aborting")
+            return False
+        except Exception as e:
+            print(f"  Click failed: {e}")
+            return False
+
+    def press_key(self, key: str, description: str = "") -> bool:
+        """
+        Press one key (a keyboard shortcut instead of a click).
+
+        pyautogui silently ignores keys missing from the platform's key
+        table, so those fail here instead of doing nothing.
+
+        Args:
+            key: pyautogui key name ("r", "space") or a MAC_KEYCODES name
+            description: What the key does (for logging)
+
+        Returns:
+            True if successful
+        """
+        if not key_available(key):
+            print(f"  Can't press {key} on this platform")
+            return False
+        try:
+            print(f"  Pressing {key}{f' ({description})' if description else ''}")
+            if key in MAC_KEYCODES:
+                for down in (True, False):
+                    event = Quartz.CGEventCreateKeyboardEvent(None, MAC_KEYCODES[key], down)
+                    Quartz.CGEventPost(Quartz.kCGHIDEventTap, event)
+            else:
+                pyautogui.press(key)
+            return True
+        except Exception as e:
+            print(f"  Key press failed: {e}")
+            return False
 
     def execute_action(self, action: Dict) -> bool:
         """
         Execute a single action from vision analyzer.
 
-        TODO: Implement this
-        Hints:
-        - Check action["action"] type
-        - Handle "click" type (most common)
-        - Extract x, y, description from action dict
-        - Call click_at()
-
-        Future: Could handle other action types:
-        - "type" - keyboard input
-        - "drag" - click and drag
-        - "wait" - pause for UI
+        Supported types: "click" (the common case), "key" (keyboard
+        shortcut) and "wait".
 
         Args:
             action: Dict with 'action', 'x', 'y', 'description', etc.
@@ -77,18 +155,26 @@ class CursorController:
         Returns:
             True if successful
         """
-        pass
+        kind = action.get("action", "click")
+        if kind == "click":
+            return self.click_at(
+                int(action["x"]), int(action["y"]),
+                action.get("description") or action.get("element", "")
+            )
+        if kind == "key":
+            return self.press_key(action["key"], action.get("description", ""))
+        if kind == "wait":
+            time.sleep(float(action.get("seconds", 0.5)))
+            return True
+        print(f"  Unsupported action: {kind}")
+        return False
 
     def execute_actions(self, actions: List[Dict]) -> bool:
         """
         Execute a sequence of actions.
 
-        TODO: Implement this
-        Hints:
-        - Loop through actions list
-        - Call execute_action() for each
-        - If any fails, should you continue or stop?
-        - Add delays between actions
+        Stops at the first failure — later steps usually depend on
+        earlier ones (e.g. a menu that has to be open).
 
         Args:
             actions: List of action dicts
@@ -96,40 +182,65 @@ class CursorController:
         Returns:
             True if all successful
         """
-        pass
+        for i, action in enumerate(actions):
+            if i and self.action_delay:
+                time.sleep(self.action_delay)
+            if not self.execute_action(action):
+                return False
+        return True
 
     def get_current_position(self) -> tuple:
         """
         Get current mouse cursor position.
 
-        TODO: Implement this
-        Hints:
-        - Use pyautogui.position()
-        - Useful for debugging
-
         Returns:
             Tuple of (x, y)
         """
-        pass
+        return tuple(pyautogui.position())
 
 
 # Test function
+def test_shortcuts():
+    """
+    Check every transport shortcut against pyautogui's macOS key table.
+
+    Doesn't need a Mac or a display — the table is read from source.
+    """
+    from commands import KEYBOARD_SHORTCUTS
+
+    print("Testing keyboard shortcuts...")
+    table = pyautogui_key_table("osx")
+    if table is None:
+        print("  pyautogui not installed; skipped")
+        return
+    for command, key in KEYBOARD_SHORTCUTS.items():
+        if key in MAC_KEYCODES:
+            code = MAC_KEYCODES[key]
+        else:
+            assert table.get(key) is not None, f"{command}: pyautogui can't press {key!r} on macOS"
+            code = table[key]
+        print(f"  {command:8} {key:14} key code 0x{code:02X}")
+    # Logic's Play is keypad Enter, not Return (Go to Beginning)
+    assert MAC_KEYCODES["keypad_enter"] != table["enter"]
+
+
 def test_cursor():
     """
     Test cursor control.
 
-    TODO: Implement this
-    WARNING: This will move your cursor!
-    - Move cursor to a safe location
-    - Click somewhere safe
-    - Print current position
+    WARNING: This will move your cursor! It moves to the middle of the
+    screen (without clicking) and prints the position.
     """
     print("Testing cursor control...")
     print("WARNING: This will move your cursor in 3 seconds...")
     time.sleep(3)
 
-    # TODO: Your test code
+    controller = CursorController()
+    width, height = pyautogui.size()
+    pyautogui.moveTo(width // 2, height // 2, duration=controller.move_duration)
+    print(f"  Position: {controller.get_current_position()}")
 
 
 if __name__ == "__main__":
+    test_shortcuts()
     test_cursor()
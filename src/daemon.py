@@ -0,0 +1,328 @@
+"""
+Long-lived agent daemon with a local Unix socket API.
+
+Loading Qwen2.5-VL takes far longer than running a command, so instead of
+building a fresh LogicProAgent for every `python src/main.py --command ...`
+the daemon keeps one agent (and its models) resident and serves commands
+over a Unix domain socket. `--command` becomes a thin client that uses the
+daemon when one is listening.
+
+Protocol: newline-delimited JSON, one object per line, in both directions.
+
+    → {"id": "a1", "op": "command", "text": "play"}
+    ← {"id": "a1", "ok": true, "timings": {"queue": 0.1, "parse": 0.02, ...}}
+
+    → {"id": "a2", "op": "cancel", "target": "a1"}
+    ← {"id": "a2", "ok": true}
+
+Other ops: "ping" (health check) and "shutdown".
+
+LEARNING GOALS:
+- Understand client/server IPC over Unix domain sockets
+- Learn to serialize concurrent requests onto a single-threaded resource
+- Practice cooperative cancellation with threading.Event
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import tempfile
+import threading
+import socketserver
+from typing import Dict, Optional
+
+
+# Default socket location — override with LOGICPRO_AGENT_SOCKET
+DEFAULT_SOCKET_PATH = os.environ.get(
+    "LOGICPRO_AGENT_SOCKET",
+    os.path.join(tempfile.gettempdir(), "logicpro-agent.sock"),
+)
+
+# How long a client waits for a command to finish before giving up
+CLIENT_TIMEOUT = 120.0
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """Handles one client connection; each line is one request."""
+
+    def handle(self):
+        for line in self.rfile:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:  # bad JSON, or not UTF-8 at all
+                request = {}
+                reply = {"ok": False, "error": f"bad request: {e}"}
+            else:
+                reply = self.server.daemon.handle_request(request)
+            self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            if isinstance(request, dict) and request.get("op") == "shutdown":
+                break
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class AgentDaemon:
+    """Serves commands to a resident LogicProAgent over a Unix socket."""
+
+    def __init__(self, agent, socket_path: str = DEFAULT_SOCKET_PATH):
+        """
+        Initialize the daemon.
+
+        Args:
+            agent: A loaded LogicProAgent (anything with execute_command()
+                   and last_timings works)
+            socket_path: Where to listen
+        """
+        self.agent = agent
+        self.socket_path = socket_path
+        # The agent drives one mouse and one model — run commands one at a time
+        self._lock = threading.Lock()
+        # request id → cancel event, for queued and in-flight commands
+        self._pending: Dict[str, threading.Event] = {}
+        self._pending_lock = threading.Lock()
+        self._server: Optional[_UnixServer] = None
+
+    def handle_request(self, request: Dict) -> Dict:
+        """
+        Dispatch one protocol request.
+
+        Args:
+            request: Decoded JSON request (anything but an object is refused)
+
+        Returns:
+            JSON-serializable reply
+        """
+        if not isinstance(request, dict):
+            return {"ok": False,
+                    "error": f"bad request: expected a JSON object, got {type(request).__name__}"}
+        request_id = request.get("id") or uuid.uuid4().hex[:8]
+        op = request.get("op")
+
+        if op == "ping":
+            governor = getattr(self.agent, "governor", None)
+            return {"id": request_id, "ok": True, "busy": self._lock.locked(),
+                    "load": governor.level_name if governor is not None else None}
+        if op == "command":
+            return self._run_command(request_id, request.get("text", ""))
+        if op == "cancel":
+            return {"id": request_id, "ok": self.cancel(request.get("target"))}
+        if op == "shutdown":
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {"id": request_id, "ok": True}
+        return {"id": request_id, "ok": False, "error": f"unknown op: {op}"}
+
+    def _run_command(self, request_id: str, text: str) -> Dict:
+        """Queue behind any running command, then execute on the agent."""
+        cancel_event = threading.Event()
+        with self._pending_lock:
+            # Replacing the entry would leave the other command uncancellable
+            if request_id in self._pending:
+                return {"id": request_id, "ok": False, "error": f"duplicate request id: {request_id}"}
+            self._pending[request_id] = cancel_event
+
+        queued_at = time.perf_counter()
+        try:
+            with self._lock:
+                queue_ms = (time.perf_counter() - queued_at) * 1000
+                if cancel_event.is_set():
+                    return {"id": request_id, "ok": False, "cancelled": True,
+                            "timings": {"queue": queue_ms}}
+                ok = self.agent.execute_command(text, cancel_event=cancel_event)
+                timings = {"queue": queue_ms, **self.agent.last_timings}
+        except Exception as e:
+            return {"id": request_id, "ok": False, "error": str(e)}
+        finally:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+
+        return {"id": request_id, "ok": bool(ok),
+                "cancelled": cancel_event.is_set(), "timings": timings}
+
+    def cancel(self, request_id: Optional[str]) -> bool:
+        """
+        Cancel a queued or running command.
+
+        Args:
+            request_id: Id of the command request
+
+        Returns:
+            True if the request was known and is now cancelled
+        """
+        with self._pending_lock:
+            event = self._pending.get(request_id)
+        if event is None:
+            return False
+        event.set()
+        return True
+
+    def serve_forever(self):
+        """Bind the socket and serve until shutdown() or Ctrl+C."""
+        if os.path.exists(self.socket_path):
+            if DaemonClient(self.socket_path).is_running():
+                raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+            os.unlink(self.socket_path)  # stale socket from a crashed daemon
+
+        self._server = _UnixServer(self.socket_path, _RequestHandler)
+        self._server.daemon = self
+        os.chmod(self.socket_path, 0o600)
+        print(f"Agent daemon listening on {self.socket_path}")
+        print("Press Ctrl+C to stop.\n")
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            print("\nStopping daemon.")
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        """Stop serve_forever() from another thread."""
+        with self._pending_lock:
+            for event in self._pending.values():
+                event.set()
+        if self._server:
+            self._server.shutdown()
+
+
+class DaemonClient:
+    """Thin client for talking to a running AgentDaemon."""
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH,
+                 timeout: float = CLIENT_TIMEOUT):
+        """
+        Initialize the client.
+
+        Args:
+            socket_path: Daemon socket path
+            timeout: Seconds to wait for a reply
+        """
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.last_request_id: Optional[str] = None
+
+    def _send(self, request: Dict, timeout: Optional[float] = None) -> Dict:
+        """Send one request on a fresh connection and read the reply."""
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout or self.timeout)
+            sock.connect(self.socket_path)
+            sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+            with sock.makefile("rb") as reader:
+                line = reader.readline()
+        if not line:
+            raise ConnectionError("daemon closed the connection")
+        return json.loads(line)
+
+    def is_running(self) -> bool:
+        """Return True if a daemon answers a ping on the socket."""
+        if not os.path.exists(self.socket_path):
+            return False
+        try:
+            return self._send({"op": "ping"}, timeout=1.0).get("ok", False)
+        except (OSError, ValueError):
+            return False
+
+    def execute(self, text: str) -> Dict:
+        """
+        Run a command on the daemon and wait for the result.
+
+        Args:
+            text: Natural language command
+
+        Returns:
+            Reply dict with 'ok', 'timings' and optionally 'error'
+        """
+        self.last_request_id = uuid.uuid4().hex[:8]
+        return self._send({"id": self.last_request_id, "op": "command", "text": text})
+
+    def cancel(self, request_id: Optional[str] = None) -> bool:
+        """
+        Cancel a command (defaults to the last one this client sent).
+
+        Returns:
+            True if the daemon found and cancelled it
+        """
+        target = request_id or self.last_request_id
+        if not target:
+            return False
+        return self._send({"op": "cancel", "target": target}, timeout=5.0).get("ok", False)
+
+    def shutdown(self):
+        """Ask the daemon to exit."""
+        self._send({"op": "shutdown"}, timeout=5.0)
+
+
+# Example usage / test
+def test_daemon():
+    """
+    Exercise the daemon protocol with a stand-in agent (no models needed).
+
+    Starts a daemon on a temporary socket, checks that malformed
+    requests and a reused request id are refused without dropping the
+    connection, sends two concurrent commands (they run one after the
+    other), cancels a third while it is queued, and prints the replies.
+    """
+    print("Testing agent daemon...")
+
+    class SlowAgent:
+        last_timings = {}
+
+        def execute_command(self, user_command, cancel_event=None):
+            time.sleep(0.2)
+            self.last_timings = {"total": 200.0}
+            return True
+
+    path = os.path.join(tempfile.mkdtemp(), "agent.sock")
+    daemon = AgentDaemon(SlowAgent(), path)
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    while not os.path.exists(path):
+        time.sleep(0.01)
+
+    client = DaemonClient(path)
+    print(f"  Daemon running: {client.is_running()}")
+    reply = client._send([{"op": "ping"}])
+    assert reply["ok"] is False and client.is_running(), reply
+    print(f"  Non-object request: {reply['error']}")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(5.0)
+        sock.connect(path)
+        sock.sendall(b'\x80{"op": "ping"}\n{"op": "ping"}\n')
+        with sock.makefile("rb") as reader:
+            replies = [json.loads(reader.readline()) for _ in range(2)]
+    assert replies[0]["ok"] is False and replies[1]["ok"] is True, replies
+    print(f"  Non-UTF-8 request: {replies[0]['error']}")
+
+    replies = {}
+
+    def send(request_id, text):
+        replies[text] = client._send({"id": request_id, "op": "command", "text": text})
+
+    threads = [threading.Thread(target=send, args=(f"t{i}", text))
+               for i, text in enumerate(["play", "stop", "record"])]
+    for t in threads:
+        t.start()
+        time.sleep(0.02)
+    reply = client._send({"id": "t0", "op": "command", "text": "rewind"})
+    assert reply["ok"] is False and "duplicate" in reply["error"], reply
+    print(f"  Reused id while 't0' runs: {reply['error']}")
+    print(f"  Cancel queued 'record': {client.cancel('t2')}")
+    for t in threads:
+        t.join()
+    for text, reply in replies.items():
+        queue_ms = reply.get("timings", {}).get("queue", 0.0)
+        print(f"  {text:7} ok={reply['ok']!s:5} cancelled={reply.get('cancelled')!s:5} "
+              f"queue={queue_ms:6.1f} ms")
+
+    client.shutdown()
+
+
+if __name__ == "__main__":
+    test_daemon()
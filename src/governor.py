@@ -0,0 +1,439 @@
+"""
+Load-adaptive degradation: keep the agent out of Logic Pro's way.
+
+In a dense session Logic Pro needs the CPU, and a screenshot, a vision
+inference or a background prefetch at the wrong moment can cause an
+audio dropout. LoadGovernor watches how busy the rest of the machine is
+(CPU not used by the agent), how full memory is, and how much slower
+the agent's own stages have become, then steps through levels:
+
+    level  name            vision input   archive      prefetch   transport
+    0      normal          as tuned       every frame  2 plans    vision plan
+    1      reduced         ≤ 1280 px      every 4th    1 plan     key press
+    2      minimal         ≤ 1024 px      off          off        key press
+    3      transport_only  —              off          off        key press
+
+At transport_only every other command is refused with a spoken
+explanation. Transport commands with keyboard shortcuts (see
+KEYBOARD_SHORTCUTS in commands.py) are never refused: degraded, they are
+a key press, with no screenshot and no inference.
+
+Pressure seen on ESCALATE_SAMPLES samples in a row escalates straight to
+the level it calls for. Levels relax one at a time, each after
+RELAX_SECONDS of lower pressure, so a burst doesn't make it flap.
+
+Usage:
+    python src/governor.py      # synthetic load test (~10 s)
+
+LEARNING GOALS:
+- Understand graceful degradation and load shedding
+- Learn hysteresis, which keeps a controller from oscillating
+- Practice testing a controller against a synthetic load
+"""
+
+import os
+import time
+import statistics
+import threading
+import multiprocessing
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import tracing
+from prefetch import TOP_K
+from system_monitor import CpuSampler, memory_used_fraction
+
+
+# How often CPU and memory are read
+SAMPLE_SECONDS = 1.0
+
+LEVELS = ("normal", "reduced", "minimal", "transport_only")
+
+# What each level allows (index = level)
+POLICIES = [
+    {"max_side": None, "archive_every": 1, "prefetch_top_k": TOP_K, "transport_keys": False, "vision": True},
+    {"max_side": 1280, "archive_every": 4, "prefetch_top_k": 1, "transport_keys": True, "vision": True},
+    {"max_side": 1024, "archive_every": 0, "prefetch_top_k": 0, "transport_keys": True, "vision": True},
+    {"max_side": 1024, "archive_every": 0, "prefetch_top_k": 0, "transport_keys": True, "vision": False},
+]
+
+# Readings at which levels 1, 2 and 3 start:
+#   CPU — share of all cores busy outside the agent's process
+#   memory — share of physical memory in use
+#   slowdown — recent stage latency / the same stage's baseline
+CPU_THRESHOLDS = (0.70, 0.85, 0.95)
+MEMORY_THRESHOLDS = (0.85, 0.92, 0.97)
+SLOWDOWN_THRESHOLDS = (1.5, 2.5, 4.0)
+
+# Stages whose latency is watched; the first few commands set the baseline
+LATENCY_STAGES = ("capture", "vision")
+BASELINE_COMMANDS = 5
+# Latency readings older than this no longer count
+LATENCY_WINDOW_SECONDS = 120.0
+
+ESCALATE_SAMPLES = 2
+RELAX_SECONDS = 15.0
+
+
+def agent_pids(agent) -> List[int]:
+    """This process plus the agent's worker processes (the isolated vision worker)."""
+    pids = [os.getpid()]
+    worker = getattr(getattr(agent, "vision", None), "worker", None)
+    if worker is not None and worker.pid:
+        pids.append(worker.pid)
+    return pids
+
+
+def level_for(value: Optional[float], thresholds: tuple) -> int:
+    """Number of thresholds a reading has reached (0 if unknown)."""
+    if value is None:
+        return 0
+    return sum(1 for threshold in thresholds if value >= threshold)
+
+
+class LoadGovernor:
+    """Picks a degradation level from system load and applies it to an agent."""
+
+    def __init__(
+        self,
+        agent=None,
+        cpu_reader: Optional[Callable[[], Optional[tuple]]] = None,
+        memory_reader: Callable[[], Optional[float]] = memory_used_fraction,
+        sample_seconds: float = SAMPLE_SECONDS,
+        relax_seconds: float = RELAX_SECONDS,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        Initialize the governor (call start() to sample in the background).
+
+        Args:
+            agent: LogicProAgent whose vision, screen and prefetcher are
+                   adjusted (None: only compute the level)
+            cpu_reader: Returns (system, own) CPU shares, like
+                        CpuSampler.read() (the default, counting the
+                        agent's worker processes as its own)
+            memory_reader: Returns the share of memory in use
+            sample_seconds: Time between background samples
+            relax_seconds: Low pressure needed before relaxing a level
+            clock: Time source (tests)
+        """
+        self.agent = agent
+        self._read_cpu = cpu_reader or CpuSampler(own_pids=lambda: agent_pids(agent)).read
+        self._read_memory = memory_reader
+        self.sample_seconds = sample_seconds
+        self.relax_seconds = relax_seconds
+        self._clock = clock
+
+        self.level = 0
+        self.readings: Dict[str, Optional[float]] = {"cpu": None, "memory": None, "slowdown": None}
+        # (time, level, readings) for every change
+        self.history: List[tuple] = []
+        self._pressure_samples = 0
+        self._low_since: Optional[float] = None
+        self._baselines: Dict[str, List[float]] = {stage: [] for stage in LATENCY_STAGES}
+        # (time, stage, latency / baseline)
+        self._slowdowns = deque()
+        self._tuned_side = None
+        if agent is not None:
+            self._tuned_side = (getattr(agent.vision, "settings", None) or {}).get("max_side")
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = dict.fromkeys(["samples", "changes", "fast_path", "shed", "sample_ns"], 0)
+
+    @property
+    def level_name(self) -> str:
+        return LEVELS[self.level]
+
+    @property
+    def policy(self) -> Dict:
+        return POLICIES[self.level]
+
+    # --- Sampling ----------------------------------------------------------
+
+    def start(self) -> "LoadGovernor":
+        """Sample in a background thread until stop()."""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="load-governor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.sample_seconds + 1)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.sample_seconds):
+            self.sample()
+
+    def sample(self) -> int:
+        """
+        Take one reading and move the level if warranted.
+
+        Returns:
+            The level after this sample
+        """
+        start = time.perf_counter_ns()
+        cpu = self._read_cpu()
+        other = None if cpu is None else max(0.0, cpu[0] - cpu[1])
+        with self._lock:
+            self.readings = {"cpu": other, "memory": self._read_memory(), "slowdown": self._slowdown()}
+            target = max(
+                level_for(self.readings["cpu"], CPU_THRESHOLDS),
+                level_for(self.readings["memory"], MEMORY_THRESHOLDS),
+                level_for(self.readings["slowdown"], SLOWDOWN_THRESHOLDS),
+            )
+            now = self._clock()
+            if target > self.level:
+                self._low_since = None
+                self._pressure_samples += 1
+                if self._pressure_samples >= ESCALATE_SAMPLES:
+                    self._set_level(target)
+            elif target < self.level:
+                self._pressure_samples = 0
+                if self._low_since is None:
+                    self._low_since = now
+                elif now - self._low_since >= self.relax_seconds:
+                    self._set_level(self.level - 1)
+                    self._low_since = now
+            else:
+                self._pressure_samples = 0
+                self._low_since = None
+            level = self.level
+        elapsed = time.perf_counter_ns() - start
+        self.stats["samples"] += 1
+        self.stats["sample_ns"] += elapsed
+        tracing.record("governor.sample", elapsed, start)
+        return level
+
+    def observe(self, timings: Dict[str, float]):
+        """
+        Feed a finished command's stage timings (ms) into the slowdown reading.
+
+        Vision runs on smaller frames while degraded, so its latency only
+        counts at level 0.
+        """
+        now = self._clock()
+        with self._lock:
+            for stage in LATENCY_STAGES:
+                ms = timings.get(stage)
+                if not ms or (stage == "vision" and self.level > 0):
+                    continue
+                baseline = self._baselines[stage]
+                if len(baseline) < BASELINE_COMMANDS:
+                    baseline.append(ms)
+                else:
+                    self._slowdowns.append((now, stage, ms / statistics.median(baseline)))
+
+    def _slowdown(self) -> Optional[float]:
+        """Worst per-stage median slowdown within the latency window."""
+        now = self._clock()
+        while self._slowdowns and now - self._slowdowns[0][0] > LATENCY_WINDOW_SECONDS:
+            self._slowdowns.popleft()
+        per_stage = {}
+        for _, stage, ratio in self._slowdowns:
+            per_stage.setdefault(stage, []).append(ratio)
+        return max((statistics.median(r) for r in per_stage.values()), default=None)
+
+    # --- Applying a level --------------------------------------------------
+
+    def _set_level(self, level: int):
+        previous, self.level = self.level, level
+        self._pressure_samples = 0
+        self.stats["changes"] += 1
+        self.history.append((self._clock(), level, dict(self.readings)))
+        print(f"  Load: {LEVELS[previous]} → {LEVELS[level]} ({self.describe_readings()})")
+        self._apply()
+
+    def _apply(self):
+        """Push the current policy into the agent's components."""
+        agent, policy = self.agent, self.policy
+        if agent is None:
+            return
+        if hasattr(agent.vision, "apply_settings"):
+            sides = [s for s in (self._tuned_side, policy["max_side"]) if s]
+            agent.vision.apply_settings({"max_side": min(sides) if sides else None})
+        if hasattr(agent.screen, "archive_every"):
+            agent.screen.archive_every = policy["archive_every"]
+        if getattr(agent, "prefetcher", None) is not None:
+            agent.prefetcher.top_k = policy["prefetch_top_k"]
+            if not policy["prefetch_top_k"]:
+                agent.prefetcher.cancel()
+
+    # --- Questions the agent asks per command ------------------------------
+
+    def fast_path(self, commands: List[str], processor) -> Optional[List[Dict]]:
+        """
+        Key-press steps for these commands, if degraded and all have shortcuts.
+
+        Args:
+            commands: Parsed intents
+            processor: CommandProcessor (for get_shortcut())
+
+        Returns:
+            Steps for CursorController.execute_actions(), or None (plan
+            with vision)
+        """
+        if not self.policy["transport_keys"]:
+            return None
+        keys = [processor.get_shortcut(c) for c in commands]
+        if not all(keys):
+            return None
+        self.stats["fast_path"] += 1
+        return [{"action": "key", "key": key, "description": command}
+                for key, command in zip(keys, commands)]
+
+    def refuses(self, commands: List[str], processor) -> bool:
+        """True at transport_only for commands that would need vision."""
+        if self.policy["vision"] or all(processor.get_shortcut(c) for c in commands):
+            return False
+        self.stats["shed"] += 1
+        return True
+
+    def describe_readings(self) -> str:
+        r = self.readings
+        parts = [
+            f"cpu {r['cpu']:.0%}" if r["cpu"] is not None else "cpu ?",
+            f"memory {r['memory']:.0%}" if r["memory"] is not None else "memory ?",
+        ]
+        if r["slowdown"] is not None:
+            parts.append(f"stages {r['slowdown']:.1f}× baseline")
+        return ", ".join(parts)
+
+    def summary(self) -> str:
+        """One line: current level, readings and counters."""
+        s = self.stats
+        per_sample = s["sample_ns"] / s["samples"] / 1000 if s["samples"] else 0.0
+        return (f"load {self.level_name} ({self.describe_readings()}); {s['changes']} level changes, "
+                f"{s['fast_path']} key-press commands, {s['shed']} shed; "
+                f"{per_sample:.0f} µs per sample")
+
+
+# --- Synthetic load ----------------------------------------------------------
+
+def _burn(duty: float, stop):
+    """Busy-loop for `duty` of every 10 ms until stop is set."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        while time.perf_counter() - start < 0.01 * duty:
+            pass
+        time.sleep(0.01 * (1 - duty))
+
+
+class LoadGenerator:
+    """CPU load from other processes, as a busy Logic Pro session would cause."""
+
+    def __init__(self, processes: Optional[int] = None, duty: float = 1.0):
+        """
+        Args:
+            processes: Busy processes (default: one per core)
+            duty: Share of the time each one spins
+        """
+        self.processes = processes or multiprocessing.cpu_count()
+        self.duty = duty
+        self._stop = multiprocessing.Event()
+        self._workers: List[multiprocessing.Process] = []
+
+    def start(self) -> "LoadGenerator":
+        self._stop.clear()
+        self._workers = [multiprocessing.Process(target=_burn, args=(self.duty, self._stop), daemon=True)
+                         for _ in range(self.processes)]
+        for worker in self._workers:
+            worker.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        for worker in self._workers:
+            worker.join(timeout=2)
+        self._workers = []
+
+
+# Example usage / test
+def test_governor(sample_seconds: float = 0.25, relax_seconds: float = 2.0):
+    """
+    Drive a replay agent through idle → CPU load → memory pressure → idle.
+
+    CPU load is real (LoadGenerator); memory pressure is simulated by the
+    memory reader so the test doesn't have to fill the machine's RAM.
+    Transport commands must succeed at every level.
+    """
+    import io
+    import contextlib
+    from main import LogicProAgent
+    from plan_templates import PlanTemplateStore
+    from replay import FixtureScreens, ReplayVision, RecordingCursorController, NullTTS
+    from screen_capture import ScreenCapture
+    from telemetry import TelemetryLog
+    from voice_input import VoiceInput
+
+    plans = {c: [{"action": "click", "x": 1200 + 30 * i, "y": 64}]
+             for i, c in enumerate(["play", "stop", "record", "metronome_on", "mute track 2"])}
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent = LogicProAgent(
+            screen=ScreenCapture(grab=FixtureScreens({"size": [2560, 1600]}, ".")),
+            vision=ReplayVision(plans, 20.0),
+            cursor=RecordingCursorController(),
+            templates=PlanTemplateStore(path=None),
+            voice_input=VoiceInput(api_key="replay", stream_mic=False),
+            tts=NullTTS(),
+            telemetry=TelemetryLog(directory=None),
+            prefetch=False,
+            govern=False,
+        )
+    memory = {"simulated": None}
+    governor = LoadGovernor(
+        agent,
+        memory_reader=lambda: memory["simulated"] or memory_used_fraction(),
+        sample_seconds=sample_seconds, relax_seconds=relax_seconds,
+    )
+    agent.governor = governor.start()
+
+    def run(command: str) -> str:
+        clicks, keys = len(agent.cursor.clicks), len(agent.cursor.keys)
+        with contextlib.redirect_stdout(io.StringIO()):
+            ok = agent.execute_command(f"Hey Logic, {command}")
+        how = "key" if len(agent.cursor.keys) > keys else "click" if len(agent.cursor.clicks) > clicks else "-"
+        return f"{command}={'ok' if ok else 'refused'}/{how}"
+
+    def wait_for(condition, timeout: float) -> float:
+        start = time.monotonic()
+        while not condition() and time.monotonic() - start < timeout:
+            time.sleep(sample_seconds / 5)
+        return time.monotonic() - start
+
+    def phase(label: str, condition, timeout: float, commands: tuple):
+        took = wait_for(condition, timeout)
+        print(f"  {label:13} {governor.level_name:14} after {took:4.1f} s; "
+              f"{', '.join(run(c) for c in commands)}")
+
+    print(f"Testing load governor ({multiprocessing.cpu_count()} cores)...")
+    phase("idle", lambda: False, sample_seconds * 3, ("play", "stop", "mute track 2"))
+
+    relax = relax_seconds * len(LEVELS) + 5
+    load = LoadGenerator(duty=0.8).start()
+    try:
+        phase("cpu 80%", lambda: governor.level >= 1, 10.0, ("play", "stop", "mute track 2"))
+    finally:
+        load.stop()
+    load = LoadGenerator(duty=1.0).start()
+    try:
+        phase("cpu 100%", lambda: governor.level == 3, 10.0, ("record", "stop", "mute track 2"))
+    finally:
+        load.stop()
+    memory["simulated"] = 0.93
+    phase("memory 93%", lambda: governor.level == 2, relax, ("play", "stop", "mute track 2"))
+    memory["simulated"] = None
+    phase("idle", lambda: governor.level == 0, relax, ("play", "stop", "mute track 2"))
+
+    governor.stop()
+    print("  Levels: " + " → ".join(LEVELS[level] for _, level, _ in governor.history))
+    print(f"  {governor.summary()}")
+
+
+if __name__ == "__main__":
+    test_governor()
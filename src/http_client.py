@@ -0,0 +1,393 @@
+"""
+Pooled keep-alive HTTP client with request timing.
+
+Every new HTTPS connection pays DNS, TCP and TLS handshakes before the
+first byte of a response — often 100-300 ms to a cloud API. Keeping the
+connection open between requests (HTTP/1.1 keep-alive) pays that once,
+and warm() lets the caller pay it early, while the user is still
+talking, instead of when the answer is needed.
+
+Each request reports where its time went:
+
+    connect_ms  opening a connection (0 when an idle one was reused)
+    ttfb_ms     request start → response headers (includes connect)
+    total_ms    request start → body fully read
+
+LEARNING GOALS:
+- Understand what a connection handshake costs and how keep-alive avoids it
+- Learn why explicit connect/read timeouts matter for external services
+- Practice measuring latency at the right boundaries
+"""
+
+import ssl
+import time
+import socket
+import threading
+import http.client
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+import tracing
+
+
+# Give up on a connection that isn't open after this long
+CONNECT_TIMEOUT = 3.0
+
+# ...or a response that stalls for this long between bytes
+READ_TIMEOUT = 15.0
+
+# Servers drop idle keep-alive connections (often after ~60 s); don't
+# reuse ours past this age
+MAX_IDLE_SECONDS = 50.0
+
+# Idle connections kept per client
+POOL_SIZE = 2
+
+# Errors that mean a reused connection had gone stale before we sent
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    BrokenPipeError,
+    ConnectionAbortedError,
+    ssl.SSLEOFError,
+    ssl.SSLZeroReturnError,
+)
+
+
+class PooledResponse:
+    """A response whose connection goes back to the pool once fully read."""
+
+    def __init__(self, response: http.client.HTTPResponse, timings: Dict[str, float], start_ns: int):
+        self._response = response
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.timings = timings
+        self._start_ns = start_ns
+
+    def iter_bytes(self, chunk_size: int = 8192) -> Iterator[bytes]:
+        """Yield the body as it arrives."""
+        while True:
+            chunk = self._response.read1(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self) -> bytes:
+        """Read the whole body."""
+        return self._response.read()
+
+    def _finish(self):
+        self.timings["total_ms"] = (time.perf_counter_ns() - self._start_ns) / 1e6
+
+
+class PooledHTTPClient:
+    """Keep-alive connections to one host, reused across requests."""
+
+    def __init__(
+        self,
+        base_url: str,
+        pool_size: int = POOL_SIZE,
+        connect_timeout: float = CONNECT_TIMEOUT,
+        read_timeout: float = READ_TIMEOUT,
+        max_idle: float = MAX_IDLE_SECONDS,
+        ssl_context: Optional[ssl.SSLContext] = None
+    ):
+        """
+        Initialize the client (no connection is opened yet).
+
+        Args:
+            base_url: Scheme, host, optional port and path prefix
+                      ("https://api.openai.com/v1")
+            pool_size: Idle connections to keep
+            connect_timeout: Seconds allowed for TCP + TLS setup
+            read_timeout: Seconds allowed between response bytes
+            max_idle: Don't reuse a connection idle for longer than this
+            ssl_context: For https (default: system trust store)
+        """
+        parts = urlsplit(base_url)
+        if parts.scheme not in ("http", "https"):
+            raise ValueError(f"Unsupported URL scheme: {base_url}")
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.base_path = parts.path.rstrip("/")
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_idle = max_idle
+        self.ssl_context = ssl_context or (ssl.create_default_context() if parts.scheme == "https" else None)
+
+        self.stats = {"requests": 0, "connections_opened": 0, "reused": 0, "retries": 0, "warmed": 0}
+        self._idle: List[tuple] = []  # (connection, last used monotonic), most recent last
+        self._lock = threading.Lock()
+
+    def warm(self) -> bool:
+        """
+        Make sure an open connection is waiting in the pool.
+
+        Returns:
+            True if a new connection was opened, False if one was ready
+        """
+        with self._lock:
+            self._drop_expired()
+            if self._idle:
+                return False
+        connection, _ = self._connect()
+        self.stats["warmed"] += 1
+        self._release(connection)
+        return True
+
+    def warm_async(self):
+        """warm() on a background thread; failures are only logged."""
+        def run():
+            try:
+                self.warm()
+            except OSError as e:
+                print(f"  Connection pre-warm failed: {e}")
+        threading.Thread(target=run, name="http-warm", daemon=True).start()
+
+    @contextmanager
+    def request(
+        self,
+        method: str,
+        path: str,
+        body: Optional[bytes] = None,
+        headers: Optional[Dict[str, str]] = None
+    ):
+        """
+        Send a request on a pooled connection.
+
+        A reused connection that turns out to be closed by the server is
+        replaced and the request sent again, once — nothing reached the
+        server, so even a POST is safe to repeat.
+
+        Args:
+            method: HTTP method
+            path: Path below base_url ("/audio/speech")
+            body: Request body
+            headers: Extra request headers
+
+        Yields:
+            PooledResponse; read it fully inside the block so the
+            connection can be reused
+        """
+        self.stats["requests"] += 1
+        start_ns = time.perf_counter_ns()
+        url = self.base_path + path
+        headers = dict(headers or {})
+
+        for attempt in range(2):
+            connection, connect_ms = self._acquire()
+            reused = connect_ms == 0.0
+            try:
+                connection.request(method, url, body=body, headers=headers)
+                response = connection.getresponse()
+                break
+            except STALE_CONNECTION_ERRORS:
+                connection.close()
+                if not reused or attempt:
+                    raise
+                self.stats["retries"] += 1
+            except BaseException:
+                connection.close()
+                raise
+
+        timings = {
+            "connect_ms": connect_ms,
+            "ttfb_ms": (time.perf_counter_ns() - start_ns) / 1e6,
+            "reused": reused,
+        }
+        tracing.record("http.ttfb", int(timings["ttfb_ms"] * 1e6), start_ns)
+        pooled = PooledResponse(response, timings, start_ns)
+        try:
+            yield pooled
+        except BaseException:
+            connection.close()
+            raise
+        pooled._finish()
+        if not response.isclosed():
+            response.read()  # drain what the caller left so the connection stays usable
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(connection)
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            connection.close()
+
+    def _acquire(self) -> tuple:
+        """An idle connection (connect_ms 0.0) or a new one."""
+        with self._lock:
+            self._drop_expired()
+            if self._idle:
+                connection, _ = self._idle.pop()
+                self.stats["reused"] += 1
+                return connection, 0.0
+        return self._connect()
+
+    def _connect(self) -> tuple:
+        """Open a connection, timing TCP + TLS setup."""
+        if self.scheme == "https":
+            connection = http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.connect_timeout, context=self.ssl_context
+            )
+        else:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.connect_timeout)
+        start_ns = time.perf_counter_ns()
+        connection.connect()
+        elapsed = time.perf_counter_ns() - start_ns
+        connection.sock.settimeout(self.read_timeout)
+        connection.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.stats["connections_opened"] += 1
+        tracing.record("http.connect", elapsed, start_ns)
+        # Never report exactly 0.0 for a fresh connection: that means "reused"
+        return connection, max(elapsed / 1e6, 1e-6)
+
+    def _release(self, connection: http.client.HTTPConnection):
+        """Put a connection back, closing it if the pool is full."""
+        with self._lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+    def _drop_expired(self):
+        """Close idle connections past max_idle (caller holds the lock)."""
+        cutoff = time.monotonic() - self.max_idle
+        while self._idle and self._idle[0][1] < cutoff:
+            self._idle.pop(0)[0].close()
+
+
+# --- Local stand-in server for testing ------------------------------------
+
+def _self_signed_context(directory: str) -> Optional[tuple]:
+    """Create a localhost certificate with the openssl CLI, if available."""
+    import os
+    import shutil
+    import subprocess
+    if shutil.which("openssl") is None:
+        return None
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    result = subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-keyout", key, "-out", cert, "-subj", "/CN=localhost",
+         "-addext", "subjectAltName=DNS:localhost"],
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        return None
+    server = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server.load_cert_chain(cert, key)
+    client = ssl.create_default_context(cafile=cert)
+    return server, client
+
+
+class StandInServer:
+    """
+    Local HTTP(S) server that answers any POST with a streamed body.
+
+    handshake_delay is added before each new connection is set up (before
+    the TLS handshake when serving HTTPS), standing in for the round trips
+    to a distant server. idle_timeout closes quiet keep-alive connections,
+    like real servers do.
+    """
+
+    def __init__(self, handshake_delay: float = 0.15, idle_timeout: float = 5.0,
+                 chunks: int = 8, chunk_delay: float = 0.005, ssl_context=None):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            timeout = idle_timeout
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                chunk = b"\xff\xf3" * 512
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/mpeg")
+                self.send_header("Content-Length", str(len(chunk) * chunks))
+                self.end_headers()
+                for _ in range(chunks):
+                    self.wfile.write(chunk)
+                    self.wfile.flush()
+                    time.sleep(chunk_delay)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def finish_request(self, request, client_address):
+                request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                time.sleep(handshake_delay)
+                if ssl_context is not None:
+                    try:
+                        request = ssl_context.wrap_socket(request, server_side=True)
+                    except (ssl.SSLError, OSError):
+                        return
+                super().finish_request(request, client_address)
+
+        self.server = Server(("localhost", 0), Handler)
+        scheme = "https" if ssl_context is not None else "http"
+        self.url = f"{scheme}://localhost:{self.server.server_address[1]}/v1"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Example usage / test
+def test_http_client(handshake_delay: float = 0.15):
+    """
+    Cold vs. reused vs. pre-warmed requests against a local stand-in.
+
+    Uses HTTPS with a throwaway certificate when the openssl CLI is
+    available (plain HTTP otherwise, where the delay shows up in TTFB
+    instead of connect). Also checks that a connection the server closed
+    while idle is replaced transparently.
+    """
+    import tempfile
+
+    print("Testing pooled HTTP client...")
+    with tempfile.TemporaryDirectory() as tmp:
+        contexts = _self_signed_context(tmp)
+        server_ctx, client_ctx = contexts if contexts else (None, None)
+        server = StandInServer(handshake_delay=handshake_delay, idle_timeout=0.5, ssl_context=server_ctx)
+        print(f"  Stand-in: {server.url} (handshake delay {handshake_delay * 1000:.0f} ms)")
+
+        def post(client, label):
+            with client.request("POST", "/audio/speech", body=b"{}",
+                                headers={"Content-Type": "application/json"}) as response:
+                size = sum(len(c) for c in response.iter_bytes())
+            t = response.timings
+            print(f"  {label:20} connect {t['connect_ms']:6.1f} ms  ttfb {t['ttfb_ms']:6.1f} ms  "
+                  f"total {t['total_ms']:6.1f} ms  ({size} bytes, reused={t['reused']})")
+
+        try:
+            client = PooledHTTPClient(server.url, ssl_context=client_ctx)
+            post(client, "cold")
+            post(client, "keep-alive")
+            client.close()
+
+            client.warm()
+            post(client, "pre-warmed")
+
+            time.sleep(0.8)  # stand-in drops the idle connection
+            post(client, "after server idle")
+            print(f"  Stats: {client.stats}")
+            client.close()
+        finally:
+            server.close()
+
+
+if __name__ == "__main__":
+    test_http_client()
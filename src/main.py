@@ -10,44 +10,129 @@ LEARNING GOALS:
 
 import os
 import sys
+import time
+import asyncio
 import argparse
-from datetime import datetime
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
 
 # Import our modules
 from screen_capture import ScreenCapture
+from screenshot_archive import ScreenshotArchive, PURPOSE_ENCODINGS
 from vision import VisionAnalyzer
 from cursor_control import CursorController
 from commands import CommandProcessor
+from plan_templates import PlanTemplateStore
 from voice_input import VoiceInput
+from wake_word import WakeWordSpotter
 from text_to_speech import TextToSpeech
+from daemon import AgentDaemon, DaemonClient, DEFAULT_SOCKET_PATH
+from runtime import AgentRuntime
+from telemetry import TelemetryLog
+from prefetch import Prefetcher
+from governor import LoadGovernor
+import tracing
+
+
+# Where --profile writes the Chrome trace when no path is given
+DEFAULT_PROFILE_PATH = "data/profile_trace.json"
+
+
+class CommandCancelled(Exception):
+    """Raised between agent stages when the caller cancelled the command."""
 
 
 class LogicProAgent:
     """Main agent class that orchestrates all components."""
 
-    def __init__(self):
+    def __init__(self, isolate_vision: bool = False,
+                 vision_idle_timeout: Optional[float] = None,
+                 prefetch: bool = True,
+                 govern: bool = True,
+                 **components):
         """
         Initialize the Logic Pro agent.
 
-        TODO: Implement this
-        Hints:
-        - Create instances of all components:
-          - ScreenCapture
-          - VisionAnalyzer (no API key needed — runs locally!)
-          - CursorController
-          - CommandProcessor
-          - VoiceInput (loads local Whisper model)
-          - TextToSpeech (OpenAI TTS)
-        - Store them as instance variables
-        - Print status messages as each component loads
+        Creates every component once and keeps it for the agent's lifetime,
+        so a long-lived agent (voice mode or the daemon) only pays model
+        loading on startup.
 
         Note: VisionAnalyzer and VoiceInput will download models on first run.
+
+        Args:
+            isolate_vision: Run vision inference in a worker process so it
+                            can't starve the mic and TTS threads
+            vision_idle_timeout: Unload the vision model after this many
+                                 idle seconds; the wake word reloads it
+            prefetch: Plan the likely next command while idle (see
+                      prefetch.py)
+            govern: Degrade under system load so Logic Pro keeps its CPU
+                    (see governor.py)
+            **components: Ready-made stand-ins by attribute name (screen,
+                          vision, cursor, processor, templates,
+                          voice_input, tts, telemetry, prefetcher,
+                          governor),
+                          used instead of the real ones — see replay.py
         """
         print("Initializing Logic Pro Agent...")
-        # TODO: Your code here
-        pass
+        self.screen = components.get("screen") or ScreenCapture()
+        print("  Screen capture ready")
+        self.vision = components.get("vision") or VisionAnalyzer(
+            isolated=isolate_vision, idle_timeout=vision_idle_timeout
+        )
+        print("  Vision model ready")
+        self.cursor = components.get("cursor") or CursorController()
+        print("  Cursor control ready")
+        self.processor = components.get("processor") or CommandProcessor()
+        print("  Command processor ready")
+        self.templates = components.get("templates") or PlanTemplateStore()
+        self.voice_input = components.get("voice_input") or VoiceInput()
+        self.voice_input.on_wake_word = self._on_wake_word
+        self.tts = components.get("tts") or TextToSpeech()
+        self.telemetry = components.get("telemetry") or TelemetryLog()
+        self.prefetcher = components.get("prefetcher") or (Prefetcher(self) if prefetch else None)
+        self.governor = components.get("governor") or (LoadGovernor(self).start() if govern else None)
+
+        # Per-stage wall time (ms) of the most recent execute_command() call
+        self.last_timings: Dict[str, float] = {}
+        self._cancel_event: Optional[threading.Event] = None
 
-    def execute_command(self, user_command: str) -> bool:
+    def _on_wake_word(self):
+        """
+        Start slow preparation while the command is still being spoken:
+        reload an evicted vision model, open the TTS connection. Prefetch
+        work stops so it doesn't hold the model when the command arrives.
+        """
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+        self.vision.warm_up()
+        self.tts.warm_up()
+
+    @contextmanager
+    def _stage(self, name: str):
+        """
+        Time one stage of the agent loop into self.last_timings (and the
+        tracer, as "agent.<name>", when profiling).
+
+        Cancellation is checked before the stage starts, so a cancelled
+        command stops at the next stage boundary instead of clicking.
+        """
+        if self._cancel_event is not None and self._cancel_event.is_set():
+            raise CommandCancelled(name)
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            self.last_timings[name] = elapsed / 1e6
+            tracing.record(f"agent.{name}", elapsed, start)
+
+    def execute_command(
+        self,
+        user_command: str,
+        cancel_event: Optional[threading.Event] = None
+    ) -> bool:
         """
         Execute a single voice command.
 
@@ -57,115 +142,415 @@ class LogicProAgent:
         3. ACT - Execute the actions (cursor control)
         4. SPEAK - Confirm what was done (TTS)
 
-        TODO: Implement this
-        Steps:
-        1. Parse command with CommandProcessor
-        2. If invalid, speak "I don't understand" and return False
-        3. Speak confirmation ("Sure Lucas, doing that...")
-        4. Capture screenshot with ScreenCapture
-        5. Analyze with VisionAnalyzer
-        6. Execute actions with CursorController
-        7. Speak success confirmation
-        8. Return True
-
-        Handle errors gracefully:
-        - What if screenshot fails?
-        - What if vision model returns bad coordinates?
-        - What if coordinates are off-screen?
+        Stage timings land in self.last_timings (parse, capture, vision,
+        act, speak, total) so callers such as the daemon can report them,
+        and every command is appended to the telemetry log.
+
+        A compound utterance ("turn on the metronome and hit record") is
+        planned in one vision inference over one screenshot and its steps
+        run in dependency order. A plan prefetched while idle is used
+        instead of planning if the screen hasn't changed. Under load the
+        governor turns transport commands into key presses and refuses
+        the rest at its last level.
 
         Args:
             user_command: Natural language command
+            cancel_event: Optional event; when set, the command stops at
+                          the next stage boundary
 
         Returns:
             True if successful
         """
         print(f"\nCommand: {user_command}")
+        self.last_timings = {}
+        self._cancel_event = cancel_event
+        start = time.perf_counter()
+        if self.prefetcher is not None:
+            self.prefetcher.cancel()
+        commands: List[str] = []
+        plan: Dict = {}
+        outcome = "error"
+
+        try:
+            with self._stage("parse"):
+                commands = [
+                    c for c in self.processor.parse_intents(user_command)
+                    if self.processor.is_valid_command(c)
+                ]
+
+            if not commands:
+                print("  Unknown command")
+                outcome = "unknown_command"
+                with self._stage("speak"):
+                    self.tts.speak("Sorry, I don't understand that command.")
+                return False
 
-        # TODO: Implement the agent loop here
+            if self.governor is not None and self.governor.refuses(commands, self.processor):
+                print(f"  Refused: load is {self.governor.level_name}")
+                outcome = "shed"
+                with self._stage("speak"):
+                    self.tts.speak("Logic needs the CPU right now. Only play, stop and record work.")
+                return False
+            steps = self.governor.fast_path(commands, self.processor) if self.governor else None
 
-        pass
+            with self._stage("speak_ack"):
+                self.tts.speak(self.ack_text(commands))
+
+            if steps is None:
+                with self._stage("capture"):
+                    image = self.screen.capture_screen()
+
+                with self._stage("vision"):
+                    plan = self.prefetcher.take(commands, image) if self.prefetcher else None
+                    if plan is None:
+                        plan = self.plan(image, commands, cancel_event)
+                    else:
+                        print("  Using prefetched plan")
+
+                steps = self.valid_steps(plan, image.size)
+                if not steps:
+                    print("  Vision model found nothing to click")
+                    outcome = "not_found"
+                    with self._stage("speak"):
+                        self.tts.speak("Sorry, I couldn't find that on screen.")
+                    return False
+
+            with self._stage("act"):
+                success = self.cursor.execute_actions(steps)
+            outcome = "ok" if success else "action_failed"
+
+            with self._stage("speak"):
+                if success:
+                    self.tts.speak("Done.")
+                else:
+                    self.tts.speak("Something went wrong clicking that.")
+            return bool(success)
+
+        except CommandCancelled as e:
+            print(f"  Cancelled before {e}")
+            outcome = "cancelled"
+            return False
+        except Exception as e:
+            print(f"  Error: {e}")
+            outcome = "error"
+            return False
+        finally:
+            self.last_timings["total"] = (time.perf_counter() - start) * 1000
+            self._cancel_event = None
+            self._record_telemetry(commands, plan, outcome)
+            if self.prefetcher is not None and commands:
+                self.prefetcher.after_command(commands)
+            if self.governor is not None:
+                self.governor.observe(self.last_timings)
+
+    def ack_text(self, commands: List[str]) -> str:
+        """The confirmation spoken before acting ("Sure Lucas, playing track.")."""
+        description = " and ".join(
+            self.processor.get_command_description(c).lower() for c in commands
+        )
+        return f"Sure Lucas, {description}."
+
+    def _record_telemetry(self, commands: List[str], plan: Dict, outcome: str):
+        """Append the finished command to the telemetry log."""
+        name, params = self.processor.split_intent(commands[0]) if commands else ("", {})
+        self.telemetry.record_command(
+            intent=name,
+            param=params.get("track", -1),
+            n_intents=len(commands),
+            outcome=outcome,
+            timings_ms=self.last_timings,
+            template_hits=plan.get("template_hits", 0),
+            template_lookups=plan.get("template_lookups", 0),
+            prompt_tokens=(plan.get("stats") or {}).get("prompt_tokens", 0),
+        )
+
+    def plan(
+        self,
+        image,
+        commands: List[str],
+        cancel_event: Optional[threading.Event] = None
+    ) -> Dict:
+        """
+        THINK: steps for one or more commands on the current screen.
+
+        Track commands with a matching plan template are answered without
+        inference; the rest go to the vision model (batched when several),
+        and track commands it resolves become templates for next time.
+
+        Args:
+            image: Current screenshot
+            commands: Intents in execution order
+            cancel_event: Passed through to the vision model
+
+        Returns:
+            Dict with 'steps' for all commands, in order, and
+            'template_hits' / 'template_lookups' counts
+        """
+        from_templates = {}
+        lookups = 0
+        for command in commands:
+            name, params = self.processor.split_intent(command)
+            if params:
+                lookups += 1
+                steps = self.templates.lookup(name, params, image)
+                if steps is not None:
+                    from_templates[command] = steps
+                    print(f"  Plan template hit: {command} "
+                          f"(hit rate {self.templates.hit_rate():.0%})")
+
+        remaining = [c for c in commands if c not in from_templates]
+        if not remaining:
+            return {"steps": [s for c in commands for s in from_templates[c]],
+                    "reasoning": "plan templates",
+                    "template_hits": len(from_templates), "template_lookups": lookups}
+
+        prompts = [self.processor.get_vision_command(c) for c in remaining]
+        if len(remaining) == 1:
+            plan = self.vision.analyze_image(image, prompts[0], cancel_event=cancel_event)
+            found = {remaining[0]: plan["steps"]}
+        else:
+            plan = self.vision.analyze_commands(image, prompts, cancel_event=cancel_event)
+            self._report_batch(plan)
+            per_intent = plan.get("per_intent", {})
+            found = {c: per_intent.get(p, []) for c, p in zip(remaining, prompts)}
+
+        for command, steps in found.items():
+            name, params = self.processor.split_intent(command)
+            steps = self.valid_steps({"steps": steps}, image.size)
+            if params and steps:
+                self.templates.learn(name, params, steps, image)
+
+        if from_templates:
+            # Keep execution order across template and model answers
+            merged = {**found, **from_templates}
+            plan["steps"] = [s for c in commands for s in merged.get(c, [])]
+        plan["template_hits"] = len(from_templates)
+        plan["template_lookups"] = lookups
+        return plan
+
+    @staticmethod
+    def _report_batch(plan: dict):
+        """Print what a batched multi-intent inference found and saved."""
+        if plan.get("missing"):
+            print(f"  No steps found for: {', '.join(plan['missing'])}")
+        stats = plan.get("stats") or {}
+        if stats.get("batched_intents"):
+            print(f"  Batched {stats['batched_intents']} intents in one inference "
+                  f"(~{stats['prefill_tokens_saved']} prefill tokens, "
+                  f"~{stats['prefill_ns_saved'] / 1e6:.0f} ms saved)")
+
+    def valid_steps(self, plan: Optional[Dict], screen_size: tuple) -> list:
+        """
+        Keep only steps whose coordinates are on screen.
+
+        Args:
+            plan: Dict from VisionAnalyzer with a 'steps' list
+            screen_size: (width, height) of the analyzed screenshot
+
+        Returns:
+            List of usable action dicts
+        """
+        if not plan:
+            return []
+        width, height = screen_size
+        valid = []
+        for step in plan.get("steps", []):
+            x, y = step.get("x"), step.get("y")
+            if not isinstance(x, (int, float)) or not isinstance(y, (int, float)):
+                print(f"  Skipping step without coordinates: {step}")
+                continue
+            if not (0 <= x < width and 0 <= y < height):
+                print(f"  Skipping off-screen step at ({x}, {y})")
+                continue
+            valid.append(step)
+        return valid
 
     def voice_loop(self):
         """
         Continuously listen for voice commands.
 
-        TODO: Implement this
-        Hints:
-        - Loop forever (while True)
-        - Call self.voice_input.listen_for_command()
-        - If command detected, call self.execute_command()
-        - If no command (None), keep listening
-        - Handle KeyboardInterrupt (Ctrl+C) to exit gracefully
-        - Print "Listening..." so user knows agent is ready
-
-        Example:
-            print("Voice mode active. Say 'Hey Logic' + command.")
-            print("Press Ctrl+C to stop.\n")
-            while True:
-                try:
-                    command = self.voice_input.listen_for_command()
-                    if command:
-                        self.execute_command(command)
-                except KeyboardInterrupt:
-                    print("\nStopping voice mode.")
-                    break
-        """
-        # TODO: Your implementation here
-        pass
-
-    def test_mode(self, command: str):
+        Press Ctrl+C to exit.
         """
-        Run in test mode with a single command.
+        print("Voice mode active. Say 'Hey Logic' + command.")
+        print("Press Ctrl+C to stop.\n")
+        while True:
+            try:
+                print("Listening...")
+                command = self.voice_input.listen_for_command()
+                if command:
+                    self.execute_command(command)
+            except KeyboardInterrupt:
+                self.voice_input.stop()
+                print("\nStopping voice mode.")
+                break
 
-        TODO: Implement this
-        - Just call execute_command()
-        - Print results
+    def test_mode(self, command: str) -> bool:
+        """
+        Run in test mode with a single command.
 
         Args:
             command: Command to test
+
+        Returns:
+            True if successful
         """
-        pass
+        success = self.execute_command(command)
+        print(f"\nResult: {'success' if success else 'failed'}")
+        print_timings(self.last_timings)
+        return success
+
+
+def print_timings(timings: Dict[str, float]):
+    """Print per-stage timings in milliseconds."""
+    if not timings:
+        return
+    print("Timings:")
+    for stage, ms in timings.items():
+        print(f"  {stage:10} {ms:8.1f} ms")
+
+
+def run_command(args) -> int:
+    """
+    Run a single --command, through the daemon when one is running.
+
+    Falls back to an in-process agent (paying model load) when no daemon
+    answers on the socket or --no-daemon is given.
+
+    Returns:
+        Process exit code
+    """
+    if not args.no_daemon:
+        client = DaemonClient(args.socket)
+        if client.is_running():
+            print(f"Sending to daemon at {client.socket_path}")
+            try:
+                reply = client.execute(args.command)
+            except KeyboardInterrupt:
+                client.cancel()
+                print("\nCancelled.")
+                return 130
+            if reply.get("error"):
+                print(f"Daemon error: {reply['error']}")
+            print(f"\nResult: {'success' if reply.get('ok') else 'failed'}")
+            print_timings(reply.get("timings", {}))
+            return 0 if reply.get("ok") else 1
+
+    return 0 if build_agent(args).test_mode(args.command) else 1
+
+
+def build_agent(args) -> LogicProAgent:
+    """Create the agent with the options from the command line."""
+    components = {}
+    if args.vision_server:
+        components["vision"] = VisionAnalyzer(server_url=args.vision_server)
+    if args.archive:
+        archive = ScreenshotArchive(purpose=args.archive, dirty_regions=args.archive_dirty_regions)
+        components["screen"] = ScreenCapture(archive=archive)
+        print(f"  Archiving screenshots ({args.archive}) to {archive.directory}")
+    spotter = None
+    if args.local_wake_word:
+        spotter = WakeWordSpotter.load()
+        print(f"  Local wake word: {len(spotter.templates)} enrolled samples")
+    components["voice_input"] = VoiceInput(input_channel=args.input_channel, spotter=spotter)
+    return LogicProAgent(args.isolate_vision, args.vision_idle_timeout,
+                         prefetch=not args.no_prefetch, govern=not args.no_governor, **components)
+
+
+def write_profile(path: str):
+    """Print the latency summary and write the Chrome trace to path."""
+    tracer = tracing.get_tracer()
+    print("\nLatency profile (ms):")
+    print(tracer.summary())
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tracer.write_chrome_trace(path)
+    print(f"\nChrome trace written to {path} (open in chrome://tracing or ui.perfetto.dev)")
 
 
 def main():
     """
     Main function - entry point of the program.
 
-    TODO: Implement this
-    Steps:
-    1. Parse command line arguments
-    2. Create LogicProAgent (no API key needed for vision!)
-    3. Execute based on mode:
-       --command "play"  → test mode (single command)
+    Modes:
+       --command "play"  → single command (via the daemon if one is running)
        --voice           → voice mode (continuous listening)
+       --voice --async   → voice mode on the asyncio runtime (runtime.py)
+       --daemon          → keep models loaded and serve commands on a socket
 
     Environment variables to set:
     - OPENAI_API_KEY  → for STT and TTS
     """
+    parser = argparse.ArgumentParser(description="Logic Pro Voice Agent")
+    parser.add_argument("--command", help="Test a single command")
+    parser.add_argument("--voice", action="store_true", help="Start voice mode")
+    parser.add_argument("--async", dest="async_runtime", action="store_true",
+                        help="Voice mode on the asyncio runtime: keeps listening while "
+                             "commands run, prioritizes transport, drops superseded commands")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Keep the agent loaded and serve commands on a Unix socket")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="Never use a running daemon for --command")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH,
+                        help=f"Daemon socket path (default: {DEFAULT_SOCKET_PATH})")
+    parser.add_argument("--isolate-vision", action="store_true",
+                        help="Run vision inference in a separate worker process")
+    parser.add_argument("--vision-idle-timeout", type=float, metavar="SECONDS",
+                        help="Unload the vision model after this long without commands")
+    parser.add_argument("--vision-server", metavar="URL",
+                        help="Use a shared vision server (python src/vision_server.py) "
+                             "instead of loading the model locally")
+    parser.add_argument("--no-prefetch", action="store_true",
+                        help="Don't plan likely next commands while idle")
+    parser.add_argument("--no-governor", action="store_true",
+                        help="Don't degrade (smaller frames, no prefetch, key-press transport) "
+                             "when the machine is busy")
+    parser.add_argument("--input-channel", type=int, default=0, metavar="N",
+                        help="Interface input the microphone is on, counting from 0 (default: 0)")
+    parser.add_argument("--local-wake-word", action="store_true",
+                        help="Spot the wake word on this machine and only stream audio after it "
+                             "(enroll first: python src/wake_word.py --enroll 4)")
+    parser.add_argument("--archive", nargs="?", const="debug", choices=sorted(PURPOSE_ENCODINGS),
+                        metavar="PURPOSE",
+                        help="Save every screenshot in the background: fixture (lossless), "
+                             "debug (WebP, default) or share (JPEG)")
+    parser.add_argument("--archive-dirty-regions", action="store_true",
+                        help="Archive only what changed since the previous screenshot")
+    parser.add_argument("--profile", nargs="?", const=DEFAULT_PROFILE_PATH, metavar="TRACE_JSON",
+                        help="Record stage latencies; print a summary and write a "
+                             f"Chrome trace on exit (default: {DEFAULT_PROFILE_PATH})")
+    args = parser.parse_args()
+
+    if not (args.command or args.daemon or args.voice):
+        print("Logic Pro Voice Agent")
+        print("=" * 50)
+        print("\nUsage:")
+        print("  python src/main.py --command 'play'")
+        print("  python src/main.py --voice")
+        print("  python src/main.py --daemon")
+        print("\nStack (all free, all local):")
+        print("  Vision:  Qwen2.5-VL-7B via mlx-vlm")
+        print("  STT:     OpenAI Realtime (gpt-4o-mini-transcribe)")
+        print("  TTS:     OpenAI gpt-4o-mini-tts")
+        return
 
-    # TODO: Set up argument parser
-    # parser = argparse.ArgumentParser(description="Logic Pro Voice Agent")
-    # parser.add_argument("--command", help="Test a single command")
-    # parser.add_argument("--voice", action="store_true", help="Start voice mode")
-    # args = parser.parse_args()
-
-    # TODO: Create agent and run
-    # agent = LogicProAgent()
-    # if args.command:
-    #     agent.test_mode(args.command)
-    # elif args.voice:
-    #     agent.voice_loop()
-
-    print("Logic Pro Voice Agent")
-    print("=" * 50)
-    print("\nTODO: Implement main() function")
-    print("\nUsage (once implemented):")
-    print("  python src/main.py --command 'play'")
-    print("  python src/main.py --voice")
-    print("\nStack (all free, all local):")
-    print("  Vision:  Qwen2.5-VL-7B via mlx-vlm")
-    print("  STT:     faster-whisper (base.en)")
-    print("  TTS:     OpenAI gpt-4o-mini-tts")
+    if args.profile:
+        tracing.enable()
+    try:
+        if args.command:
+            sys.exit(run_command(args))
+        elif args.daemon:
+            AgentDaemon(build_agent(args), args.socket).serve_forever()
+        elif args.async_runtime:
+            try:
+                asyncio.run(AgentRuntime(build_agent(args)).run())
+            except KeyboardInterrupt:
+                print("\nStopping voice mode.")
+        else:
+            build_agent(args).voice_loop()
+    finally:
+        if args.profile:
+            write_profile(args.profile)
 
 
 if __name__ == "__main__":
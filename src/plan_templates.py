@@ -0,0 +1,443 @@
+"""
+Plan templates: resolve numbered-track commands without a vision call.
+
+The first "mute track 2" goes to the vision model. Its click lands in
+track 2's row, and measuring the row pitch on the same screenshot turns
+that into a template: "the mute button is at x, y1 + (track - 1) * pitch".
+"mute track 5" is then arithmetic instead of another inference. The
+template also records which tracks had a row on that screenshot, so
+"mute track 12" in an 8-track session goes to the model instead of
+clicking empty space.
+
+Templates persist in a JSON file, one per command, tagged with a layout
+fingerprint of the screen they were learned on. When the fingerprint no
+longer matches (window moved, tracks zoomed or scrolled) the template is
+dropped and the next request relearns it from the vision model.
+
+LEARNING GOALS:
+- Learn to generalize one expensive answer into many cheap ones
+- Understand autocorrelation for finding a repeating pattern's period
+- Practice cache invalidation with perceptual fingerprints
+"""
+
+import os
+import re
+import json
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+import tracing
+from commands import TRACK_COMMANDS
+
+
+TEMPLATES_PATH = "data/plan_templates.json"
+TEMPLATES_VERSION = 2
+
+# Plausible track row heights in screenshot pixels (Retina doubles them)
+MIN_ROW_PITCH = 16
+MAX_ROW_PITCH = 240
+
+# Pixels either side of the click averaged into the row profile
+PITCH_STRIP_HALF_WIDTH = 24
+
+# Normalized autocorrelation a pitch needs before it's trusted
+MIN_PITCH_CONFIDENCE = 0.3
+
+# Correlation a row needs with the clicked one to count as a track row
+MIN_ROW_SIMILARITY = 0.5
+
+# Fingerprints differing in more bits than this are a different layout
+LAYOUT_TOLERANCE_BITS = 8
+
+
+def layout_fingerprint(image: Image.Image, box: Optional[tuple] = None, size: tuple = (16, 8)) -> str:
+    """
+    Difference hash of an image (or a region of it).
+
+    Each bit says whether a pixel of the downscaled grayscale image is
+    brighter than its right-hand neighbour, so it survives small content
+    changes (playhead, meters) but not moved or resized panels.
+
+    Args:
+        image: Screenshot
+        box: Optional (left, top, right, bottom) region
+        size: Hash grid (width, height) — width * height bits
+
+    Returns:
+        Hex string
+    """
+    if box is not None:
+        image = image.crop(box)
+    width, height = size
+    # Downscale before converting: far cheaper than converting a full frame
+    small = np.asarray(image.resize((width + 1, height), Image.BOX).convert("L"), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    value = int("".join("1" if b else "0" for b in bits), 2)
+    return f"{value:0{len(bits) // 4}x}"
+
+
+def fingerprint_distance(a: str, b: str) -> int:
+    """Number of differing bits (a length mismatch counts as all of them)."""
+    if len(a) != len(b):
+        return 4 * max(len(a), len(b))
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def measure_row_pitch(image: Image.Image, x: int, y: int) -> Optional[float]:
+    """
+    Measure the track row height around a point in the track list.
+
+    Averages a narrow vertical strip through (x, y) into a profile of
+    horizontal edges and finds its period by autocorrelation: track rows
+    repeat, so the profile correlates with itself shifted by one row.
+    Edges rather than brightness, so alternating row shades don't read
+    as a two-row period.
+
+    Args:
+        image: Screenshot
+        x, y: A point inside a track row (e.g. the vision model's click)
+
+    Returns:
+        Row pitch in pixels (sub-pixel), or None if no clear period
+    """
+    top = max(0, y - 4 * MAX_ROW_PITCH)
+    bottom = min(image.height, y + 4 * MAX_ROW_PITCH)
+    left = max(0, x - PITCH_STRIP_HALF_WIDTH)
+    right = min(image.width, x + PITCH_STRIP_HALF_WIDTH + 1)
+    if bottom - top < 3 * MIN_ROW_PITCH or right <= left:
+        return None
+
+    strip = np.asarray(image.crop((left, top, right, bottom)).convert("L"), dtype=np.float64)
+    profile = np.abs(np.diff(strip.mean(axis=1)))
+    # Blur the edges a little so a fractional pitch (rows alternating 46
+    # and 47 px) still peaks at one lag instead of splitting across two
+    profile = np.convolve(profile, [1, 2, 3, 2, 1], mode="same")
+    profile -= profile.mean()
+
+    max_lag = min(MAX_ROW_PITCH, len(profile) // 2)
+    if max_lag <= MIN_ROW_PITCH:
+        return None
+    scores = np.zeros(max_lag + 2)
+    for lag in range(MIN_ROW_PITCH - 1, max_lag + 2):
+        a, b = profile[:-lag], profile[lag:]
+        denom = np.sqrt(np.dot(a, a) * np.dot(b, b))
+        scores[lag] = np.dot(a, b) / denom if denom else 0.0
+
+    lags = np.arange(MIN_ROW_PITCH, max_lag + 1)
+    peaks = lags[(scores[lags] > scores[lags - 1]) & (scores[lags] >= scores[lags + 1])]
+    if not len(peaks):
+        return None
+    best = scores[peaks].max()
+    if best < MIN_PITCH_CONFIDENCE:
+        return None
+    # The first near-best peak is the row; later ones are multiples of it
+    lag = int(peaks[scores[peaks] >= 0.85 * best][0])
+
+    # Parabolic interpolation: errors multiply with the track number
+    left_s, mid, right_s = scores[lag - 1], scores[lag], scores[lag + 1]
+    curvature = left_s - 2 * mid + right_s
+    offset = 0.5 * (left_s - right_s) / curvature if curvature else 0.0
+    return lag + float(np.clip(offset, -0.5, 0.5))
+
+
+def count_rows(image: Image.Image, x: int, y: int, pitch: float) -> tuple:
+    """
+    Count the track rows above and below the one containing (x, y).
+
+    Walks away from the clicked row one pitch at a time, comparing the
+    brightness profile of a strip through x with the clicked row's, and
+    stops at the first row that doesn't look like it (empty space below
+    the last track, the ruler above the first) or at the image edge.
+
+    Args:
+        image: Screenshot
+        x, y: A point inside a track row (e.g. the vision model's click)
+        pitch: Row pitch from measure_row_pitch()
+
+    Returns:
+        (rows above, rows below)
+    """
+    left = max(0, x - PITCH_STRIP_HALF_WIDTH)
+    right = min(image.width, x + PITCH_STRIP_HALF_WIDTH + 1)
+    strip = np.asarray(image.crop((left, 0, right, image.height)).convert("L"), dtype=np.float64)
+    profile = strip.mean(axis=1)
+    length = int(pitch)
+
+    def window(k: int) -> Optional[np.ndarray]:
+        start = int(round(y - pitch / 2 + k * pitch))
+        if start < 0 or start + length > len(profile):
+            return None
+        return profile[start:start + length] - profile[start:start + length].mean()
+
+    reference = window(0)
+    counts = []
+    for direction in (-1, 1):
+        k = 0
+        while reference is not None:
+            row = window(direction * (k + 1))
+            if row is None:
+                break
+            denom = np.sqrt(np.dot(reference, reference) * np.dot(row, row))
+            if not denom or np.dot(reference, row) / denom < MIN_ROW_SIMILARITY:
+                break
+            k += 1
+        counts.append(k)
+    return counts[0], counts[1]
+
+
+class PlanTemplateStore:
+    """Per-command plan templates for numbered-track commands."""
+
+    def __init__(self, path: Optional[str] = TEMPLATES_PATH):
+        """
+        Initialize the store, loading saved templates.
+
+        Args:
+            path: JSON file to persist templates in (None: memory only)
+        """
+        self.path = path
+        self.templates: Dict[str, Dict] = {}
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "invalidated": 0,
+            "out_of_view": 0,
+            "learned": 0,
+            "unlearnable": 0,
+        }
+        self._lock = threading.Lock()
+        self._load()
+
+    def hit_rate(self) -> float:
+        """Fraction of lookups answered without the vision model."""
+        total = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def lookup(self, command: str, params: Dict[str, int], image: Image.Image) -> Optional[List[Dict]]:
+        """
+        Instantiate a template for the current screen.
+
+        Args:
+            command: Command name ("mute_track")
+            params: Its parameters ({"track": 5})
+            image: Current screenshot
+
+        Returns:
+            Steps for the vision-free path, or None on a miss
+        """
+        with tracing.span("templates.lookup"), self._lock:
+            template = self.templates.get(command)
+            if template is None or "track" not in params:
+                self.stats["misses"] += 1
+                return None
+
+            if not self._matches(template, image):
+                del self.templates[command]
+                self.stats["invalidated"] += 1
+                self.stats["misses"] += 1
+                self._save()
+                return None
+
+            first, last = template["track_range"]
+            track = params["track"]
+            steps = self._instantiate(template, track)
+            if not first <= track <= last or any(not (0 <= s["y"] < image.height) for s in steps if "y" in s):
+                # No row for this track on screen (scrolled out of view, or
+                # past the last track) — let the model deal with it
+                self.stats["out_of_view"] += 1
+                self.stats["misses"] += 1
+                return None
+
+            self.stats["hits"] += 1
+            return steps
+
+    def learn(self, command: str, params: Dict[str, int], steps: List[Dict], image: Image.Image) -> bool:
+        """
+        Generalize a vision-model plan into a template.
+
+        Args:
+            command: Command name ("mute_track")
+            params: The parameters the plan was made for ({"track": 2})
+            steps: Validated steps from the vision model
+            image: The screenshot they were planned on
+
+        Returns:
+            True if a template was stored
+        """
+        spec = TRACK_COMMANDS.get(command)
+        track = params.get("track")
+        if spec is None or not track or not steps:
+            return False
+
+        row_steps = spec["row_steps"] if spec["row_steps"] is not None else len(steps)
+        anchor = next((s for s in steps[:row_steps] if "x" in s and "y" in s), None)
+        pitch = measure_row_pitch(image, int(anchor["x"]), int(anchor["y"])) if anchor else None
+        if pitch is not None:
+            above, below = count_rows(image, int(anchor["x"]), int(anchor["y"]), pitch)
+        with self._lock:
+            if pitch is None:
+                self.stats["unlearnable"] += 1
+                return False
+
+            template_steps = []
+            for i, step in enumerate(steps):
+                step = dict(step)
+                if i < row_steps and "y" in step:
+                    # Stored as if it were track 1's row
+                    step["row_y"] = round(step.pop("y") - (track - 1) * pitch, 2)
+                template_steps.append(step)
+
+            strip = self._strip_box(image, int(anchor["x"]))
+            self.templates[command] = {
+                "track": track,
+                "row_pitch": round(pitch, 3),
+                "track_range": [max(1, track - above), track + below],
+                "steps": template_steps,
+                "size": list(image.size),
+                "layout": layout_fingerprint(image),
+                "strip_box": list(strip),
+                "rows": layout_fingerprint(image, strip, size=(4, 32)),
+            }
+            self.stats["learned"] += 1
+            self._save()
+        print(f"  Learned plan template for {command} (row pitch {pitch:.1f}px, "
+              f"tracks {max(1, track - above)}-{track + below})")
+        return True
+
+    def invalidate(self, command: Optional[str] = None):
+        """Drop one template, or all of them."""
+        with self._lock:
+            if command is None:
+                self.templates.clear()
+            else:
+                self.templates.pop(command, None)
+            self._save()
+
+    @staticmethod
+    def _strip_box(image: Image.Image, x: int) -> tuple:
+        """The column of track rows whose fingerprint pins down scroll and zoom."""
+        left = max(0, x - PITCH_STRIP_HALF_WIDTH)
+        return (left, 0, min(image.width, left + 2 * PITCH_STRIP_HALF_WIDTH + 1), image.height)
+
+    @staticmethod
+    def _matches(template: Dict, image: Image.Image) -> bool:
+        """Is this screen laid out the way the template was learned on?"""
+        if list(image.size) != template["size"]:
+            return False
+        if fingerprint_distance(layout_fingerprint(image), template["layout"]) > LAYOUT_TOLERANCE_BITS:
+            return False
+        rows = layout_fingerprint(image, tuple(template["strip_box"]), size=(4, 32))
+        return fingerprint_distance(rows, template["rows"]) <= LAYOUT_TOLERANCE_BITS
+
+    @staticmethod
+    def _instantiate(template: Dict, track: int) -> List[Dict]:
+        """Steps for `track` from a template."""
+        learned = re.compile(rf"\btrack {template['track']}\b", re.IGNORECASE)
+        steps = []
+        for step in template["steps"]:
+            step = dict(step)
+            if "row_y" in step:
+                step["y"] = int(round(step.pop("row_y") + (track - 1) * template["row_pitch"]))
+            for key in ("element", "description"):
+                if isinstance(step.get(key), str):
+                    step[key] = learned.sub(f"track {track}", step[key])
+            steps.append(step)
+        return steps
+
+    def _load(self):
+        """Read saved templates; a missing, stale or corrupt file means none."""
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == TEMPLATES_VERSION:
+            self.templates = data.get("templates", {})
+
+    def _save(self):
+        """Write templates atomically (caller holds the lock)."""
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"version": TEMPLATES_VERSION, "templates": self.templates}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+# Example usage / test
+def _synthetic_track_list(size=(1280, 800), top=120, pitch=46.5, tracks=14, scroll=0) -> Image.Image:
+    """Draw a Logic-like track list: alternating rows with labels and buttons."""
+    from PIL import ImageDraw
+    image = Image.new("RGB", size, (38, 38, 40))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, size[0], 60), fill=(58, 58, 62))  # control bar
+    for i in range(tracks):
+        y = top + (i - scroll) * pitch
+        shade = 52 if i % 2 else 46
+        draw.rectangle((0, y, 320, y + pitch - 2), fill=(shade, shade, shade + 4))
+        draw.line((0, y + pitch - 1, 320, y + pitch - 1), fill=(20, 20, 20))
+        draw.text((40, y + 8), f"Audio {i + 1}", fill=(200, 200, 200))
+        draw.rectangle((200, y + 10, 216, y + 26), fill=(90, 90, 96))  # mute
+    return image
+
+
+def test_plan_templates():
+    """
+    Learn a template from one "plan" and instantiate it for other tracks.
+
+    Uses a synthetic track list so the exact answer is known, then checks
+    that tracks without a row on screen (off the bottom, or past the last
+    track of a short session) fall back to the model, and that scrolling
+    the list invalidates the template.
+    """
+    print("Testing plan templates...")
+    top, pitch = 120, 46.5
+    image = _synthetic_track_list(top=top, pitch=pitch)
+
+    measured = measure_row_pitch(image, 208, int(top + 1 * pitch + 18))
+    print(f"  Measured row pitch: {measured:.2f}px (true {pitch})")
+    assert abs(measured - pitch) < 0.5, measured
+
+    store = PlanTemplateStore(path=None)
+    planned = [{"action": "click", "x": 208, "y": int(top + 1 * pitch + 18),
+                "element": "mute_button", "description": "Mute track 2"}]
+    store.learn("mute_track", {"track": 2}, planned, image)
+    assert store.templates["mute_track"]["track_range"] == [1, 14], store.templates["mute_track"]
+
+    for track in (1, 5, 12, 14):
+        steps = store.lookup("mute_track", {"track": track}, image)
+        expected = top + (track - 1) * pitch + 18
+        print(f"  track {track:2d}: y={steps[0]['y']} (expect ~{expected:.0f}) "
+              f"{steps[0]['description']!r}")
+        assert abs(steps[0]["y"] - expected) <= 1.5, (track, steps)
+        assert steps[0]["x"] == 208 and steps[0]["description"] == f"Mute track {track}", steps
+
+    for track in (15, 40):
+        steps = store.lookup("mute_track", {"track": track}, image)
+        print(f"  track {track} (no row): {steps}")
+        assert steps is None
+
+    short = _synthetic_track_list(top=top, pitch=pitch, tracks=8)
+    short_store = PlanTemplateStore(path=None)
+    short_store.learn("mute_track", {"track": 2}, planned, short)
+    steps = short_store.lookup("mute_track", {"track": 12}, short)
+    print(f"  track 12 of 8: {steps}")
+    assert steps is None and short_store.stats["out_of_view"] == 1, short_store.stats
+    assert short_store.lookup("mute_track", {"track": 8}, short) is not None
+
+    scrolled = _synthetic_track_list(top=top, pitch=pitch, scroll=3)
+    steps = store.lookup("mute_track", {"track": 5}, scrolled)
+    print(f"  after scrolling: {steps}")
+    assert steps is None and store.stats["invalidated"] == 1
+    print(f"  Stats: {store.stats}, hit rate {store.hit_rate():.0%}")
+    assert store.stats["hits"] == 4 and store.stats["out_of_view"] == 2, store.stats
+
+
+if __name__ == "__main__":
+    test_plan_templates()
@@ -0,0 +1,480 @@
+"""
+Predictive prefetch: plan the likely next command while the room is quiet.
+
+Commands come in predictable sequences — after "record" comes "stop",
+after "play" comes "stop" or "record". A first-order transition model
+over CommandProcessor intents (learned from the telemetry log, then
+updated as commands run) predicts the next intent from the last one,
+which mostly means from the transport state the last command left.
+
+After each command, while nobody is talking, the Prefetcher takes the
+most likely next intents and prepares them:
+
+    capture → plan (plan templates, else vision) → confirmation audio
+
+When the real command arrives, a prefetched plan is used if the screen
+still looks the same (layout fingerprint), so the vision stage costs a
+dictionary lookup. The confirmation is already synthesized, so it plays
+without a TTS round trip.
+
+Prefetching is bounded: at most TOP_K predictions above MIN_PROBABILITY
+per idle period, at most MAX_PLANS cached plans, and prefetch work may
+keep the model busy for at most BUSY_BUDGET of wall time. The wake word
+or a new command cancels it.
+
+Vision prefetch only runs when cancelling actually stops the inference
+(VisionAnalyzer.interruptible): in-process or in the worker, streamed
+generation ends at the next token, so a real command arriving
+mid-prefetch waits for little more than the image prefill. The vision
+server can't stop an inference it has started, and a backend that can't
+either would make the real command wait a whole inference behind a
+guess — for those, prefetch is limited to plan templates and
+confirmation audio.
+
+LEARNING GOALS:
+- Understand Markov models for sequence prediction
+- Learn speculative work and how to keep it from hurting the real path
+- Practice measuring speculation: hit rate vs. wasted work
+"""
+
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+
+from plan_templates import layout_fingerprint, fingerprint_distance, LAYOUT_TOLERANCE_BITS
+
+
+# Predictions prepared per idle period, and the least likely worth preparing
+TOP_K = 2
+MIN_PROBABILITY = 0.2
+
+# Prefetched plans kept (oldest unused are dropped and count as wasted)
+MAX_PLANS = 4
+
+# A prefetched plan older than this is not trusted
+MAX_AGE_SECONDS = 60.0
+
+# Share of wall time prefetch work may take, measured over BUDGET_WINDOW
+BUSY_BUDGET = 0.2
+BUDGET_WINDOW_SECONDS = 60.0
+
+# Commands further apart than this start a new sequence (telemetry seeding)
+SESSION_GAP_SECONDS = 30 * 60
+
+# States kept by the transition model (least used are forgotten first)
+MAX_INTENTS = 64
+
+
+class IntentTransitionModel:
+    """First-order Markov model: P(next intent | last intent)."""
+
+    def __init__(self, max_intents: int = MAX_INTENTS):
+        self.max_intents = max_intents
+        # last intent → {next intent: count}
+        self.counts: Dict[str, Dict[str, int]] = {}
+        # How often each intent follows anything (fallback for unseen states)
+        self.totals: Dict[str, int] = {}
+
+    def observe(self, previous: Optional[str], intent: str):
+        """Count one transition (previous None: first command of a session)."""
+        self.totals[intent] = self.totals.get(intent, 0) + 1
+        if previous is not None:
+            row = self.counts.setdefault(previous, {})
+            row[intent] = row.get(intent, 0) + 1
+        if len(self.totals) > self.max_intents:
+            self._forget_least_used()
+
+    def observe_sequence(self, intents: List[str]):
+        """Count the transitions of one session, in order."""
+        previous = None
+        for intent in intents:
+            self.observe(previous, intent)
+            previous = intent
+
+    def _forget_least_used(self):
+        rare = min(self.totals, key=self.totals.get)
+        del self.totals[rare]
+        self.counts.pop(rare, None)
+        for row in self.counts.values():
+            row.pop(rare, None)
+
+    def predict(self, last: Optional[str], k: int = TOP_K) -> List[tuple]:
+        """
+        Most likely next intents.
+
+        Args:
+            last: The last intent (None or unseen: overall frequencies)
+            k: How many to return
+
+        Returns:
+            [(intent, probability)], most likely first
+        """
+        row = self.counts.get(last) or self.totals
+        total = sum(row.values())
+        if not total:
+            return []
+        ranked = sorted(row.items(), key=lambda item: -item[1])[:k]
+        return [(intent, n / total) for intent, n in ranked]
+
+    @classmethod
+    def from_telemetry(cls, directory: Optional[str], gap_seconds: float = SESSION_GAP_SECONDS
+                       ) -> "IntentTransitionModel":
+        """
+        Learn from the commands in a telemetry log (see telemetry.py).
+
+        Only recognised commands count; a gap longer than gap_seconds
+        starts a new sequence. A missing or unreadable log gives an empty
+        model, which learns as commands run.
+        """
+        model = cls()
+        if not directory:
+            return model
+        try:
+            from telemetry import read_log, OUTCOMES
+            records, names = read_log(directory)
+        except (OSError, ValueError):
+            return model
+
+        unknown = OUTCOMES.index("unknown_command")
+        previous, previous_ns = None, None
+        for wall_ns, intent, param, outcome in zip(
+                records["wall_ns"], records["intent"], records["param"], records["outcome"]):
+            if outcome == unknown or not intent:
+                continue
+            if previous_ns is not None and (wall_ns - previous_ns) / 1e9 > gap_seconds:
+                previous = None
+            command = names[intent] if param < 0 else f"{names[intent]}:{param}"
+            model.observe(previous, command)
+            previous, previous_ns = command, wall_ns
+        return model
+
+
+class _Prefetched:
+    """One prepared intent."""
+
+    __slots__ = ("plan", "fingerprint", "created", "probability")
+
+    def __init__(self, plan: Dict, fingerprint: str, probability: float):
+        self.plan = plan
+        self.fingerprint = fingerprint
+        self.created = time.monotonic()
+        self.probability = probability
+
+
+class Prefetcher:
+    """Prepares the likely next commands of a LogicProAgent in the background."""
+
+    def __init__(
+        self,
+        agent,
+        model: Optional[IntentTransitionModel] = None,
+        top_k: int = TOP_K,
+        min_probability: float = MIN_PROBABILITY,
+        max_plans: int = MAX_PLANS,
+        busy_budget: float = BUSY_BUDGET
+    ):
+        """
+        Initialize the prefetcher.
+
+        Args:
+            agent: The LogicProAgent whose screen, plan(), processor and
+                   tts are used
+            model: Transition model (default: learned from the agent's
+                   telemetry log)
+            top_k: Predictions prepared per idle period
+            min_probability: Skip predictions less likely than this
+            max_plans: Prefetched plans kept
+            busy_budget: Share of wall time prefetch work may take
+        """
+        self.agent = agent
+        self.model = model or IntentTransitionModel.from_telemetry(
+            getattr(getattr(agent, "telemetry", None), "directory", None))
+        self.top_k = top_k
+        self.min_probability = min_probability
+        self.max_plans = max_plans
+        self.busy_budget = busy_budget
+        self.last_intent: Optional[str] = None
+
+        self._plans: "OrderedDict[str, _Prefetched]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._cancel: Optional[threading.Event] = None
+        self._thread: Optional[threading.Thread] = None
+        # (finished at, seconds busy) of recent prefetch jobs
+        self._work = deque()
+        self.stats = dict.fromkeys([
+            "predictions", "plans", "audio", "used", "hits", "stale", "misses",
+            "wasted", "cancelled", "budget_skips", "busy_ms",
+        ], 0)
+
+    # --- Hooks called by the agent ---------------------------------------
+
+    def after_command(self, commands: List[str]):
+        """Learn from a finished command, then prefetch for the next one."""
+        for command in commands:
+            self.model.observe(self.last_intent, command)
+            self.last_intent = command
+        self.start()
+
+    def cancel(self):
+        """A real command is coming: stop starting prefetch work."""
+        if self._cancel is not None and not self._cancel.is_set():
+            self._cancel.set()
+            if self._thread is not None and self._thread.is_alive():
+                self.stats["cancelled"] += 1
+
+    def take(self, commands: List[str], image) -> Optional[Dict]:
+        """
+        A prefetched plan for these commands, if one still fits the screen.
+
+        Args:
+            commands: The real command's intents
+            image: The real command's screenshot
+
+        Returns:
+            Plan dict, or None (plan normally)
+        """
+        with self._lock:
+            entries = [self._plans.pop(c, None) for c in commands]
+        if any(e is None for e in entries):
+            self.stats["misses"] += 1
+            self._count_unused(e for e in entries if e is not None)
+            return None
+
+        fingerprint = layout_fingerprint(image)
+        now = time.monotonic()
+        if any(fingerprint_distance(fingerprint, e.fingerprint) > LAYOUT_TOLERANCE_BITS
+               or now - e.created > MAX_AGE_SECONDS for e in entries):
+            self.stats["stale"] += 1
+            self._count_unused(entries)
+            return None
+
+        self.stats["hits"] += 1
+        self.stats["used"] += len(entries)
+        steps = [s for e in entries for s in e.plan.get("steps", [])]
+        return {"steps": steps, "reasoning": "prefetched",
+                "template_hits": sum(e.plan.get("template_hits", 0) for e in entries),
+                "template_lookups": sum(e.plan.get("template_lookups", 0) for e in entries)}
+
+    # --- Background work ---------------------------------------------------
+
+    def start(self):
+        """Prefetch the most likely next intents on a background thread."""
+        self.cancel()
+        predictions = [
+            (intent, p) for intent, p in self.model.predict(self.last_intent, self.top_k)
+            if p >= self.min_probability
+        ]
+        if not predictions:
+            return
+        self.stats["predictions"] += len(predictions)
+        self._cancel = cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(predictions, cancel), daemon=True)
+        self._thread.start()
+
+    def _over_budget(self) -> bool:
+        """True if recent prefetch work exceeds the busy budget."""
+        now = time.monotonic()
+        while self._work and now - self._work[0][0] > BUDGET_WINDOW_SECONDS:
+            self._work.popleft()
+        busy = sum(seconds for _, seconds in self._work)
+        return busy > self.busy_budget * BUDGET_WINDOW_SECONDS
+
+    def _run(self, predictions: List[tuple], cancel: threading.Event):
+        """Capture once, then plan and synthesize each prediction in turn."""
+        agent = self.agent
+        image = fingerprint = None
+        for intent, probability in predictions:
+            if cancel.is_set():
+                return
+            if self._over_budget():
+                self.stats["budget_skips"] += 1
+                return
+            # An evicted model stays evicted: reloading it on a guess defeats the point
+            use_vision = (getattr(agent.vision, "interruptible", False)
+                          and getattr(agent.vision, "is_loaded", True))
+            _, params = agent.processor.split_intent(intent)
+
+            start = time.monotonic()
+            try:
+                with self._lock:
+                    have_plan = intent in self._plans
+                if not have_plan and (use_vision or params):
+                    if image is None:
+                        image = agent.screen.capture_screen()
+                        fingerprint = layout_fingerprint(image)
+                    plan = (agent.plan(image, [intent], cancel_event=cancel) if use_vision
+                            else self._template_plan(intent, image))
+                    if plan and agent.valid_steps(plan, image.size) and not cancel.is_set():
+                        self._store(intent, _Prefetched(plan, fingerprint, probability))
+                        self.stats["plans"] += 1
+                if not cancel.is_set() and hasattr(agent.tts, "prefetch"):
+                    self.stats["audio"] += bool(agent.tts.prefetch(agent.ack_text([intent])))
+            except Exception as e:
+                print(f"  Prefetch of {intent} failed: {e}")
+            finally:
+                elapsed = time.monotonic() - start
+                self._work.append((time.monotonic(), elapsed))
+                self.stats["busy_ms"] += int(elapsed * 1000)
+
+    def _template_plan(self, intent: str, image) -> Optional[Dict]:
+        """A plan from plan templates alone (None on a miss), never the model."""
+        name, params = self.agent.processor.split_intent(intent)
+        steps = self.agent.templates.lookup(name, params, image)
+        if steps is None:
+            return None
+        return {"steps": steps, "reasoning": "plan templates",
+                "template_hits": 1, "template_lookups": 1}
+
+    def _store(self, intent: str, entry: _Prefetched):
+        with self._lock:
+            old = self._plans.pop(intent, None)
+            self._plans[intent] = entry
+            dropped = [self._plans.popitem(last=False)[1] for _ in range(len(self._plans) - self.max_plans)]
+        self._count_unused(filter(None, [old] + dropped))
+
+    def _count_unused(self, entries):
+        self.stats["wasted"] += sum(1 for _ in entries)
+
+    def hit_rate(self) -> float:
+        """Share of commands answered by a prefetched plan."""
+        total = self.stats["hits"] + self.stats["misses"] + self.stats["stale"]
+        return self.stats["hits"] / total if total else 0.0
+
+    def waste_ratio(self) -> float:
+        """Share of prefetched plans not used (thrown away or still waiting)."""
+        return 1 - self.stats["used"] / self.stats["plans"] if self.stats["plans"] else 0.0
+
+    def summary(self) -> str:
+        """One line of prefetch metrics."""
+        s = self.stats
+        return (f"prefetch hit rate {self.hit_rate():.0%} ({s['hits']} hits, {s['misses']} misses, "
+                f"{s['stale']} stale); {s['plans']} plans / {s['audio']} phrases prefetched, "
+                f"{self.waste_ratio():.0%} unused ({s['wasted']} discarded); {s['busy_ms']} ms busy, "
+                f"{s['cancelled']} cancelled, {s['budget_skips']} over budget")
+
+
+# Example usage / test
+TEST_PLANS = {c: [{"action": "click", "x": 1200 + 30 * i, "y": 64}]
+              for i, c in enumerate(["play", "stop", "record", "metronome_on", "metronome_off"])}
+
+
+def _test_agent(vision, prefetch: bool):
+    """A LogicProAgent built from the replay stand-ins around this vision backend."""
+    from replay import RecordingCursorController, NullTTS, FixtureScreens
+    from voice_input import VoiceInput
+    from screen_capture import ScreenCapture
+    from plan_templates import PlanTemplateStore
+    from telemetry import TelemetryLog
+    from main import LogicProAgent
+
+    class PrefetchingTTS(NullTTS):
+        def __init__(self):
+            super().__init__()
+            self.cached = set()
+
+        def prefetch(self, text, instructions=None):
+            new = text not in self.cached
+            self.cached.add(text)
+            return new
+
+    return LogicProAgent(
+        screen=ScreenCapture(grab=FixtureScreens({"size": [2560, 1600]}, ".")),
+        vision=vision,
+        cursor=RecordingCursorController(),
+        templates=PlanTemplateStore(path=None),
+        voice_input=VoiceInput(api_key="replay", stream_mic=False),
+        tts=PrefetchingTTS(),
+        telemetry=TelemetryLog(directory=None),
+        prefetch=prefetch,
+        govern=False,
+    )
+
+
+def test_prefetch(vision_ms: float = 80.0, rounds: int = 12):
+    """
+    Replay a transport-heavy session with and without prefetch.
+
+    Uses the replay stand-ins (fixture screens, fixed-latency vision, no
+    TTS) with idle gaps between commands, and reports the vision stage
+    time, prefetch hit rate and wasted work — for a model that can't be
+    stopped (no vision prefetch) and an interruptible one.
+    """
+    import io
+    import contextlib
+    from replay import ReplayVision
+
+    session = ["play", "stop", "record", "stop", "play", "stop",
+               "metronome_on", "record", "stop", "play", "stop", "metronome_off"] * (rounds // 12 or 1)
+
+    print("Testing predictive prefetch...")
+    for label, prefetch, interruptible in [("no prefetch", False, False),
+                                           ("blocking", True, False),
+                                           ("interruptible", True, True)]:
+        with contextlib.redirect_stdout(io.StringIO()):
+            agent = _test_agent(ReplayVision(TEST_PLANS, vision_ms, interruptible), prefetch)
+            vision_ms_total = 0.0
+            for command in session:
+                agent.execute_command(f"Hey Logic, {command.replace('_', ' ')}")
+                vision_ms_total += agent.last_timings.get("vision", 0.0)
+                time.sleep(vision_ms * 3 / 1000)  # idle: the user plays
+        print(f"  {label:13} vision stage {vision_ms_total / len(session):6.1f} ms/command, "
+              f"{agent.vision.calls} inferences")
+        if agent.prefetcher is not None:
+            print(f"    {agent.prefetcher.summary()}")
+    print(f"    after 'record': {agent.prefetcher.model.predict('record')}")
+
+
+def test_prefetch_interrupted(vision_ms: float = 300.0):
+    """
+    Send a real command while a prefetch is underway.
+
+    Both backends run one inference at a time. The real command's vision
+    stage must stay close to one inference: with a model that can't be
+    stopped, prefetch never starts one; with the real VisionWorker
+    (running a stand-in analyzer), the prefetch inference is stopped in
+    the worker process when the command arrives.
+    """
+    import io
+    import contextlib
+    from functools import partial
+    from replay import ReplayVision
+    from vision import VisionAnalyzer
+    from vision_worker import BusyAnalyzer
+
+    class SharedModel(ReplayVision):
+        def __init__(self, *args):
+            super().__init__(*args)
+            self.lock = threading.Lock()
+
+        def analyze_image(self, *args, **kwargs):
+            with self.lock:
+                return super().analyze_image(*args, **kwargs)
+
+    print("Testing a command during prefetch...")
+    for label in ("blocking", "worker"):
+        with contextlib.redirect_stdout(io.StringIO()):
+            if label == "worker":
+                vision = VisionAnalyzer(isolated=True, settings_path=None,
+                                        worker_analyzer=partial(BusyAnalyzer, vision_ms))
+            else:
+                vision = SharedModel(TEST_PLANS, vision_ms)
+            agent = _test_agent(vision, prefetch=True)
+            try:
+                agent.prefetcher.model.observe_sequence(["play", "stop"] * 3)
+                agent.execute_command("Hey Logic, play")  # prefetches "stop"
+                time.sleep(0.05)
+                agent.execute_command("Hey Logic, record")
+            finally:
+                vision.close()
+        waited = agent.last_timings.get("vision", 0.0)
+        prefetches = agent.prefetcher.stats["cancelled"]
+        print(f"  {label:10} 'record' vision stage {waited:5.0f} ms (one inference is "
+              f"{vision_ms:.0f} ms), {prefetches} prefetch inference stopped")
+        assert waited < vision_ms * 1.5, f"real command waited behind prefetch ({waited:.0f} ms)"
+        assert prefetches == (label == "worker"), agent.prefetcher.stats
+
+
+if __name__ == "__main__":
+    test_prefetch()
+    test_prefetch_interrupted()
@@ -0,0 +1,458 @@
+"""
+Offline replay of recorded sessions with local stand-ins.
+
+Runs the real agent loop (VoiceInput → CommandProcessor → ScreenCapture →
+vision → CursorController → TTS) without a Mac, a microphone, Logic Pro or
+any cloud API:
+
+- FakeRealtimeServer: a tiny local WebSocket server that replays recorded
+  Realtime transcription events, one utterance per connection
+- FixtureScreens: feeds screenshot fixtures through ScreenCapture
+- ReplayVision: deterministic plans per command (optional fixed latency)
+- RecordingCursorController: records clicks instead of moving the mouse
+- NullTTS: records what would have been spoken
+
+A session is a JSON file (see data/sessions/):
+
+    {
+      "name": "transport_basics",
+      "screens": {"size": [2560, 1600]},            # or {"paths": [...]}
+      "plans": {"play": [{"action": "click", "x": 1240, "y": 62}]},
+      "utterances": [
+        [{"t": 0.0, "type": "input_audio_buffer.speech_started"},
+         {"t": 0.4, "type": "conversation.item.input_audio_transcription.delta",
+          "delta": "Hey Logic,"},
+         ...]
+      ]
+    }
+
+Each event's "t" is seconds after the client connects. Record real
+sessions with record_session().
+
+LEARNING GOALS:
+- Understand test doubles (fakes, stubs, recorders) for hardware and APIs
+- Learn the WebSocket wire protocol (handshake, framing, masking)
+- Practice making performance measurable without the real environment
+"""
+
+import os
+import copy
+import json
+import time
+import base64
+import socket
+import struct
+import hashlib
+import threading
+import socketserver
+from typing import Dict, List, Optional
+
+from PIL import Image
+
+from main import LogicProAgent
+from screen_capture import ScreenCapture
+from cursor_control import CursorController
+from plan_templates import PlanTemplateStore
+from telemetry import TelemetryLog
+from voice_input import VoiceInput
+
+
+# RFC 6455 handshake constant
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OP_TEXT = 0x1
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+# How long the server waits for the client to hang up after the last event
+CLOSE_TIMEOUT = 5.0
+
+
+def load_session(path: str) -> Dict:
+    """
+    Load a session file.
+
+    Returns:
+        Session dict (see module docstring)
+    """
+    with open(path) as f:
+        session = json.load(f)
+    session.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+    session["_dir"] = os.path.dirname(os.path.abspath(path))
+    return session
+
+
+# --- Fake Realtime WebSocket server ---------------------------------------
+
+def _read_frame(rfile) -> tuple:
+    """Read one WebSocket frame. Returns (opcode, payload) or (None, None) on EOF."""
+    head = rfile.read(2)
+    if len(head) < 2:
+        return None, None
+    opcode = head[0] & 0x0F
+    masked = head[1] & 0x80
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack(">H", rfile.read(2))[0]
+    elif length == 127:
+        length = struct.unpack(">Q", rfile.read(8))[0]
+    mask = rfile.read(4) if masked else None
+    payload = rfile.read(length)
+    if mask and length:
+        # XOR the whole payload at once instead of byte by byte
+        key = (mask * (length // 4 + 1))[:length]
+        payload = (int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")).to_bytes(length, "big")
+    return opcode, payload
+
+
+def _frame(opcode: int, payload: bytes) -> bytes:
+    """Build an unmasked (server → client) frame."""
+    n = len(payload)
+    if n < 126:
+        header = struct.pack(">BB", 0x80 | opcode, n)
+    elif n < 65536:
+        header = struct.pack(">BBH", 0x80 | opcode, 126, n)
+    else:
+        header = struct.pack(">BBQ", 0x80 | opcode, 127, n)
+    return header + payload
+
+
+class _RealtimeHandler(socketserver.StreamRequestHandler):
+    """One client connection = one replayed utterance."""
+
+    def handle(self):
+        # Small frames + Nagle + delayed ACK would add ~40 ms per event
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if not self._handshake():
+            return
+        replay = self.server.replay
+        self._write_lock = threading.Lock()
+        closed = threading.Event()
+        threading.Thread(target=self._read_client, args=(closed,), daemon=True).start()
+
+        events = replay.next_utterance()
+        if events is None:
+            self._send(OP_CLOSE, struct.pack(">H", 1000))
+            closed.wait(CLOSE_TIMEOUT)
+            return
+
+        start = time.perf_counter()
+        for event in events:
+            delay = event.get("t", 0.0) * replay.time_scale - (time.perf_counter() - start)
+            if delay > 0 and closed.wait(delay):
+                break
+            if closed.is_set():
+                break
+            payload = {k: v for k, v in event.items() if k != "t"}
+            self._send(OP_TEXT, json.dumps(payload).encode("utf-8"))
+        closed.wait(CLOSE_TIMEOUT)
+
+    def _handshake(self) -> bool:
+        headers = {}
+        request_line = self.rfile.readline()
+        while True:
+            line = self.rfile.readline().decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get("sec-websocket-key")
+        if not request_line or not key:
+            return False
+        self.server.replay.last_headers = headers
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        self.wfile.write((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+        ).encode("latin-1"))
+        self.wfile.flush()
+        return True
+
+    def _send(self, opcode: int, payload: bytes):
+        with self._write_lock:
+            try:
+                self.wfile.write(_frame(opcode, payload))
+                self.wfile.flush()
+            except OSError:
+                pass
+
+    def _read_client(self, closed: threading.Event):
+        """Consume client frames (session config, audio) until it hangs up."""
+        replay = self.server.replay
+        try:
+            while True:
+                opcode, payload = _read_frame(self.rfile)
+                if opcode is None:
+                    break
+                if opcode == OP_CLOSE:
+                    self._send(OP_CLOSE, payload[:2])
+                    break
+                if opcode == OP_PING:
+                    self._send(OP_PONG, payload)
+                elif opcode == OP_TEXT:
+                    replay.client_events.append(json.loads(payload).get("type"))
+        except (OSError, ValueError):
+            pass
+        finally:
+            closed.set()
+
+
+class _ThreadingServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeRealtimeServer:
+    """Local stand-in for the Realtime transcription WebSocket."""
+
+    def __init__(self, utterances: List[List[Dict]], time_scale: float = 1.0):
+        """
+        Initialize the server.
+
+        Args:
+            utterances: One list of recorded events per utterance
+            time_scale: Multiplier on recorded event times (0 = send each
+                        utterance's events back to back)
+        """
+        self.utterances = list(utterances)
+        self.time_scale = time_scale
+        self.client_events: List[str] = []
+        self.last_headers: Dict[str, str] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self._server = _ThreadingServer(("127.0.0.1", 0), _RealtimeHandler)
+        self._server.replay = self
+
+    @property
+    def url(self) -> str:
+        """ws:// URL to hand to VoiceInput."""
+        host, port = self._server.server_address
+        return f"ws://{host}:{port}/v1/realtime"
+
+    def next_utterance(self) -> Optional[List[Dict]]:
+        """Events for the next connection, or None when the session is over."""
+        with self._lock:
+            if self._next >= len(self.utterances):
+                return None
+            self._next += 1
+            return self.utterances[self._next - 1]
+
+    def rewind(self):
+        """Start replaying from the first utterance again."""
+        with self._lock:
+            self._next = 0
+
+    def start(self) -> "FakeRealtimeServer":
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# --- Component stand-ins --------------------------------------------------
+
+class FixtureScreens:
+    """Screenshot source for ScreenCapture(grab=...) that cycles through fixtures."""
+
+    def __init__(self, spec: Dict, base_dir: str = "."):
+        """
+        Initialize from a session's "screens" entry.
+
+        Args:
+            spec: {"paths": [...]} for image files, or {"size": [w, h]} for
+                  a generated flat frame
+            base_dir: Directory that relative paths are resolved against
+        """
+        if spec.get("paths"):
+            self.frames = [Image.open(os.path.join(base_dir, p)).convert("RGB")
+                           for p in spec["paths"]]
+        else:
+            width, height = spec.get("size", (2560, 1600))
+            self.frames = [Image.new("RGB", (width, height), (38, 38, 40))]
+        self._index = 0
+
+    def __call__(self) -> Image.Image:
+        frame = self.frames[self._index % len(self.frames)]
+        self._index += 1
+        return frame
+
+
+class ReplayVision:
+    """Deterministic vision backend: a fixed plan per command."""
+
+    def __init__(self, plans: Dict[str, List[Dict]], latency_ms: float = 0.0,
+                 interruptible: bool = False):
+        """
+        Args:
+            plans: Command → list of steps
+            latency_ms: Simulated inference time per call
+            interruptible: Stop at cancel_event like streamed generation
+                           does (see VisionAnalyzer.interruptible)
+        """
+        self.plans = plans
+        self.latency_ms = latency_ms
+        self.interruptible = interruptible
+        self.calls = 0
+
+    def analyze_image(self, image, user_command: str, cancel_event=None) -> Dict:
+        self.calls += 1
+        if self.interruptible and cancel_event is not None:
+            if cancel_event.wait(self.latency_ms / 1000):
+                return {"steps": [], "reasoning": "cancelled"}
+        elif self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        steps = copy.deepcopy(self.plans.get(user_command, []))
+        return {"steps": steps, "reasoning": "replay"}
+
+    def analyze_commands(self, image, commands: List[str], cancel_event=None) -> Dict:
+        # One simulated inference for the whole batch, like the real backend
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        per_intent = {c: copy.deepcopy(self.plans.get(c, [])) for c in commands}
+        return {
+            "steps": [dict(s, intent=c) for c in commands for s in per_intent[c]],
+            "per_intent": per_intent,
+            "missing": [c for c in commands if not per_intent[c]],
+            "reasoning": "replay",
+        }
+
+    def warm_up(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class RecordingCursorController(CursorController):
+    """Records clicks and key presses instead of moving the mouse."""
+
+    def __init__(self):
+        super().__init__(move_duration=0.0, action_delay=0.0)
+        self.clicks: List[tuple] = []
+        self.keys: List[tuple] = []
+
+    def click_at(self, x: int, y: int, description: str = "") -> bool:
+        self.clicks.append((x, y, description))
+        return True
+
+    def press_key(self, key: str, description: str = "") -> bool:
+        self.keys.append((key, description))
+        return True
+
+
+class NullTTS:
+    """Records what would have been spoken."""
+
+    def __init__(self):
+        self.spoken: List[str] = []
+
+    def speak(self, text: str, instructions: str = None):
+        if text:
+            self.spoken.append(text)
+
+    def warm_up(self):
+        pass
+
+
+# --- Running and recording sessions ---------------------------------------
+
+class SessionReplay:
+    """A replay agent wired to a fake server for one session."""
+
+    def __init__(self, session: Dict, time_scale: float = 1.0,
+                 vision_latency_ms: Optional[float] = None):
+        """
+        Build the server and stand-in agent.
+
+        Args:
+            session: Dict from load_session()
+            time_scale: See FakeRealtimeServer
+            vision_latency_ms: Override the session's simulated inference time
+        """
+        self.session = session
+        self.server = FakeRealtimeServer(session["utterances"], time_scale).start()
+        self.cursor = RecordingCursorController()
+        self.tts = NullTTS()
+        latency = session.get("vision_latency_ms", 0.0) if vision_latency_ms is None else vision_latency_ms
+        self.agent = LogicProAgent(
+            screen=ScreenCapture(grab=FixtureScreens(session.get("screens", {}), session.get("_dir", "."))),
+            vision=ReplayVision(session.get("plans", {}), latency),
+            cursor=self.cursor,
+            templates=PlanTemplateStore(path=None),
+            voice_input=VoiceInput(url=self.server.url, api_key="replay", stream_mic=False),
+            tts=self.tts,
+            telemetry=TelemetryLog(directory=None),
+            prefetch=False,
+            govern=False,
+        )
+
+    def run(self) -> List[Dict]:
+        """
+        Replay every utterance once through listen → execute.
+
+        Returns:
+            One dict per utterance: command, ok, and per-stage timings (ms)
+        """
+        self.server.rewind()
+        results = []
+        for _ in self.session["utterances"]:
+            start = time.perf_counter()
+            command = self.agent.voice_input.listen_for_command()
+            listen_ms = (time.perf_counter() - start) * 1000
+            ok = bool(command) and self.agent.execute_command(command)
+            results.append({
+                "command": command,
+                "ok": ok,
+                "timings": {"listen": listen_ms, **(self.agent.last_timings if command else {})},
+            })
+        return results
+
+    def close(self):
+        self.server.close()
+
+
+def record_session(path: str, utterances: int = 5):
+    """
+    Record real Realtime events from the microphone into a session file.
+
+    Needs OPENAI_API_KEY and a microphone. Add "plans" by hand afterwards.
+
+    Args:
+        path: Session JSON to write
+        utterances: How many utterances to capture
+    """
+    voice = VoiceInput()
+    recorded = []
+    for i in range(utterances):
+        print(f"Utterance {i + 1}/{utterances} — say 'Hey Logic' + a command")
+        voice.event_log = []
+        voice.listen_for_command()
+        recorded.append(voice.event_log)
+    voice.event_log = None
+    with open(path, "w") as f:
+        json.dump({"screens": {"size": [2560, 1600]}, "plans": {}, "utterances": recorded}, f, indent=2)
+    print(f"Saved {len(recorded)} utterances to {path}")
+
+
+# Example usage / test
+def test_replay(path: str = "data/sessions/transport_basics.json"):
+    """Replay a session once and print what the agent heard, clicked and said."""
+    print(f"Replaying {path}...")
+    replay = SessionReplay(load_session(path), time_scale=0.0)
+    try:
+        for result in replay.run():
+            print(f"  {result['command']!r:20} ok={result['ok']}")
+        print(f"  Clicks: {replay.cursor.clicks}")
+        print(f"  Spoken: {replay.tts.spoken}")
+    finally:
+        replay.close()
+
+
+if __name__ == "__main__":
+    test_replay()
@@ -0,0 +1,245 @@
+"""
+Streaming polyphase resampler: native-rate microphone audio → 24 kHz PCM16.
+
+Audio interfaces used with Logic usually run at 44.1, 48 or 96 kHz.
+Asking PortAudio for 24 kHz leaves the conversion to the driver or the
+host — which may refuse, or resample with extra latency. Instead we
+capture at the device's own rate and convert here:
+
+    block (frames × channels, float) → downmix → low-pass + rate change → int16
+
+The rate change is rational (44.1k → 24k is ×80/147). Conceptually:
+insert L−1 zeros between samples, low-pass, keep every M-th sample. The
+polyphase form skips the zeros and the discarded outputs: each output
+sample is one dot product of K input samples with one of L filter
+phases — done here for a whole block at once with NumPy.
+
+Filter history and the fractional read position carry across blocks, so
+streaming output is identical to resampling the whole recording at once.
+
+LEARNING GOALS:
+- Understand polyphase rational resampling and why it's cheap
+- Learn windowed-sinc low-pass design (Kaiser window)
+- Practice vectorizing a per-sample loop with NumPy
+"""
+
+import time
+from math import gcd, ceil
+from typing import Optional
+
+import numpy as np
+
+
+# Zero crossings of the sinc on each side, in input samples at the lower
+# of the two rates. More → sharper cutoff, more CPU.
+ZERO_CROSSINGS = 16
+
+# Cutoff as a fraction of the output Nyquist (leaves room for the
+# transition band so nothing above 12 kHz aliases back)
+ROLLOFF = 0.85
+
+# Kaiser window shape: ~80 dB stopband
+KAISER_BETA = 8.0
+
+# What test_resampler() holds the design to: passband tones within this
+# of the ideal signal, and anything above the output Nyquist this far down
+MAX_ERROR_DB = -80.0
+MAX_ALIAS_DB = -80.0
+
+
+def design_lowpass(up: int, down: int, zero_crossings: int = ZERO_CROSSINGS,
+                   rolloff: float = ROLLOFF, beta: float = KAISER_BETA) -> np.ndarray:
+    """
+    Kaiser-windowed sinc low-pass at the upsampled rate (up × input rate).
+
+    Args:
+        up: Interpolation factor L
+        down: Decimation factor M
+        zero_crossings: Sinc lobes per side, at the lower rate
+        rolloff: Cutoff relative to the lower rate's Nyquist
+        beta: Kaiser window beta
+
+    Returns:
+        Filter of length up * taps_per_phase, scaled so DC gain is 1 after
+        zero-stuffing
+    """
+    taps_per_phase = 2 * ceil(zero_crossings * max(1.0, down / up))
+    length = up * taps_per_phase
+    cutoff = rolloff * 0.5 / max(up, down)  # cycles per upsampled sample
+    t = np.arange(length) - (length - 1) / 2
+    h = 2 * cutoff * np.sinc(2 * cutoff * t) * np.kaiser(length, beta)
+    return h * (up / h.sum())
+
+
+def downmix(block: np.ndarray, channel: Optional[int] = None) -> np.ndarray:
+    """
+    Reduce a (frames × channels) block to mono.
+
+    Args:
+        block: Audio from the input stream (1-D is taken as mono)
+        channel: Take only this input; None averages them all (a mic on
+                 input 1 of an 8-input interface would then be averaged
+                 with 7 silent ones)
+
+    Returns:
+        1-D float32 array
+    """
+    if block.ndim == 1:
+        return block.astype(np.float32, copy=False)
+    if channel is not None:
+        return block[:, channel].astype(np.float32)
+    return block.mean(axis=1, dtype=np.float32)
+
+
+def float_to_pcm16(samples: np.ndarray) -> np.ndarray:
+    """Convert [-1, 1] floats to int16 with clipping and rounding."""
+    return np.clip(np.rint(samples * 32767.0), -32768, 32767).astype(np.int16)
+
+
+class PolyphaseResampler:
+    """Stateful rational-ratio resampler for streaming mono audio."""
+
+    def __init__(self, in_rate: int, out_rate: int, zero_crossings: int = ZERO_CROSSINGS):
+        """
+        Initialize the resampler.
+
+        Args:
+            in_rate: Input sample rate (the device's native rate)
+            out_rate: Output sample rate
+            zero_crossings: Filter length knob (see design_lowpass())
+        """
+        self.in_rate = int(in_rate)
+        self.out_rate = int(out_rate)
+        divisor = gcd(self.in_rate, self.out_rate)
+        self.up = self.out_rate // divisor
+        self.down = self.in_rate // divisor
+        self.passthrough = self.up == self.down
+
+        h = design_lowpass(self.up, self.down, zero_crossings)
+        self.taps = len(h) // self.up
+        # phases[p, k] multiplies x[base - k] for an output at phase p
+        self.phases = h.reshape(self.taps, self.up).T.astype(np.float32).copy()
+        self._k = np.arange(self.taps)
+
+        # Filter group delay, in output samples
+        self.delay = (len(h) - 1) / 2 / self.down
+        self.reset()
+
+    def reset(self):
+        """Forget history, as if the stream had just started (silence before)."""
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        # Read position of the next output, in 1/up input samples, relative
+        # to the start of history + next block
+        self._pos = (self.taps - 1) * self.up
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Resample the next block of a stream.
+
+        Args:
+            samples: 1-D float mono input at in_rate, any length
+
+        Returns:
+            1-D float32 output at out_rate (length varies by ±1 between
+            blocks as the fractional position advances)
+        """
+        samples = np.asarray(samples, dtype=np.float32)
+        if self.passthrough:
+            return samples.copy()
+
+        buffer = np.concatenate((self._history, samples))
+        end = len(buffer) * self.up
+        count = max(0, -(-(end - self._pos) // self.down))
+        positions = self._pos + self.down * np.arange(count)
+        bases, phase = np.divmod(positions, self.up)
+
+        windows = buffer[bases[:, None] - self._k]  # (count, taps)
+        out = np.einsum("nk,nk->n", windows, self.phases[phase])
+
+        self._pos += self.down * count
+        consumed = len(buffer) - (self.taps - 1)
+        self._history = buffer[consumed:]
+        self._pos -= consumed * self.up
+        return out
+
+    def process_pcm16(self, block: np.ndarray, channel: Optional[int] = None) -> np.ndarray:
+        """
+        Input-stream block in, Realtime-API-ready PCM16 out.
+
+        Args:
+            block: (frames × channels) or 1-D float audio at in_rate
+            channel: See downmix()
+
+        Returns:
+            1-D int16 array at out_rate
+        """
+        return float_to_pcm16(self.process(downmix(block, channel)))
+
+
+# Example usage / test
+def _reference_error_db(out: np.ndarray, reference: np.ndarray, skip: int) -> float:
+    """Error power relative to the reference, in dB (steady state only)."""
+    n = min(len(out), len(reference))
+    out, reference = out[skip:n], reference[skip:n]
+    error = np.mean((out - reference) ** 2)
+    return 10 * np.log10(error / np.mean(reference ** 2) + 1e-20)
+
+
+def test_resampler(seconds: float = 10.0, out_rate: int = 24000):
+    """
+    Check accuracy against reference signals and measure CPU cost.
+
+    For each common interface rate:
+    - 1 kHz and 8 kHz tones vs. the ideal tone at 24 kHz: error at most
+      MAX_ERROR_DB
+    - a 15 kHz tone (above the output Nyquist) must be filtered, not
+      aliased: at most MAX_ALIAS_DB
+    - streaming in uneven blocks must equal resampling in one go, exactly
+    - CPU time per second of audio for 200 ms stereo blocks → PCM16
+    """
+    print("Testing polyphase resampler...")
+    rng = np.random.default_rng(0)
+    for in_rate in (44100, 48000, 96000):
+        resampler = PolyphaseResampler(in_rate, out_rate)
+        t_in = np.arange(int(in_rate * 1.0)) / in_rate
+        skip = int(resampler.delay) + resampler.taps
+
+        errors = []
+        for freq in (1000, 8000):
+            resampler.reset()
+            out = resampler.process(np.sin(2 * np.pi * freq * t_in))
+            t_out = (np.arange(len(out)) - resampler.delay) / out_rate
+            errors.append(_reference_error_db(out, np.sin(2 * np.pi * freq * t_out), skip))
+
+        resampler.reset()
+        alias = resampler.process(0.5 * np.sin(2 * np.pi * 15000 * t_in))[skip:]
+        alias_db = 20 * np.log10(np.sqrt(np.mean(alias ** 2)) / (0.5 / np.sqrt(2)) + 1e-20)
+
+        signal = rng.uniform(-0.5, 0.5, in_rate).astype(np.float32)
+        resampler.reset()
+        whole = resampler.process(signal)
+        resampler.reset()
+        cuts = np.sort(rng.integers(0, len(signal), 40))
+        streamed = np.concatenate([resampler.process(part) for part in np.split(signal, cuts)])
+        stream_diff = np.max(np.abs(whole - streamed)) if len(whole) == len(streamed) else np.inf
+
+        block = int(in_rate * 0.2)
+        stereo = rng.uniform(-0.3, 0.3, (block, 2)).astype(np.float32)
+        resampler.reset()
+        blocks = int(seconds / 0.2)
+        start = time.process_time()
+        for _ in range(blocks):
+            resampler.process_pcm16(stereo)
+        cpu_ms = (time.process_time() - start) * 1000 / seconds
+
+        print(f"  {in_rate:5d} Hz (×{resampler.up}/{resampler.down}, {resampler.taps} taps/phase): "
+              f"1k err {errors[0]:.0f} dB, 8k err {errors[1]:.0f} dB, "
+              f"15k alias {alias_db:.0f} dB, stream diff {stream_diff:.1e}, "
+              f"{cpu_ms:.2f} ms CPU per s of audio")
+        assert max(errors) <= MAX_ERROR_DB, f"{in_rate} Hz: tone error {max(errors):.0f} dB"
+        assert alias_db <= MAX_ALIAS_DB, f"{in_rate} Hz: 15 kHz leaks at {alias_db:.0f} dB"
+        assert stream_diff == 0, f"{in_rate} Hz: streaming differs by {stream_diff:.1e}"
+
+
+if __name__ == "__main__":
+    test_resampler()
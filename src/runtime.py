@@ -0,0 +1,592 @@
+"""
+Event-driven agent runtime on asyncio.
+
+LogicProAgent.voice_loop() listens, then executes, then listens again, so
+anything said while a command runs is lost, and "play… stop" runs both in
+order even though the play is obsolete. AgentRuntime instead runs four
+independent tasks connected by queues:
+
+    listener ──► CommandQueue ──► planner ──► action queue ──► actor
+        │        (priority,       (capture +                  (cursor)
+        │         coalescing)      agent.plan)
+        └────────────────────────────────────► speech queue ──► speaker
+
+- A compound utterance ("turn on the metronome and hit record") is one
+  item holding all its intents, planned and clicked together.
+- Transport commands jump the queue (see COMMAND_PRIORITY in commands.py).
+- A new command drops pending commands that share a group with it
+  ("stop" drops a queued "play", and a queued "play and turn on the
+  metronome" too) and cancels such a command that is still planning.
+- Planning goes through LogicProAgent.plan() (plan templates, vision
+  phrasing) after checking for a prefetched plan, and every command that
+  leaves the pipeline is written to the telemetry log, as in
+  execute_command().
+- Blocking component calls run in threads; components may also provide
+  async methods, which is how the virtual-clock tests drive it.
+
+LEARNING GOALS:
+- Understand producer/consumer pipelines with asyncio queues
+- Learn priority scheduling and request coalescing
+- Practice cancellation and deterministic testing with a virtual clock
+"""
+
+import heapq
+import asyncio
+import itertools
+import selectors
+import threading
+from typing import Dict, List, Optional
+
+
+class PendingCommand:
+    """One accepted utterance (one or more intents) on its way through the pipeline."""
+
+    def __init__(self, commands: List[str], text: str, priority: int, groups: frozenset,
+                 seq: int, submitted_at: float):
+        self.commands = commands
+        self.command = "+".join(commands)
+        self.text = text
+        self.priority = priority
+        self.groups = groups
+        self.seq = seq
+        self.submitted_at = submitted_at
+        self.cancel_event = threading.Event()
+        self.task: Optional[asyncio.Task] = None
+        # Filled in as it goes: the plan used and stage timings (ms)
+        self.plan: Dict = {}
+        self.timings: Dict[str, float] = {}
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        """
+        Stop planning this command (a running click is left to finish).
+
+        The task only stops awaiting the planning thread; cancel_event is
+        what stops the inference in it and frees the model, on backends
+        that can (see VisionAnalyzer.interruptible).
+        """
+        self.cancel_event.set()
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    def __repr__(self):
+        return f"<{self.command} #{self.seq}>"
+
+
+class CommandQueue:
+    """Priority queue that coalesces superseded commands."""
+
+    def __init__(self):
+        self._heap: List[tuple] = []
+        self._available = asyncio.Event()
+
+    def put(self, item: PendingCommand) -> List[PendingCommand]:
+        """
+        Queue a command, dropping pending ones it supersedes.
+
+        Returns:
+            The commands that were dropped
+        """
+        dropped = [entry[2] for entry in self._heap if entry[2].groups & item.groups]
+        if dropped:
+            self._heap = [entry for entry in self._heap if not entry[2].groups & item.groups]
+            heapq.heapify(self._heap)
+        heapq.heappush(self._heap, (item.priority, item.seq, item))
+        self._available.set()
+        return dropped
+
+    async def get(self) -> PendingCommand:
+        """Wait for and pop the most urgent command."""
+        while not self._heap:
+            self._available.clear()
+            await self._available.wait()
+        return heapq.heappop(self._heap)[2]
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class AgentRuntime:
+    """Runs an agent's components as concurrent asyncio tasks."""
+
+    def __init__(self, agent, listen: bool = True):
+        """
+        Initialize the runtime.
+
+        Args:
+            agent: A LogicProAgent (only its components are used)
+            listen: Run the voice listener task; False when commands come
+                    from submit() only (tests, daemon)
+        """
+        self.agent = agent
+        self.listen = listen
+        self.queue: Optional[CommandQueue] = None
+        self.stats: Dict[str, int] = dict.fromkeys(
+            ["accepted", "unknown", "shed", "coalesced", "cancelled", "completed", "failed"], 0
+        )
+        # (loop time, event, command) — what happened, in order
+        self.history: List[tuple] = []
+        self._seq = itertools.count()
+        self._planning: Optional[PendingCommand] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _log(self, event: str, command: str = ""):
+        self.history.append((round(asyncio.get_running_loop().time(), 6), event, command))
+
+    def _record(self, commands: List[str], outcome: str, item: Optional[PendingCommand] = None):
+        """Write a command that left the pipeline to the agent's telemetry log."""
+        telemetry = getattr(self.agent, "telemetry", None)
+        if telemetry is None:
+            return
+        name, params = self.agent.processor.split_intent(commands[0]) if commands else ("", {})
+        timings = dict(item.timings) if item is not None else {}
+        if item is not None:
+            timings["total"] = (asyncio.get_running_loop().time() - item.submitted_at) * 1000
+        plan = item.plan if item is not None else {}
+        telemetry.record_command(
+            intent=name,
+            param=params.get("track", -1),
+            n_intents=len(commands),
+            outcome=outcome,
+            timings_ms=timings,
+            template_hits=plan.get("template_hits", 0),
+            template_lookups=plan.get("template_lookups", 0),
+            prompt_tokens=(plan.get("stats") or {}).get("prompt_tokens", 0),
+        )
+
+    async def _call(self, fn, *args, **kwargs):
+        """Await a component method: directly if async, else in a thread."""
+        if asyncio.iscoroutinefunction(fn):
+            return await fn(*args, **kwargs)
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    # --- Lifecycle ---------------------------------------------------------
+
+    async def start(self):
+        """Create the queues and start the pipeline tasks."""
+        self.queue = CommandQueue()
+        self._actions: asyncio.Queue = asyncio.Queue()
+        self._speech: asyncio.Queue = asyncio.Queue()
+        workers = [self._planner(), self._actor(), self._speaker()]
+        if self.listen:
+            workers.append(self._listener())
+        self._tasks = [asyncio.create_task(w) for w in workers]
+
+    async def stop(self):
+        """Cancel all tasks and in-flight work."""
+        planning = self._planning
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if planning is not None:
+            planning.cancel_event.set()  # let a worker-side vision wait give up
+
+    async def run(self):
+        """Start and run until cancelled (Ctrl+C)."""
+        await self.start()
+        print("Async voice mode active. Say 'Hey Logic' + command.")
+        print("Press Ctrl+C to stop.\n")
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            await self.stop()
+            self.agent.voice_input.stop()
+
+    # --- Intake ------------------------------------------------------------
+
+    def submit(self, text: str) -> Optional[PendingCommand]:
+        """
+        Accept a spoken command (call from the event loop thread).
+
+        Args:
+            text: Command text (wake word already removed)
+
+        Returns:
+            The queued command, or None if it wasn't understood
+        """
+        processor = self.agent.processor
+        prefetcher = getattr(self.agent, "prefetcher", None)
+        if prefetcher is not None:
+            prefetcher.cancel()
+        commands = [c for c in processor.parse_intents(text) if processor.is_valid_command(c)]
+        if not commands:
+            self.stats["unknown"] += 1
+            self._log("unknown", text)
+            self._record([], "unknown_command")
+            self._speech.put_nowait("Sorry, I don't understand that command.")
+            return None
+        governor = getattr(self.agent, "governor", None)
+        if governor is not None and governor.refuses(commands, processor):
+            self.stats["shed"] += 1
+            self._log("shed", "+".join(commands))
+            self._record(commands, "shed")
+            self._speech.put_nowait("Logic needs the CPU right now. Only play, stop and record work.")
+            return None
+
+        # Sharing any group is enough: "stop" makes a queued "play and metronome on" obsolete
+        item = PendingCommand(
+            commands, text, min(processor.get_priority(c) for c in commands),
+            frozenset(processor.get_group(c) for c in commands),
+            next(self._seq), asyncio.get_running_loop().time(),
+        )
+        for dropped in self.queue.put(item):
+            self.stats["coalesced"] += 1
+            self._log("coalesced", dropped.command)
+            self._record(dropped.commands, "cancelled", dropped)
+        if self._planning is not None and self._planning.groups & item.groups:
+            self.stats["cancelled"] += 1
+            self._log("cancelled", self._planning.command)
+            self._record(self._planning.commands, "cancelled", self._planning)
+            self._planning.cancel()
+
+        self.stats["accepted"] += 1
+        self._log("accepted", item.command)
+        description = " and ".join(processor.get_command_description(c).lower() for c in commands)
+        self._speech.put_nowait(f"Sure Lucas, {description}.")
+        return item
+
+    async def _listener(self):
+        """Keep listening while commands execute — nothing said is lost."""
+        while True:
+            print("Listening...")
+            text = await self._call(self.agent.voice_input.listen_for_command)
+            if text:
+                self.submit(text)
+
+    # --- Pipeline stages ---------------------------------------------------
+
+    async def _planner(self):
+        while True:
+            item = await self.queue.get()
+            if item.cancelled:
+                continue
+            self._planning = item
+            item.task = asyncio.create_task(self._plan(item))
+            try:
+                steps = await item.task
+            except asyncio.CancelledError:
+                if not item.cancelled:
+                    raise  # the runtime itself is stopping
+                continue
+            except Exception as e:
+                print(f"  Planning {item.command} failed: {e}")
+                self.stats["failed"] += 1
+                self._log("failed", item.command)
+                self._record(item.commands, "error", item)
+                continue
+            finally:
+                self._planning = None
+            await self._actions.put((item, steps))
+
+    async def _plan(self, item: PendingCommand) -> list:
+        """
+        SENSE + THINK: capture, then use a prefetched plan or agent.plan()
+        (or press a key under load).
+        """
+        self._log("planning", item.command)
+        agent = self.agent
+        commands = item.commands
+        governor = getattr(agent, "governor", None)
+        steps = governor.fast_path(commands, agent.processor) if governor is not None else None
+        if steps is not None:
+            return steps
+        prefetcher = getattr(agent, "prefetcher", None)
+        if prefetcher is not None:
+            prefetcher.cancel()  # prefetch started after an earlier command
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        image = await self._call(agent.screen.capture_screen)
+        item.timings["capture"] = (loop.time() - start) * 1000
+
+        start = loop.time()
+        plan = prefetcher.take(commands, image) if prefetcher is not None else None
+        if plan is None:
+            plan = await self._call(agent.plan, image, commands, cancel_event=item.cancel_event)
+        item.plan = plan
+        item.timings["vision"] = (loop.time() - start) * 1000
+        return agent.valid_steps(plan, image.size)
+
+    async def _actor(self):
+        """ACT: run plans one at a time — there is only one mouse."""
+        while True:
+            item, steps = await self._actions.get()
+            if item.cancelled:
+                continue
+            if not steps:
+                self.stats["failed"] += 1
+                self._log("failed", item.command)
+                self._record(item.commands, "not_found", item)
+                self._speech.put_nowait("Sorry, I couldn't find that on screen.")
+                continue
+            self._log("acting", item.command)
+            start = asyncio.get_running_loop().time()
+            ok = await self._call(self.agent.cursor.execute_actions, steps)
+            item.timings["act"] = (asyncio.get_running_loop().time() - start) * 1000
+            self.stats["completed" if ok else "failed"] += 1
+            self._log("completed" if ok else "failed", item.command)
+            self._record(item.commands, "ok" if ok else "action_failed", item)
+            self._speech.put_nowait("Done." if ok else "Something went wrong clicking that.")
+            prefetcher = getattr(self.agent, "prefetcher", None)
+            if prefetcher is not None:
+                prefetcher.after_command(item.commands)
+
+    async def _speaker(self):
+        """SPEAK: confirmations play without blocking the pipeline."""
+        while True:
+            text = await self._speech.get()
+            await self._call(self.agent.tts.speak, text)
+
+
+# --- Deterministic testing -------------------------------------------------
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Never blocks: a select() timeout advances the loop's virtual clock instead."""
+
+    def __init__(self):
+        super().__init__()
+        self.now = 0.0
+
+    def select(self, timeout=None):
+        if timeout:
+            self.now += timeout
+        return super().select(0)
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """
+    Event loop whose clock only moves when every task is waiting.
+
+    asyncio.sleep(5) returns instantly in wall time while loop.time()
+    advances by exactly 5, so timing-dependent tests are deterministic.
+    Only use with async fakes — real threads would race the clock.
+    """
+
+    def __init__(self):
+        self._virtual = _VirtualSelector()
+        super().__init__(selector=self._virtual)
+
+    def time(self) -> float:
+        return self._virtual.now
+
+
+class _FakeImage:
+    size = (2560, 1600)
+
+
+class _FakeComponents:
+    """Async stand-ins: each call takes a fixed amount of virtual time."""
+
+    def __init__(self, plan_seconds: float = 0.5, act_seconds: float = 0.2):
+        from commands import CommandProcessor
+        self.processor = CommandProcessor()
+        self.plan_seconds = plan_seconds
+        self.act_seconds = act_seconds
+        self.clicks: List[str] = []
+        self.spoken: List[str] = []
+        self.screen = self
+        self.vision = self
+        self.cursor = self
+        self.tts = self
+
+    valid_steps = staticmethod(lambda plan, size: plan["steps"])
+
+    async def capture_screen(self):
+        return _FakeImage()
+
+    async def plan(self, image, commands, cancel_event=None):
+        await asyncio.sleep(self.plan_seconds)
+        return {"steps": [{"action": "click", "x": 1, "y": 1, "element": c} for c in commands]}
+
+    async def execute_actions(self, steps):
+        await asyncio.sleep(self.act_seconds)
+        self.clicks.extend(step["element"] for step in steps)
+        return True
+
+    async def speak(self, text):
+        self.spoken.append(text)
+
+
+def _run_scenario(script: List[tuple]) -> AgentRuntime:
+    """Submit (virtual time, text) pairs and run until the pipeline drains."""
+    async def scenario():
+        runtime = AgentRuntime(_FakeComponents(), listen=False)
+        await runtime.start()
+        start = asyncio.get_running_loop().time()
+        for at, text in script:
+            delay = start + at - asyncio.get_running_loop().time()
+            if delay > 0:  # same-time submissions land before the planner wakes
+                await asyncio.sleep(delay)
+            runtime.submit(text)
+        await asyncio.sleep(10)
+        await runtime.stop()
+        return runtime
+
+    loop = VirtualClockLoop()
+    try:
+        return loop.run_until_complete(scenario())
+    finally:
+        loop.close()
+
+
+# Example usage / test
+def test_runtime():
+    """
+    Deterministic checks with fake components on a virtual clock.
+
+    Planning takes 0.5 s and clicking 0.2 s of virtual time.
+    """
+    print("Testing async runtime...")
+
+    # "stop" while "play" is still planning → play cancelled in flight
+    runtime = _run_scenario([(0.0, "play"), (0.1, "stop")])
+    assert runtime.agent.clicks == ["stop"], runtime.agent.clicks
+    assert runtime.stats["cancelled"] == 1
+    print(f"  play→stop: clicked {runtime.agent.clicks}, stats {runtime.stats}")
+
+    # Busy planning the metronome: a queued "play" is dropped when "stop" arrives
+    runtime = _run_scenario([(0.0, "metronome on"), (0.1, "play"), (0.2, "stop")])
+    assert runtime.agent.clicks == ["metronome_on", "stop"], runtime.agent.clicks
+    assert runtime.stats["coalesced"] == 1
+    print(f"  coalesce:  clicked {runtime.agent.clicks}")
+
+    # Transport jumps ahead of a metronome command queued just before it
+    runtime = _run_scenario([(0.0, "metronome off"), (0.0, "record")])
+    assert runtime.agent.clicks == ["record", "metronome_off"], runtime.agent.clicks
+    print(f"  priority:  clicked {runtime.agent.clicks}")
+
+    # A compound utterance is one item: both intents, setup first, one plan
+    runtime = _run_scenario([(0.0, "hit record and turn on the metronome")])
+    assert runtime.agent.clicks == ["metronome_on", "record"], runtime.agent.clicks
+    assert runtime.stats["accepted"] == runtime.stats["completed"] == 1, runtime.stats
+    print(f"  compound:  clicked {runtime.agent.clicks}")
+
+    # "stop" supersedes a queued compound that would start playback
+    runtime = _run_scenario([(0.0, "mute track 1"), (0.1, "play and metronome on"), (0.2, "stop")])
+    assert runtime.agent.clicks == ["mute_track:1", "stop"], runtime.agent.clicks
+    assert runtime.stats["coalesced"] == 1, runtime.stats
+    print(f"  supersede: clicked {runtime.agent.clicks}")
+
+    # Commands spoken during execution are queued, not lost
+    runtime = _run_scenario([(0.0, "play"), (0.6, "metronome on"), (0.65, "blah"), (0.7, "metronome off")])
+    assert runtime.agent.clicks == ["play", "metronome_off"], runtime.agent.clicks
+    assert runtime.stats["unknown"] == 1
+    print(f"  no loss:   clicked {runtime.agent.clicks}")
+    for entry in runtime.history:
+        print(f"    t={entry[0]:5.2f}  {entry[1]:10} {entry[2]}")
+
+
+def test_runtime_agent():
+    """
+    Run a real LogicProAgent (replay stand-ins, real threads) through the runtime.
+
+    The vision stand-in only knows the prompt phrasing ("mute track 2"),
+    so a click proves planning went through agent.plan(), which also
+    looks up plan templates first; both commands land in telemetry.
+    """
+    import io
+    import contextlib
+    from replay import ReplayVision, RecordingCursorController, NullTTS, FixtureScreens
+    from voice_input import VoiceInput
+    from screen_capture import ScreenCapture
+    from plan_templates import PlanTemplateStore
+    from telemetry import TelemetryLog
+    from main import LogicProAgent
+
+    async def scenario(agent):
+        runtime = AgentRuntime(agent, listen=False)
+        await runtime.start()
+        for _ in range(2):
+            runtime.submit("mute track 2")
+            await asyncio.sleep(0.3)
+        await runtime.stop()
+        return runtime
+
+    print("Testing async runtime with a replay agent...")
+    with contextlib.redirect_stdout(io.StringIO()):
+        agent = LogicProAgent(
+            screen=ScreenCapture(grab=FixtureScreens({"size": [2560, 1600]}, ".")),
+            vision=ReplayVision({"mute track 2": [{"action": "click", "x": 180, "y": 260}]}),
+            cursor=RecordingCursorController(),
+            templates=PlanTemplateStore(path=None),
+            voice_input=VoiceInput(api_key="replay", stream_mic=False),
+            tts=NullTTS(),
+            telemetry=TelemetryLog(directory=None),
+            prefetch=False,
+            govern=False,
+        )
+        runtime = asyncio.run(scenario(agent))
+    assert runtime.stats["completed"] == 2, runtime.stats
+    assert agent.cursor.clicks and agent.templates.stats["misses"] == 2, agent.templates.stats
+    assert agent.telemetry.stats["records"] == 2, agent.telemetry.stats
+    print(f"  2 commands: {len(agent.cursor.clicks)} clicks, {agent.templates.stats['misses']} "
+          f"template lookups, {agent.telemetry.stats['records']} telemetry records")
+
+
+def test_runtime_cancel(vision_ms: float = 600.0):
+    """
+    "play" then "stop" on a real agent whose model runs in a VisionWorker.
+
+    Planning runs in a thread and the worker does one inference at a
+    time, so unless cancelling "play" stops its inference, "stop" waits
+    for it. "stop" must finish within about one inference of being said.
+    """
+    import io
+    import contextlib
+    from functools import partial
+    from PIL import Image
+    from replay import RecordingCursorController, NullTTS, FixtureScreens
+    from voice_input import VoiceInput
+    from screen_capture import ScreenCapture
+    from plan_templates import PlanTemplateStore
+    from telemetry import TelemetryLog
+    from vision import VisionAnalyzer
+    from vision_worker import BusyAnalyzer
+    from main import LogicProAgent
+
+    async def scenario(agent):
+        runtime = AgentRuntime(agent, listen=False)
+        await runtime.start()
+        runtime.submit("play")
+        await asyncio.sleep(0.15)
+        said = asyncio.get_running_loop().time()
+        runtime.submit("stop")
+        while runtime.stats["completed"] + runtime.stats["failed"] < 1:
+            await asyncio.sleep(0.02)
+        await runtime.stop()
+        done = next(t for t, event, command in runtime.history if event == "completed")
+        return runtime, (done - said) * 1000
+
+    print("Testing async runtime cancellation with a vision worker...")
+    vision = VisionAnalyzer(isolated=True, settings_path=None,
+                            worker_analyzer=partial(BusyAnalyzer, vision_ms))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            vision.analyze_image(Image.new("RGB", (64, 64)), "warm up")
+            agent = LogicProAgent(
+                screen=ScreenCapture(grab=FixtureScreens({"size": [2560, 1600]}, ".")),
+                vision=vision,
+                cursor=RecordingCursorController(),
+                templates=PlanTemplateStore(path=None),
+                voice_input=VoiceInput(api_key="replay", stream_mic=False),
+                tts=NullTTS(),
+                telemetry=TelemetryLog(directory=None),
+                prefetch=False,
+                govern=False,
+            )
+            runtime, stop_ms = asyncio.run(scenario(agent))
+    finally:
+        vision.close()
+    assert runtime.stats["cancelled"] == 1 and len(agent.cursor.clicks) == 1, runtime.stats
+    assert stop_ms < vision_ms * 1.5, f"stop waited behind the cancelled play ({stop_ms:.0f} ms)"
+    print(f"  play cancelled; stop done {stop_ms:.0f} ms after it was said "
+          f"(one inference is {vision_ms:.0f} ms)")
+
+
+if __name__ == "__main__":
+    test_runtime()
+    test_runtime_agent()
+    test_runtime_cancel()
@@ -7,32 +7,52 @@ LEARNING GOALS:
 - Practice encoding images for API transmission
 """
 
-import pyautogui
 from PIL import Image
 import io
 import base64
-from typing import Optional
+from typing import Callable, Optional
+
+try:
+    import pyautogui
+except Exception:  # not installed, or no display (e.g. headless Linux replay)
+    pyautogui = None
+
+import tracing
 
 
 class ScreenCapture:
     """Handles screenshot capture of Logic Pro window."""
 
-    def __init__(self):
-        """Initialize screen capture."""
-        # TODO: Research PyAutoGUI failsafe feature
-        # Should we enable it during development? Why or why not?
-        pass
+    def __init__(self, grab: Optional[Callable[[], Image.Image]] = None, archive=None):
+        """
+        Initialize screen capture.
+
+        Args:
+            grab: Callable returning a PIL Image, used instead of a real
+                  screenshot (e.g. replaying fixture images)
+            archive: Optional ScreenshotArchive every capture is handed to
+                     (written in the background, never waited on)
+        """
+        if grab is None:
+            if pyautogui is None:
+                raise RuntimeError("pyautogui is not available — pass grab= to capture from fixtures")
+            # Keep PyAutoGUI's failsafe on: slamming the mouse into a screen
+            # corner aborts automation if a click plan goes wrong.
+            pyautogui.FAILSAFE = True
+            grab = pyautogui.screenshot
+        self._grab = grab
+        self.archive = archive
+        # Hand every Nth capture to the archive (0: none); the load
+        # governor raises this when the machine is busy
+        self.archive_every = 1
+        self._captures = 0
 
     def capture_screen(self, save_path: Optional[str] = None) -> Image.Image:
         """
         Capture the entire screen.
 
-        TODO: Implement this method
-        Hints:
-        - Use pyautogui.screenshot()
-        - Return a PIL Image object
-        - Optionally save to save_path if provided
-        - Print confirmation when saved
+        save_path writes synchronously, which costs hundreds of ms at 5K —
+        use it for one-off captures, and an archive for anything per-command.
 
         Args:
             save_path: Optional path to save screenshot
@@ -40,20 +60,19 @@ class ScreenCapture:
         Returns:
             PIL Image object
         """
-        pass
+        image = self._grab()
+        if save_path:
+            image.save(save_path)
+            print(f"  Screenshot saved to {save_path}")
+        self._captures += 1
+        if self.archive is not None and self.archive_every and self._captures % self.archive_every == 0:
+            self.archive.submit(image)
+        return image
 
     def image_to_base64(self, image: Image.Image) -> str:
         """
         Convert PIL Image to base64 string for API transmission.
 
-        TODO: Implement this method
-        Hints:
-        - Create a BytesIO buffer
-        - Save image to buffer as PNG
-        - Get bytes from buffer
-        - Use base64.b64encode()
-        - Decode to string with .decode('utf-8')
-
         Why do we need this?
         - Claude API expects images as base64 strings
         - This is a common format for transmitting binary data over text protocols
@@ -64,25 +83,23 @@ class ScreenCapture:
         Returns:
             Base64 encoded string
         """
-        pass
+        with tracing.span("capture.encode"):
+            buffer = io.BytesIO()
+            image.save(buffer, format="PNG")
+            return base64.b64encode(buffer.getvalue()).decode("utf-8")
 
     def capture_and_encode(self, save_path: Optional[str] = None) -> tuple[Image.Image, str]:
         """
         Capture screen and return both image and base64 encoding.
 
-        TODO: Implement this method
-        Hints:
-        - Call capture_screen()
-        - Call image_to_base64()
-        - Return both
-
         Args:
             save_path: Optional path to save screenshot
 
         Returns:
             Tuple of (PIL Image, base64 string)
         """
-        pass
+        image = self.capture_screen(save_path)
+        return image, self.image_to_base64(image)
 
 
 # Test function
@@ -90,15 +107,14 @@ def test_capture():
     """
     Test function to verify screen capture works.
 
-    TODO: Implement this
-    - Create ScreenCapture instance
-    - Capture a screenshot
-    - Save it to data/screenshots/test_capture.png
-    - Print the image dimensions
-    - Print the base64 string length
+    Saves a screenshot to data/screenshots/test_capture.png and prints
+    its dimensions and base64 length.
     """
     print("Testing screen capture...")
-    # Your code here
+    capture = ScreenCapture()
+    image, encoded = capture.capture_and_encode("data/screenshots/test_capture.png")
+    print(f"  Size: {image.size[0]}x{image.size[1]}")
+    print(f"  Base64 length: {len(encoded):,} chars")
 
 
 if __name__ == "__main__":
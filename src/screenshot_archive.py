@@ -0,0 +1,394 @@
+"""
+Background screenshot archive for debugging and building replay fixtures.
+
+Saving a 5K screenshot as PNG takes hundreds of milliseconds — far too
+long to do between capturing the screen and asking the vision model
+about it. ScreenshotArchive takes frames on a bounded queue and encodes
+them on its own thread; when the queue is full the frame is dropped and
+counted, so capture never waits on the disk.
+
+Files are named so the directory itself is the index:
+
+    1718000000123_000042_debug.webp              full frame (keyframe)
+    1718000000456_000043_debug_d640x212.webp     dirty region at (640, 212)
+
+LEARNING GOALS:
+- Understand why I/O belongs off the latency-critical path
+- Learn the size/speed trade-offs between PNG, WebP and JPEG
+- Practice bounded queues and retention policies
+"""
+
+import os
+import re
+import time
+import queue
+import atexit
+import threading
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageChops, features
+
+import tracing
+
+
+ARCHIVE_DIR = "data/screenshots/archive"
+
+# Encoding per purpose: (format, extension, save options)
+#   fixture — exact pixels for replay sessions; fastest PNG level
+#   debug   — looking at what the agent saw; smallest, good enough
+#   share   — attaching to bug reports; JPEG opens anywhere
+PURPOSE_ENCODINGS = {
+    "fixture": ("PNG", "png", {"compress_level": 1}),
+    "debug": ("WEBP", "webp", {"quality": 80, "method": 0}),
+    "share": ("JPEG", "jpg", {"quality": 80}),
+}
+DEFAULT_PURPOSE = "debug"
+
+# Frames waiting to be encoded; beyond this new frames are dropped
+MAX_QUEUE = 4
+
+# Retention: whichever limit is hit first evicts the oldest frames
+MAX_FILES = 500
+MAX_BYTES = 500 * 1024 * 1024
+MAX_AGE_SECONDS = 7 * 24 * 3600
+
+# With dirty regions on, write a full frame at least this often
+KEYFRAME_INTERVAL = 30
+
+FILENAME_PATTERN = re.compile(
+    r"^(?P<ms>\d+)_(?P<seq>\d+)_(?P<purpose>[a-z]+)(?:_d(?P<left>\d+)x(?P<top>\d+))?\.(?P<ext>\w+)$"
+)
+
+
+class ScreenshotArchive:
+    """Encodes and stores screenshots on a background thread."""
+
+    def __init__(
+        self,
+        directory: str = ARCHIVE_DIR,
+        purpose: str = DEFAULT_PURPOSE,
+        dirty_regions: bool = False,
+        max_queue: int = MAX_QUEUE,
+        max_files: int = MAX_FILES,
+        max_bytes: int = MAX_BYTES,
+        max_age: float = MAX_AGE_SECONDS
+    ):
+        """
+        Initialize the archive and start its writer thread.
+
+        Args:
+            directory: Where frames are written
+            purpose: Default encoding (see PURPOSE_ENCODINGS)
+            dirty_regions: Store only the region that changed since the
+                           previous archived frame (plus periodic keyframes)
+            max_queue: Frames allowed to wait for the writer
+            max_files: Retention limit on frame count
+            max_bytes: Retention limit on total size
+            max_age: Retention limit on frame age, in seconds
+        """
+        if purpose not in PURPOSE_ENCODINGS:
+            raise ValueError(f"Unknown purpose {purpose!r} (choose from {', '.join(PURPOSE_ENCODINGS)})")
+        self.directory = directory
+        self.purpose = purpose
+        self.dirty_regions = dirty_regions
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+        self.stats = {
+            "submitted": 0,
+            "written": 0,
+            "dropped": 0,
+            "unchanged": 0,
+            "evicted": 0,
+            "errors": 0,
+            "bytes_written": 0,
+            "write_ms": 0.0,
+        }
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self._files: List[Dict] = []  # oldest first
+        self._total_bytes = 0
+        self._seq = 0
+        self._previous: Optional[Image.Image] = None
+        self._since_keyframe = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._scan()
+        self._thread = threading.Thread(target=self._writer, name="screenshot-archive", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def queue_depth(self) -> int:
+        """Frames waiting to be written."""
+        return self._queue.qsize()
+
+    def submit(self, image: Image.Image, purpose: Optional[str] = None) -> bool:
+        """
+        Queue a frame for archiving without waiting.
+
+        The image is archived as-is later, so don't modify it afterwards
+        (a fresh screenshot never is).
+
+        Args:
+            image: Screenshot
+            purpose: Encoding override for this frame
+
+        Returns:
+            True if queued, False if dropped because the queue was full
+        """
+        self.stats["submitted"] += 1
+        try:
+            self._queue.put_nowait((time.time(), image, purpose or self.purpose))
+            return True
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until every queued frame is written.
+
+        Returns:
+            True if the queue drained within the timeout
+        """
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self, timeout: float = 2.0):
+        """Write what's queued (up to timeout) and stop the writer."""
+        if not self._thread.is_alive():
+            return
+        self.flush(timeout)
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def restore(self, filename: str) -> Image.Image:
+        """
+        Rebuild the full frame for an archived file.
+
+        Dirty-region files are pasted, in order, onto the keyframe before
+        them.
+
+        Args:
+            filename: Name of a file in the archive directory
+
+        Returns:
+            Full-size PIL Image
+        """
+        names = sorted(f["name"] for f in self._files)
+        if filename not in names:
+            raise FileNotFoundError(filename)
+        index = names.index(filename)
+        start = index
+        while start >= 0 and FILENAME_PATTERN.match(names[start])["left"] is not None:
+            start -= 1
+        if start < 0:
+            raise FileNotFoundError(f"keyframe for {filename} was evicted")
+
+        with Image.open(os.path.join(self.directory, names[start])) as key:
+            frame = key.convert("RGB")
+        for name in names[start + 1:index + 1]:
+            match = FILENAME_PATTERN.match(name)
+            with Image.open(os.path.join(self.directory, name)) as region:
+                frame.paste(region.convert("RGB"), (int(match["left"]), int(match["top"])))
+        return frame
+
+    def _writer(self):
+        """Background thread: encode, write, enforce retention."""
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                start = time.perf_counter()
+                with tracing.span("archive.write"):
+                    self._write(*item)
+                    self._enforce_retention()
+                self.stats["write_ms"] += (time.perf_counter() - start) * 1000
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"  Screenshot archive error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, timestamp: float, image: Image.Image, purpose: str):
+        """Encode one frame (or its dirty region) to disk."""
+        region, offset = image, None
+        if self.dirty_regions:
+            region, offset = self._dirty_region(image)
+            if region is None:
+                self.stats["unchanged"] += 1
+                return
+
+        fmt, ext, options = self._encoding(purpose)
+        if fmt != "PNG" and region.mode not in ("RGB", "L"):
+            region = region.convert("RGB")
+
+        self._seq += 1
+        suffix = f"_d{offset[0]}x{offset[1]}" if offset else ""
+        name = f"{int(timestamp * 1000)}_{self._seq:06d}_{purpose}{suffix}.{ext}"
+        path = os.path.join(self.directory, name)
+        region.save(path, format=fmt, **options)
+
+        size = os.path.getsize(path)
+        self._files.append({"name": name, "size": size, "time": timestamp, "key": offset is None})
+        self._total_bytes += size
+        self.stats["written"] += 1
+        self.stats["bytes_written"] += size
+
+    def _dirty_region(self, image: Image.Image):
+        """
+        Region that changed since the previous archived frame.
+
+        Returns:
+            (image, None) for a keyframe, (crop, (left, top)) for a dirty
+            region, or (None, None) if nothing changed
+        """
+        previous, self._previous = self._previous, image
+        keyframe = (
+            previous is None
+            or previous.size != image.size
+            or previous.mode != image.mode
+            or self._since_keyframe >= KEYFRAME_INTERVAL
+            or not any(f["key"] for f in self._files)  # retention took it
+        )
+        if keyframe:
+            self._since_keyframe = 0
+            return image, None
+
+        box = ImageChops.difference(image, previous).getbbox()
+        if box is None:
+            return None, None
+        self._since_keyframe += 1
+        return image.crop(box), box[:2]
+
+    @staticmethod
+    def _encoding(purpose: str) -> tuple:
+        """Format for a purpose, falling back to JPEG without WebP support."""
+        fmt, ext, options = PURPOSE_ENCODINGS[purpose]
+        if fmt == "WEBP" and not features.check("webp"):
+            return "JPEG", "jpg", {"quality": options.get("quality", 80)}
+        return fmt, ext, options
+
+    def _enforce_retention(self):
+        """Evict the oldest frames until every limit holds."""
+        cutoff = time.time() - self.max_age
+        while self._files and (
+            len(self._files) > self.max_files
+            or self._total_bytes > self.max_bytes
+            or self._files[0]["time"] < cutoff
+        ):
+            self._evict_oldest()
+
+    def _evict_oldest(self):
+        """Delete the oldest frame — and, for a keyframe, the regions based on it."""
+        doomed = [self._files.pop(0)]
+        if doomed[0]["key"]:
+            while self._files and not self._files[0]["key"]:
+                doomed.append(self._files.pop(0))
+        for entry in doomed:
+            try:
+                os.remove(os.path.join(self.directory, entry["name"]))
+            except FileNotFoundError:
+                pass
+            self._total_bytes -= entry["size"]
+            self.stats["evicted"] += 1
+
+    def _scan(self):
+        """Pick up frames from earlier runs so retention covers them too."""
+        for name in sorted(os.listdir(self.directory)):
+            match = FILENAME_PATTERN.match(name)
+            if not match:
+                continue
+            size = os.path.getsize(os.path.join(self.directory, name))
+            self._files.append({
+                "name": name,
+                "size": size,
+                "time": int(match["ms"]) / 1000,
+                "key": match["left"] is None,
+            })
+            self._total_bytes += size
+            self._seq = max(self._seq, int(match["seq"]))
+
+
+# Example usage / test
+def test_screenshot_archive(frames: int = 12):
+    """
+    Compare archiving against synchronous saves on synthetic 5K frames.
+
+    Prints the time a burst of submits costs the capture path (and how
+    many frames the bounded queue dropped), then size and background write
+    time per purpose, with and without dirty regions.
+    """
+    import tempfile
+    from PIL import ImageDraw
+
+    print("Testing screenshot archive...")
+    base = Image.new("RGB", (5120, 2880), (40, 40, 44))
+    draw = ImageDraw.Draw(base)
+    for i in range(0, 2880, 46):
+        draw.line((0, i, 5120, i), fill=(20, 20, 20))
+        draw.text((40, i + 10), f"Audio {i // 46 + 1}", fill=(200, 200, 200))
+
+    def frame(i):
+        # Only the playhead moves between frames
+        image = base.copy()
+        ImageDraw.Draw(image).rectangle((600 + 8 * i, 0, 604 + 8 * i, 2880), fill=(255, 255, 255))
+        return image
+
+    images = [frame(i) for i in range(frames)]
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        images[0].save(os.path.join(tmp, "sync.png"))
+        print(f"  Synchronous PNG save: {(time.perf_counter() - start) * 1000:.0f} ms on the capture path")
+
+        archive = ScreenshotArchive(os.path.join(tmp, "burst"))
+        start = time.perf_counter()
+        for image in images:
+            archive.submit(image)
+        submit_ms = (time.perf_counter() - start) * 1000 / frames
+        depth = archive.queue_depth
+        archive.close(timeout=60)
+        print(f"  Burst of {frames}: {submit_ms:.3f} ms per submit, queue depth {depth}, "
+              f"dropped {archive.stats['dropped']}")
+
+        for purpose in PURPOSE_ENCODINGS:
+            for dirty in (False, True):
+                archive = ScreenshotArchive(os.path.join(tmp, f"{purpose}-{dirty}"), purpose=purpose,
+                                            dirty_regions=dirty, max_queue=frames)
+                for image in images:
+                    archive.submit(image)
+                archive.close(timeout=120)
+                written = archive.stats["written"] or 1
+                print(f"  {purpose:8} {'dirty' if dirty else 'full '}: "
+                      f"{archive.stats['bytes_written'] / written / 1024:7.0f} KB and "
+                      f"{archive.stats['write_ms'] / written:4.0f} ms per frame (background)")
+
+        # Lossless dirty regions must restore to the exact frame
+        archive = ScreenshotArchive(os.path.join(tmp, "restore"), purpose="fixture",
+                                    dirty_regions=True, max_queue=frames)
+        for image in images[:5]:
+            archive.submit(image)
+        archive.close(timeout=60)
+        last = sorted(f["name"] for f in archive._files)[-1]
+        same = ImageChops.difference(archive.restore(last), images[4]).getbbox() is None
+        print(f"  Restored {last}: {'identical' if same else 'DIFFERENT'}")
+
+        archive = ScreenshotArchive(os.path.join(tmp, "retention"), max_files=3, max_queue=frames)
+        for image in images[:6]:
+            archive.submit(image)
+        archive.close(timeout=60)
+        print(f"  Retention (max 3 files): {len(os.listdir(archive.directory))} kept, "
+              f"{archive.stats['evicted']} evicted")
+
+
+if __name__ == "__main__":
+    test_screenshot_archive()
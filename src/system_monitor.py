@@ -0,0 +1,255 @@
+"""
+Process and system resource readings.
+
+Small, dependency-free helpers for reporting how much memory the agent
+holds and how busy the rest of the machine is. Works on macOS (via ps,
+vm_stat and sysctl) and Linux (via /proc).
+
+LEARNING GOALS:
+- Understand resident memory (RSS) vs virtual memory
+- Learn to read process stats without extra packages
+- Understand CPU utilization as a difference of two counter readings
+"""
+
+import os
+import re
+import time
+import subprocess
+from typing import Callable, Dict, Iterable, Optional
+
+
+def resident_memory_mb(pid: Optional[int] = None) -> Optional[float]:
+    """
+    Current resident set size of a process, in MB.
+
+    Args:
+        pid: Process id (default: this process)
+
+    Returns:
+        RSS in MB, or None if it can't be read on this platform
+    """
+    pid = pid or os.getpid()
+
+    # Linux: second field of statm is resident pages
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        pass
+
+    # macOS: ps reports RSS in KB
+    try:
+        output = subprocess.run(
+            ["ps", "-o", "rss=", "-p", str(pid)],
+            capture_output=True, text=True, timeout=2,
+        ).stdout
+        return int(output.strip()) / 1024
+    except (OSError, ValueError, subprocess.SubprocessError):
+        return None
+
+
+def format_mb(value: Optional[float]) -> str:
+    """Format an MB reading for log lines ("1234 MB" or "?")."""
+    return "?" if value is None else f"{value:,.0f} MB"
+
+
+def _run(args) -> str:
+    """stdout of a short command ("" if it fails)."""
+    try:
+        return subprocess.run(args, capture_output=True, text=True, timeout=2).stdout
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def memory_used_fraction() -> Optional[float]:
+    """
+    Share of physical memory in use (not available for new allocations).
+
+    Returns:
+        0.0-1.0, or None if it can't be read on this platform
+    """
+    # Linux: MemAvailable already counts reclaimable cache as available
+    try:
+        with open("/proc/meminfo") as f:
+            info = {line.split(":")[0]: int(line.split()[1]) for line in f}
+        return 1.0 - info["MemAvailable"] / info["MemTotal"]
+    except (OSError, ValueError, KeyError, IndexError):
+        pass
+
+    # macOS: free, inactive and speculative pages can be handed out at once
+    total = _run(["sysctl", "-n", "hw.memsize"]).strip()
+    output = _run(["vm_stat"])
+    page = re.search(r"page size of (\d+) bytes", output)
+    if not (total.isdigit() and page):
+        return None
+    pages = dict((name, int(value)) for name, value in re.findall(r"Pages (\w+):\s+(\d+)", output))
+    available = sum(pages.get(k, 0) for k in ("free", "inactive", "speculative")) * int(page.group(1))
+    return 1.0 - available / int(total)
+
+
+def parse_cpu_time(text: str) -> float:
+    """ps TIME column ("1:02.35", "01:02:03", "2-01:02:03") in seconds."""
+    days, _, clock = text.strip().rpartition("-")
+    seconds = 0.0
+    for part in clock.split(":"):
+        seconds = seconds * 60 + float(part)
+    return seconds + (int(days) * 86400 if days else 0)
+
+
+class CpuSampler:
+    """
+    Share of all CPU cores busy between successive read() calls.
+
+    The agent's own CPU time (this process plus any worker processes,
+    such as the isolated vision worker) is reported separately, so
+    callers can tell load the agent causes from load other programs
+    (Logic Pro) cause. Both come from the same cumulative counters over
+    the same interval: /proc on Linux, per-process CPU time from ps on
+    macOS (not %cpu, which is a decaying average).
+    """
+
+    def __init__(self, own_pids: Optional[Callable[[], Iterable[int]]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            own_pids: Returns the agent's process ids (default: this one)
+            clock: Time source (tests)
+        """
+        self.cores = os.cpu_count() or 1
+        self._own_pids = own_pids or (lambda: [os.getpid()])
+        self._clock = clock
+        self._last = None
+
+    @staticmethod
+    def _proc_times(pids) -> Optional[tuple]:
+        """(CPU seconds of all processes since boot, {pid: CPU seconds}) from /proc."""
+        try:
+            tick = os.sysconf("SC_CLK_TCK")
+            with open("/proc/stat") as f:
+                fields = [int(v) for v in f.readline().split()[1:]]
+        except (OSError, ValueError):
+            return None
+        idle = fields[3] + (fields[4] if len(fields) > 4 else 0)
+        own = {}
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/stat") as f:
+                    # Fields after the parenthesized name; utime and stime are 14 and 15
+                    stat = f.read().rpartition(")")[2].split()
+                own[pid] = (int(stat[11]) + int(stat[12])) / tick
+            except (OSError, ValueError, IndexError):
+                pass
+        return (sum(fields[:8]) - idle) / tick, own
+
+    @staticmethod
+    def _ps_times() -> Optional[Dict[int, float]]:
+        """{pid: CPU seconds} of every process, from ps (macOS)."""
+        times = {}
+        for line in _run(["ps", "-A", "-o", "pid=,time="]).splitlines():
+            try:
+                pid, cpu = line.split()
+                times[int(pid)] = parse_cpu_time(cpu)
+            except ValueError:
+                continue
+        return times or None
+
+    def read(self) -> Optional[tuple]:
+        """
+        CPU use since the previous call.
+
+        Returns:
+            (system, own) as shares of all cores (0.0-1.0), or None on the
+            first call and where it can't be read
+        """
+        now = self._clock()
+        pids = set(self._own_pids())
+        proc = self._proc_times(pids)
+        if proc is not None:
+            current = {"system": proc[0], "own": proc[1]}
+        else:
+            every = self._ps_times()
+            if every is None:
+                return None
+            current = {"every": every, "own": {pid: every[pid] for pid in pids if pid in every}}
+
+        last, self._last = self._last, (now, current)
+        if last is None or now <= last[0]:
+            return None
+        previous = last[1]
+
+        def grown(counters: Dict[int, float], before: Dict[int, float]) -> float:
+            # Processes new since the last read count in full; exited ones drop out
+            return sum(max(0.0, t - before.get(pid, 0.0)) for pid, t in counters.items())
+
+        if "system" in current and "system" in previous:
+            system = current["system"] - previous["system"]
+        elif "every" in current and "every" in previous:
+            system = grown(current["every"], previous["every"])
+        else:
+            return None
+        own = grown(current["own"], previous["own"])
+        elapsed = (now - last[0]) * self.cores
+        return min(1.0, system / elapsed), min(1.0, own / elapsed)
+
+
+def _spin(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+# Example usage / test
+def test_system_monitor():
+    """
+    Check CPU attribution: a busy worker process listed as one of ours
+    counts as own, not as other programs' load — on the /proc path with
+    a real process, and on the macOS ps path with scripted counters.
+    """
+    import multiprocessing
+
+    print("Testing system monitor...")
+    assert parse_cpu_time("1:02.50") == 62.5
+    assert parse_cpu_time("01:02:03") == 3723
+    assert parse_cpu_time("2-00:00:01") == 2 * 86400 + 1
+    print(f"  memory in use: {memory_used_fraction():.0%}, {format_mb(resident_memory_mb())} resident")
+
+    # ps path: pid 100 is the agent, 200 its vision worker, 300 Logic Pro
+    counters = iter([
+        {100: 10.0, 200: 50.0, 300: 80.0},
+        {100: 10.1, 200: 51.5, 300: 80.4},      # + 2 s of 1 s × 4 cores
+    ])
+    clock = iter([0.0, 1.0])
+    sampler = CpuSampler(own_pids=lambda: [100, 200], clock=lambda: next(clock))
+    sampler.cores = 4
+    sampler._proc_times = lambda pids: None
+    sampler._ps_times = lambda: next(counters)
+    sampler.read()
+    system, own = sampler.read()
+    print(f"  ps path: system {system:.0%}, own {own:.0%}, other {system - own:.0%}")
+    assert abs(system - 0.5) < 1e-9 and abs(own - 0.4) < 1e-9
+
+    # /proc path: a busy child counts as own only when its pid is listed
+    if CpuSampler._proc_times([]) is None:
+        print("  /proc not available; skipped")
+        return
+    worker = multiprocessing.Process(target=_spin, args=(1.5,))
+    worker.start()
+    try:
+        with_worker = CpuSampler(own_pids=lambda: [os.getpid(), worker.pid])
+        without = CpuSampler()
+        with_worker.read(), without.read()
+        time.sleep(1.0)
+        system, own = with_worker.read()
+        other_without = without.read()
+    finally:
+        worker.join()
+    other_with = system - own
+    print(f"  /proc path, busy worker: other programs {other_with:.0%} with the worker listed "
+          f"as ours, {other_without[0] - other_without[1]:.0%} without")
+    assert other_with < 0.5 / with_worker.cores + 0.1
+    assert other_without[0] - other_without[1] > other_with
+
+
+if __name__ == "__main__":
+    test_system_monitor()
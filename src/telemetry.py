@@ -0,0 +1,426 @@
+"""
+Append-only binary telemetry: one fixed-size record per command.
+
+Every command the agent runs is logged — what was asked, how it ended,
+whether plan templates answered it, and how long each stage took — so a
+session can be looked at afterwards. It's written on the command path,
+so a record is struct-packed straight into a memory-mapped segment
+file: no JSON, no syscall per record, a few microseconds each.
+
+Layout:
+
+    data/telemetry/
+        names.json                  intent id → name ("" is id 0)
+        segment-000001.bin          header + up to SEGMENT_RECORDS records
+        segment-000002.bin          ...
+
+Segments are preallocated; the header's record count is bumped after
+each record, so a reader never sees half a record. When a segment fills
+up the log moves on to the next one and deletes the oldest beyond
+MAX_SEGMENTS.
+
+Reading is offline and vectorized: read_log() maps every segment into
+one NumPy structured array; latency_percentiles() and
+template_hit_rate() aggregate it.
+
+    python src/telemetry.py                   # report on data/telemetry
+    python src/telemetry.py --demo            # write/rotate/read benchmark
+
+LEARNING GOALS:
+- Understand fixed-size binary records and why they're cheap to write
+- Learn memory-mapped files for append-only logs
+- Practice columnar aggregation with NumPy structured arrays
+"""
+
+import os
+import re
+import json
+import mmap
+import time
+import struct
+import argparse
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+TELEMETRY_DIR = "data/telemetry"
+
+# Records per segment file (48 bytes each → ~3 MB per segment)
+SEGMENT_RECORDS = 65536
+
+# Oldest segments beyond this are deleted (~100 MB)
+MAX_SEGMENTS = 32
+
+MAGIC = b"LPTL"
+VERSION = 1
+
+# Stages timed by LogicProAgent._stage(), stored in microseconds
+STAGES = ("parse", "speak_ack", "capture", "vision", "act", "speak", "total")
+
+# Stage that didn't run (e.g. no act after "not found")
+NOT_RUN = 0xFFFFFFFF
+
+OUTCOMES = ("ok", "unknown_command", "not_found", "action_failed", "cancelled", "error", "shed")
+
+# (name, struct code) — the record layout, little-endian and unpadded
+FIELDS = [
+    ("wall_ns", "q"),           # command start, ns since the epoch
+    ("intent", "H"),            # first intent, id in names.json
+    ("param", "h"),             # its track number, -1 for none
+    ("n_intents", "B"),         # intents in the utterance
+    ("outcome", "B"),           # index into OUTCOMES
+    ("template_hits", "B"),     # intents answered by plan templates
+    ("template_lookups", "B"),  # intents that tried a template
+] + [(f"{stage}_us", "I") for stage in STAGES] + [
+    ("prompt_tokens", "I"),     # vision prefill tokens (0: no inference)
+]
+
+RECORD = struct.Struct("<" + "".join(code for _, code in FIELDS))
+RECORD_DTYPE = np.dtype([(name, "<" + code) for name, code in FIELDS])
+
+# magic, version, record size, record count, created (ns since the epoch)
+HEADER = struct.Struct("<4sHHIq")
+HEADER_SIZE = 32
+COUNT_OFFSET = 8
+
+NAMES_FILE = "names.json"
+SEGMENT_PATTERN = re.compile(r"segment-(\d{6})\.bin$")
+
+
+class TelemetryLog:
+    """Writer for the binary command log."""
+
+    def __init__(self, directory: Optional[str] = TELEMETRY_DIR,
+                 segment_records: int = SEGMENT_RECORDS, max_segments: int = MAX_SEGMENTS):
+        """
+        Open the log, continuing the newest segment if it has room.
+
+        Args:
+            directory: Where segments live; None keeps records in an
+                       anonymous in-memory segment (replays, tests)
+            segment_records: Records per segment file
+            max_segments: Segment files kept on disk
+        """
+        self.directory = directory
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        self.names: List[str] = [""]
+        self._ids: Dict[str, int] = {"": 0}
+        self._lock = threading.Lock()
+        self._mm: Optional[mmap.mmap] = None
+        self._file = None
+        self._count = 0
+        self._sequence = 0
+        self.stats = {"records": 0, "segments_opened": 0, "write_ns": 0}
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            names_path = os.path.join(directory, NAMES_FILE)
+            if os.path.exists(names_path):
+                with open(names_path) as f:
+                    self.names = json.load(f)
+                self._ids = {name: i for i, name in enumerate(self.names)}
+            existing = _segment_paths(directory)
+            if existing:
+                self._sequence = int(SEGMENT_PATTERN.search(existing[-1]).group(1))
+                self._open_segment(existing[-1])
+        if self._mm is None or self._count >= self.segment_records:
+            self._rotate()
+
+    def _segment_size(self) -> int:
+        return HEADER_SIZE + self.segment_records * RECORD.size
+
+    def _open_segment(self, path: Optional[str]):
+        """Map a segment, creating and preallocating it if needed (None: anonymous)."""
+        self._close_segment()
+        size = self._segment_size()
+        if path is None:
+            self._mm = mmap.mmap(-1, size)
+            self._mm[:HEADER.size] = HEADER.pack(MAGIC, VERSION, RECORD.size, 0, time.time_ns())
+            self._count = 0
+        else:
+            new = not os.path.exists(path)
+            self._file = open(path, "w+b" if new else "r+b")
+            if new:
+                self._file.truncate(size)
+            self._mm = mmap.mmap(self._file.fileno(), size)
+            if new:
+                self._mm[:HEADER.size] = HEADER.pack(MAGIC, VERSION, RECORD.size, 0, time.time_ns())
+            magic, version, record_size, count, _ = HEADER.unpack_from(self._mm)
+            if (magic, version, record_size) != (MAGIC, VERSION, RECORD.size):
+                raise ValueError(f"{path} is not a v{VERSION} telemetry segment")
+            self._count = count
+        self.stats["segments_opened"] += 1
+
+    def _rotate(self):
+        """Start the next segment and drop the oldest beyond max_segments."""
+        if not self.directory:
+            self._open_segment(None)
+            return
+        self._sequence += 1
+        self._open_segment(os.path.join(self.directory, f"segment-{self._sequence:06d}.bin"))
+        for path in _segment_paths(self.directory)[:-self.max_segments]:
+            os.remove(path)
+
+    def _close_segment(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def intent_id(self, name: str) -> int:
+        """Id of an intent name, registering it (and rewriting names.json) if new."""
+        intent = self._ids.get(name)
+        if intent is not None:
+            return intent
+        intent = self._ids[name] = len(self.names)
+        self.names.append(name)
+        if self.directory:
+            path = os.path.join(self.directory, NAMES_FILE)
+            with open(path + ".tmp", "w") as f:
+                json.dump(self.names, f)
+            os.replace(path + ".tmp", path)
+        return intent
+
+    def record_command(
+        self,
+        intent: str = "",
+        param: int = -1,
+        n_intents: int = 0,
+        outcome: str = "ok",
+        timings_ms: Optional[Dict[str, float]] = None,
+        template_hits: int = 0,
+        template_lookups: int = 0,
+        prompt_tokens: int = 0,
+        wall_ns: Optional[int] = None
+    ):
+        """
+        Append one command's record.
+
+        Args:
+            intent: First intent's name ("" if none was recognised)
+            param: Its track number, -1 if it has none
+            n_intents: Intents in the utterance
+            outcome: One of OUTCOMES
+            timings_ms: Stage timings as in LogicProAgent.last_timings
+            template_hits: Intents answered by plan templates
+            template_lookups: Intents that tried a template
+            prompt_tokens: Vision prefill tokens
+            wall_ns: Command start (default: now minus the total time)
+        """
+        start_ns = time.perf_counter_ns()
+        timings_ms = timings_ms or {}
+        if wall_ns is None:
+            wall_ns = time.time_ns() - int(timings_ms.get("total", 0) * 1e6)
+        stages = [
+            NOT_RUN if timings_ms.get(stage) is None else min(int(timings_ms[stage] * 1000), NOT_RUN - 1)
+            for stage in STAGES
+        ]
+        with self._lock:
+            if self._count >= self.segment_records:
+                self._rotate()
+            RECORD.pack_into(
+                self._mm, HEADER_SIZE + self._count * RECORD.size,
+                wall_ns, self.intent_id(intent), param, min(n_intents, 255), OUTCOMES.index(outcome),
+                min(template_hits, 255), min(template_lookups, 255), *stages, prompt_tokens,
+            )
+            self._count += 1
+            struct.pack_into("<I", self._mm, COUNT_OFFSET, self._count)
+            self.stats["records"] += 1
+            self.stats["write_ns"] += time.perf_counter_ns() - start_ns
+
+    def to_array(self) -> np.ndarray:
+        """Records of the current segment (the whole log when in memory)."""
+        with self._lock:
+            return np.frombuffer(self._mm, RECORD_DTYPE, self._count, HEADER_SIZE).copy()
+
+    def close(self):
+        """Flush and unmap the current segment."""
+        with self._lock:
+            if self._mm is not None and self._file is not None:
+                self._mm.flush()
+            self._close_segment()
+
+
+def _segment_paths(directory: str) -> List[str]:
+    """Segment files in sequence order."""
+    names = sorted(n for n in os.listdir(directory) if SEGMENT_PATTERN.search(n))
+    return [os.path.join(directory, n) for n in names]
+
+
+# --- Offline reading ---------------------------------------------------------
+
+def read_log(directory: str = TELEMETRY_DIR) -> tuple:
+    """
+    Load every segment into one structured array.
+
+    Args:
+        directory: Log directory
+
+    Returns:
+        (records, names) — records has one field per FIELDS entry,
+        oldest first; names maps intent ids to names
+    """
+    with open(os.path.join(directory, NAMES_FILE)) as f:
+        names = json.load(f)
+    parts = []
+    for path in _segment_paths(directory):
+        with open(path, "rb") as f:
+            magic, version, record_size, count, _ = HEADER.unpack(f.read(HEADER.size))
+        if (magic, version, record_size) != (MAGIC, VERSION, RECORD.size):
+            print(f"  Skipping {path}: not a v{VERSION} telemetry segment")
+            continue
+        parts.append(np.fromfile(path, RECORD_DTYPE, count, offset=HEADER_SIZE))
+    records = np.concatenate(parts) if parts else np.empty(0, RECORD_DTYPE)
+    return records, names
+
+
+def latency_percentiles(records: np.ndarray, names: List[str], stage: str = "total",
+                        percentiles=(50, 95, 99)) -> Dict[str, Dict]:
+    """
+    Stage latency percentiles per intent.
+
+    Args:
+        records: From read_log()
+        names: From read_log()
+        stage: One of STAGES
+        percentiles: Percentiles to compute
+
+    Returns:
+        {intent: {"count", "p50_ms", ...}} for intents where the stage ran
+    """
+    column = records[f"{stage}_us"]
+    ran = column != NOT_RUN
+    report = {}
+    for intent in np.unique(records["intent"][ran]):
+        values = column[ran & (records["intent"] == intent)] / 1000.0
+        report[names[intent] or "(none)"] = {
+            "count": int(len(values)),
+            **{f"p{p}_ms": float(v) for p, v in zip(percentiles, np.percentile(values, percentiles))},
+        }
+    return report
+
+
+def template_hit_rate(records: np.ndarray, bucket_seconds: float = 3600.0) -> tuple:
+    """
+    Plan-template hit rate over time.
+
+    Args:
+        records: From read_log()
+        bucket_seconds: Width of each time bucket
+
+    Returns:
+        (bucket_start_ns, hits, lookups) arrays, one entry per bucket
+        with at least one lookup
+    """
+    bucket_ns = int(bucket_seconds * 1e9)
+    buckets = records["wall_ns"] // bucket_ns
+    keys, inverse = np.unique(buckets, return_inverse=True)
+    hits = np.bincount(inverse, weights=records["template_hits"], minlength=len(keys))
+    lookups = np.bincount(inverse, weights=records["template_lookups"], minlength=len(keys))
+    used = lookups > 0
+    return keys[used] * bucket_ns, hits[used].astype(int), lookups[used].astype(int)
+
+
+def outcome_counts(records: np.ndarray) -> Dict[str, int]:
+    """How many commands ended each way."""
+    counts = np.bincount(records["outcome"], minlength=len(OUTCOMES))
+    return {name: int(n) for name, n in zip(OUTCOMES, counts) if n}
+
+
+def print_report(records: np.ndarray, names: List[str], bucket_seconds: float = 3600.0):
+    """Print outcomes, per-intent latencies and template hit rate."""
+    print(f"{len(records)} commands")
+    if not len(records):
+        return
+    print("  " + ", ".join(f"{k} {v}" for k, v in outcome_counts(records).items()))
+    print(f"\n  {'intent':20} {'count':>6} {'p50':>9} {'p95':>9} {'p99':>9}   (total ms)")
+    for intent, s in sorted(latency_percentiles(records, names).items()):
+        print(f"  {intent:20} {s['count']:6d} {s['p50_ms']:9.1f} {s['p95_ms']:9.1f} {s['p99_ms']:9.1f}")
+    starts, hits, lookups = template_hit_rate(records, bucket_seconds)
+    if len(starts):
+        print("\n  Plan template hit rate:")
+        for start, h, n in zip(starts, hits, lookups):
+            stamp = time.strftime("%Y-%m-%d %H:%M", time.localtime(start / 1e9))
+            print(f"    {stamp}  {h / n:6.1%}  ({h}/{n})")
+
+
+# Example usage / test
+def test_telemetry(records: int = 200000, segment_records: int = 65536):
+    """
+    Write synthetic commands through rotation, then read them back.
+
+    Reports the per-record write cost, the read time and a sample of the
+    aggregates; checks nothing was lost across segment boundaries.
+    """
+    print("Testing telemetry log...")
+    rng = np.random.default_rng(0)
+    intents = ["play", "stop", "record", "metronome_on", "mute_track", "solo_track"]
+    with tempfile.TemporaryDirectory() as directory:
+        log = TelemetryLog(directory, segment_records=segment_records, max_segments=8)
+        start_ns = time.time_ns() - records * 2_000_000_000
+        write_ns = []
+        for i in range(records):
+            intent = intents[i % len(intents)]
+            track = intent.endswith("_track")
+            hit = track and rng.random() < min(0.9, i / records * 1.5)
+            vision = 0 if hit else rng.lognormal(np.log(900), 0.3)
+            timings = {"parse": 0.05, "speak_ack": 180.0, "capture": 35.0, "vision": vision,
+                       "act": 120.0, "speak": 150.0}
+            timings["total"] = sum(timings.values())
+            t0 = time.perf_counter_ns()
+            log.record_command(intent, 3 if track else -1, 1, "ok", timings,
+                               template_hits=int(hit), template_lookups=int(track),
+                               prompt_tokens=0 if hit else 5300, wall_ns=start_ns + i * 2_000_000_000)
+            write_ns.append(time.perf_counter_ns() - t0)
+        log.close()
+
+        files = _segment_paths(directory)
+        size = sum(os.path.getsize(p) for p in files)
+        print(f"  {records} records, {RECORD.size} bytes each, {len(files)} segments "
+              f"({size / 1e6:.1f} MB preallocated)")
+        print(f"  write: p50 {np.percentile(write_ns, 50) / 1000:.1f} µs, "
+              f"p99 {np.percentile(write_ns, 99) / 1000:.1f} µs per record")
+
+        reopened = TelemetryLog(directory, segment_records=segment_records)
+        reopened.record_command("play", timings_ms={"total": 1.0})
+        reopened.close()
+
+        t0 = time.perf_counter()
+        data, names = read_log(directory)
+        read_ms = (time.perf_counter() - t0) * 1000
+        ordered = bool(np.all(np.diff(data["wall_ns"][:-1]) > 0))
+        print(f"  read {len(data)} records in {read_ms:.1f} ms "
+              f"(expected {records + 1}, in order: {ordered})")
+        t0 = time.perf_counter()
+        report = latency_percentiles(data, names)
+        starts, hits, lookups = template_hit_rate(data, bucket_seconds=24 * 3600)
+        print(f"  aggregates in {(time.perf_counter() - t0) * 1000:.1f} ms: "
+              f"mute_track p95 {report['mute_track']['p95_ms']:.0f} ms, "
+              f"play p95 {report['play']['p95_ms']:.0f} ms; "
+              f"template hit rate {hits[0] / lookups[0]:.0%} → {hits[-1] / lookups[-1]:.0%} "
+              f"over {len(starts)} days")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Command telemetry report")
+    parser.add_argument("directory", nargs="?", default=TELEMETRY_DIR)
+    parser.add_argument("--bucket-hours", type=float, default=1.0,
+                        help="Time bucket for the template hit rate")
+    parser.add_argument("--demo", action="store_true", help="Run the write/read benchmark")
+    args = parser.parse_args()
+
+    if args.demo:
+        test_telemetry()
+        return
+    records, names = read_log(args.directory)
+    print_report(records, names, args.bucket_hours * 3600)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,60 +6,209 @@ Uses the same OpenAI API key as voice input (STT), so no extra keys needed.
 LEARNING GOALS:
 - Understand streaming audio from an API
 - Practice error handling with external services
+- Learn why a reused (keep-alive) connection answers faster
 """
 
 import os
+import json
+import atexit
+import time
+import shutil
+import threading
 import subprocess
 import tempfile
+from collections import OrderedDict
+from typing import Dict, Optional
 
-from openai import OpenAI
+import tracing
+from http_client import PooledHTTPClient
+
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+# Synthesized phrases kept for reuse ("Done.", prefetched confirmations)
+MAX_CACHED_PHRASES = 16
 
 
 class TextToSpeech:
     """Text-to-speech using OpenAI API."""
 
-    def __init__(self, voice: str = "coral"):
+    def __init__(self, voice: str = "coral", base_url: str = OPENAI_BASE_URL,
+                 api_key: Optional[str] = None, ssl_context=None):
         """
         Initialize TTS.
 
+        The TTS owns one pooled keep-alive connection to the API, so only
+        the first utterance (or warm_up()) pays the TLS handshake.
+
         Args:
             voice: OpenAI voice to use. Options: alloy, ash, ballad, coral,
                    echo, fable, nova, onyx, sage, shimmer, verse, marin, cedar.
+            base_url: API root (a local stand-in in tests)
+            api_key: Defaults to the OPENAI_API_KEY env var
+            ssl_context: Custom TLS trust (tests with a self-signed server)
         """
         self.voice = voice
         self.model = "gpt-4o-mini-tts"
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        if not self.api_key:
+            raise ValueError("OPENAI_API_KEY environment variable not set")
+        self.http = PooledHTTPClient(base_url, ssl_context=ssl_context)
+        # connect/ttfb/total (ms) and reuse of the most recent request
+        self.last_timings: Dict[str, float] = {}
+        # (text, instructions) → mp3 path, least recently used first
+        self._cache: "OrderedDict[tuple, str]" = OrderedDict()
+        self._cache_dir = tempfile.mkdtemp(prefix="logicpro-tts-")
+        atexit.register(shutil.rmtree, self._cache_dir, True)
+        self._cache_lock = threading.Lock()
+        self.stats = {"cache_hits": 0, "cache_misses": 0, "prefetched": 0}
         print(f"  TTS: OpenAI {self.model} (voice: {self.voice})")
 
-    def speak(self, text: str, instructions: str = None):
+    def warm_up(self):
+        """Open the API connection in the background if none is ready."""
+        self.http.warm_async()
+
+    def synthesize(self, text: str, path: str, instructions: str = None):
         """
-        Speak the given text aloud.
+        Stream synthesized mp3 audio for text into a file.
 
         Args:
             text: Text to speak.
-            instructions: Optional tone/style instructions
-                          (e.g. "Speak in a friendly, casual tone").
-        """
-        if not text:
-            return
+            path: Output mp3 file.
+            instructions: Optional tone/style instructions.
 
-        kwargs = {
+        Raises:
+            RuntimeError: If the API answers with an error
+        """
+        payload = {
             "model": self.model,
             "voice": self.voice,
             "input": text,
             "response_format": "mp3",
         }
         if instructions:
-            kwargs["instructions"] = instructions
+            payload["instructions"] = instructions
+        headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+        }
+
+        start_ns = time.perf_counter_ns()
+        with self.http.request("POST", "/audio/speech", json.dumps(payload).encode(), headers) as response:
+            if response.status != 200:
+                detail = response.read()[:300].decode("utf-8", "replace")
+                raise RuntimeError(f"TTS request failed ({response.status}): {detail}")
+            with open(path, "wb") as out:
+                for i, chunk in enumerate(response.iter_bytes()):
+                    if i == 0:
+                        tracing.record("tts.first_audio", time.perf_counter_ns() - start_ns, start_ns)
+                    out.write(chunk)
+        self.last_timings = response.timings
+        tracing.record("tts.total", int(response.timings["total_ms"] * 1e6), start_ns)
+
+    def prefetch(self, text: str, instructions: str = None) -> bool:
+        """
+        Synthesize a phrase ahead of time so speak() can play it at once.
+
+        Args:
+            text: Text that will probably be spoken soon
+            instructions: As for speak()
+
+        Returns:
+            True if it was synthesized now (False: already cached)
+        """
+        if not text or self._cached_path(text, instructions):
+            return False
+        self._synthesize_cached(text, instructions)
+        self.stats["prefetched"] += 1
+        return True
 
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as f:
-            temp_path = f.name
+    def _cached_path(self, text: str, instructions: Optional[str]) -> Optional[str]:
+        with self._cache_lock:
+            path = self._cache.get((text, instructions))
+            if path is not None:
+                self._cache.move_to_end((text, instructions))
+            return path
 
+    def _synthesize_cached(self, text: str, instructions: Optional[str]) -> str:
+        """Synthesize into the cache, evicting the least recently used phrase."""
+        with tempfile.NamedTemporaryFile(suffix=".mp3", dir=self._cache_dir, delete=False) as f:
+            path = f.name
         try:
-            with self.client.audio.speech.with_streaming_response.create(**kwargs) as response:
-                response.stream_to_file(temp_path)
+            self.synthesize(text, path, instructions)
+        except Exception:
+            os.unlink(path)
+            raise
+        with self._cache_lock:
+            old = self._cache.pop((text, instructions), None)
+            self._cache[(text, instructions)] = path
+            evicted = [self._cache.popitem(last=False)[1] for _ in range(len(self._cache) - MAX_CACHED_PHRASES)]
+        for stale in filter(None, [old] + evicted):
+            os.unlink(stale)
+        return path
 
-            # Play with afplay (macOS built-in)
-            subprocess.run(["afplay", temp_path], check=True)
+    def speak(self, text: str, instructions: str = None):
+        """
+        Speak the given text aloud.
+
+        Phrases said before (or prefetched) play from the cache without a
+        request.
+
+        Args:
+            text: Text to speak.
+            instructions: Optional tone/style instructions
+                          (e.g. "Speak in a friendly, casual tone").
+        """
+        if not text:
+            return
+
+        path = self._cached_path(text, instructions)
+        if path is not None:
+            self.stats["cache_hits"] += 1
+        else:
+            self.stats["cache_misses"] += 1
+            path = self._synthesize_cached(text, instructions)
+        # Play with afplay (macOS built-in)
+        subprocess.run(["afplay", path], check=True)
+
+    def close(self):
+        """Close the API connection and delete cached audio."""
+        self.http.close()
+        with self._cache_lock:
+            self._cache.clear()
+        shutil.rmtree(self._cache_dir, ignore_errors=True)
+
+
+# Example usage / test
+def test_tts_connection(handshake_delay: float = 0.15):
+    """
+    Time TTS requests against a local stand-in with a slow handshake.
+
+    Shows the first-request handshake cost, keep-alive reuse, and a
+    wake-word pre-warm hiding the handshake entirely. Nothing is played.
+    """
+    from http_client import StandInServer, _self_signed_context
+
+    print("Testing TTS connection reuse...")
+    with tempfile.TemporaryDirectory() as tmp:
+        contexts = _self_signed_context(tmp) or (None, None)
+        server = StandInServer(handshake_delay=handshake_delay, ssl_context=contexts[0])
+        path = os.path.join(tmp, "out.mp3")
+        try:
+            for label, warm in (("cold", False), ("pre-warmed", True)):
+                tts = TextToSpeech(base_url=server.url, api_key="test", ssl_context=contexts[1])
+                if warm:
+                    tts.warm_up()
+                    time.sleep(handshake_delay * 2)  # the user is still talking
+                for request in ("Sure Lucas, starting playback.", "Done."):
+                    tts.synthesize(request, path)
+                    t = tts.last_timings
+                    print(f"  {label:10} {request!r:34} connect {t['connect_ms']:6.1f} ms  "
+                          f"ttfb {t['ttfb_ms']:6.1f} ms  total {t['total_ms']:6.1f} ms")
+                tts.http.close()
         finally:
-            os.unlink(temp_path)
+            server.close()
+
+
+if __name__ == "__main__":
+    test_tts_connection()
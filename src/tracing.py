@@ -0,0 +1,290 @@
+"""
+Lightweight latency tracing for the Sense → Think → Act → Speak loop.
+
+Components wrap their work in spans:
+
+    import tracing
+
+    with tracing.span("agent.capture"):
+        image = screen.capture_screen()
+
+Every span lands in a fixed-memory latency histogram (p50/p95/p99 per
+span name) and, optionally, a bounded ring of Chrome trace events that
+chrome://tracing or https://ui.perfetto.dev can open.
+
+Tracing is off by default. While off, span() returns a shared no-op
+object, so instrumented code costs one function call and a flag check.
+
+LEARNING GOALS:
+- Understand why tail latency (p95/p99) matters more than averages
+- Learn how log-bucketed histograms give percentiles in fixed memory
+- Practice building instrumentation that is free when switched off
+"""
+
+import json
+import time
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+
+# Histogram resolution: 2**SUB_BUCKET_BITS buckets per power of two,
+# i.e. ≤12.5% relative error on any percentile
+SUB_BUCKET_BITS = 3
+
+# Longest duration the histogram distinguishes (100 s); longer ones clamp
+MAX_TRACKED_NS = 100 * 1_000_000_000
+
+# Trace events kept for the Chrome trace (oldest dropped first)
+MAX_TRACE_EVENTS = 20000
+
+
+class LatencyHistogram:
+    """Fixed-memory log-linear histogram of durations in nanoseconds."""
+
+    def __init__(self, max_ns: int = MAX_TRACKED_NS):
+        self.max_ns = max_ns
+        self.counts = [0] * (self._index(max_ns) + 1)
+        self.count = 0
+        self.total_ns = 0
+        self.min_ns = None
+        self.max_seen_ns = 0
+
+    @staticmethod
+    def _index(ns: int) -> int:
+        """Bucket index: exact below 2**(S+1), then 2**S buckets per octave."""
+        sub = 1 << SUB_BUCKET_BITS
+        if ns < 2 * sub:
+            return ns
+        shift = ns.bit_length() - SUB_BUCKET_BITS - 1
+        return shift * sub + (ns >> shift)
+
+    @staticmethod
+    def _bucket_bounds(index: int) -> tuple:
+        """Inclusive lower bound and width of a bucket, in ns."""
+        sub = 1 << SUB_BUCKET_BITS
+        if index < 2 * sub:
+            return index, 1
+        shift = index // sub - 1
+        return (index - shift * sub) << shift, 1 << shift
+
+    def add(self, ns: int):
+        """Record one duration."""
+        ns = max(0, ns)
+        self.counts[self._index(min(ns, self.max_ns))] += 1
+        self.count += 1
+        self.total_ns += ns
+        if self.min_ns is None or ns < self.min_ns:
+            self.min_ns = ns
+        if ns > self.max_seen_ns:
+            self.max_seen_ns = ns
+
+    def percentile(self, q: float) -> float:
+        """
+        Approximate percentile.
+
+        Args:
+            q: Quantile in [0, 1] (0.99 for p99)
+
+        Returns:
+            Duration in nanoseconds (bucket midpoint), 0 if empty
+        """
+        if not self.count:
+            return 0.0
+        target = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                low, width = self._bucket_bounds(index)
+                return min(low + (width - 1) / 2, self.max_seen_ns)
+        return float(self.max_seen_ns)
+
+    def mean(self) -> float:
+        """Mean duration in nanoseconds."""
+        return self.total_ns / self.count if self.count else 0.0
+
+
+class _NullSpan:
+    """Shared do-nothing span used while tracing is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "start_ns")
+
+    def __init__(self, tracer: "Tracer", name: str):
+        self.tracer = tracer
+        self.name = name
+
+    def __enter__(self):
+        self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        end_ns = time.perf_counter_ns()
+        self.tracer.record(self.name, end_ns - self.start_ns, self.start_ns)
+        return False
+
+
+class Tracer:
+    """Collects spans into per-name histograms and a Chrome trace ring."""
+
+    def __init__(self, enabled: bool = False, max_events: int = MAX_TRACE_EVENTS):
+        """
+        Initialize the tracer.
+
+        Args:
+            enabled: Record spans (False makes span() a no-op)
+            max_events: Trace events kept for write_chrome_trace(); 0 keeps
+                        histograms only
+        """
+        self.enabled = enabled
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.events = deque(maxlen=max_events)
+        self._origin_ns = time.perf_counter_ns()
+        self._lock = threading.Lock()
+
+    def span(self, name: str):
+        """Context manager timing the enclosed block as `name`."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def record(self, name: str, duration_ns: int, start_ns: Optional[int] = None):
+        """
+        Record a duration measured elsewhere.
+
+        Args:
+            name: Span name (e.g. "vision.prefill")
+            duration_ns: Duration in nanoseconds
+            start_ns: perf_counter_ns() at the start (default: now - duration)
+        """
+        if not self.enabled:
+            return
+        if start_ns is None:
+            start_ns = time.perf_counter_ns() - duration_ns
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = LatencyHistogram()
+            histogram.add(duration_ns)
+            if self.events.maxlen:
+                self.events.append((name, start_ns, duration_ns, threading.get_ident()))
+
+    def reset(self):
+        """Forget everything recorded so far."""
+        with self._lock:
+            self.histograms.clear()
+            self.events.clear()
+            self._origin_ns = time.perf_counter_ns()
+
+    def summary(self) -> str:
+        """Per-span table of count, mean, p50, p95, p99 and max (ms)."""
+        lines = [f"{'span':24} {'count':>6} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}"]
+        with self._lock:
+            items = sorted(self.histograms.items())
+        for name, h in items:
+            ms = lambda ns: f"{ns / 1e6:9.2f}"
+            lines.append(
+                f"{name:24} {h.count:6d} {ms(h.mean())} {ms(h.percentile(0.5))} "
+                f"{ms(h.percentile(0.95))} {ms(h.percentile(0.99))} {ms(h.max_seen_ns)}"
+            )
+        return "\n".join(lines)
+
+    def write_chrome_trace(self, path: str):
+        """
+        Write recorded spans as a Chrome trace-event JSON file.
+
+        Args:
+            path: Output file (open in chrome://tracing or ui.perfetto.dev)
+        """
+        with self._lock:
+            events = list(self.events)
+        trace = {
+            "displayTimeUnit": "ms",
+            "traceEvents": [
+                {
+                    "name": name,
+                    "cat": name.split(".", 1)[0],
+                    "ph": "X",
+                    "ts": (start_ns - self._origin_ns) / 1000,
+                    "dur": duration_ns / 1000,
+                    "pid": 1,
+                    "tid": tid,
+                }
+                for name, start_ns, duration_ns, tid in events
+            ],
+        }
+        with open(path, "w") as f:
+            json.dump(trace, f)
+
+
+# Process-wide tracer that the instrumented modules report to
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """Return the process-wide tracer."""
+    return _tracer
+
+
+def enable(max_events: int = MAX_TRACE_EVENTS) -> Tracer:
+    """Turn on the process-wide tracer (clearing anything recorded)."""
+    _tracer.events = deque(maxlen=max_events)
+    _tracer.reset()
+    _tracer.enabled = True
+    return _tracer
+
+
+def span(name: str):
+    """Time a block on the process-wide tracer (no-op while disabled)."""
+    if not _tracer.enabled:
+        return _NULL_SPAN
+    return _Span(_tracer, name)
+
+
+def record(name: str, duration_ns: int, start_ns: Optional[int] = None):
+    """Record a pre-measured duration on the process-wide tracer."""
+    if _tracer.enabled:
+        _tracer.record(name, duration_ns, start_ns)
+
+
+# Example usage / test
+def test_tracing(iterations: int = 200_000):
+    """
+    Check histogram accuracy and measure per-span overhead.
+
+    Prints the cost of an empty span with tracing disabled and enabled.
+    """
+    print("Testing tracing...")
+
+    h = LatencyHistogram()
+    for ms in range(1, 1001):
+        h.add(ms * 1_000_000)
+    print(f"  1..1000 ms uniform: p50={h.percentile(0.5) / 1e6:.0f} ms "
+          f"p99={h.percentile(0.99) / 1e6:.0f} ms (expect ~500 / ~990 within 12.5%)")
+
+    for enabled in (False, True):
+        tracer = Tracer(enabled=enabled)
+        start = time.perf_counter_ns()
+        for _ in range(iterations):
+            with tracer.span("bench"):
+                pass
+        per_span = (time.perf_counter_ns() - start) / iterations
+        state = "enabled " if enabled else "disabled"
+        print(f"  Span overhead ({state}): {per_span / 1000:.3f} µs")
+
+
+if __name__ == "__main__":
+    test_tracing()
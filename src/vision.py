@@ -11,8 +11,14 @@ LEARNING GOALS:
 - Handle model loading and image preprocessing
 """
 
-from typing import Dict, Optional
+from typing import Callable, Dict, List, Optional
+import gc
+import os
 import json
+import time
+import threading
+from functools import partial
+from types import SimpleNamespace
 from PIL import Image
 import io
 import base64
@@ -20,39 +26,363 @@ import base64
 # Local model inference on Apple Silicon
 # pip install mlx-vlm
 # First run will download the model (~4-5GB)
-from mlx_vlm import load, generate
-from mlx_vlm.prompt_utils import apply_chat_template
-from mlx_vlm.utils import load_config
+try:
+    from mlx_vlm import load, generate, stream_generate
+    from mlx_vlm.prompt_utils import apply_chat_template
+    from mlx_vlm.utils import load_config
+except ImportError:  # not on Apple Silicon — stand-in loaders still work
+    load = generate = stream_generate = apply_chat_template = load_config = None
+
+
+import tracing
+from system_monitor import resident_memory_mb, format_mb
+from vision_server import map_steps, MAX_SEND_SIDE
 
 
 # Model to use — Qwen2.5-VL-7B is best for GUI understanding on 16GB RAM
 MODEL_NAME = "mlx-community/Qwen2.5-VL-7B-Instruct-4bit"
 
+# Small stand-in (~1.5GB) for trying out load/unload/reload cycles quickly
+SMALL_MODEL_NAME = "mlx-community/Qwen2-VL-2B-Instruct-4bit"
+
+# Generation budget for one plan — a few steps of JSON fit comfortably
+MAX_TOKENS = 500
+
+# Preprocessing and budget picked by vision_tuner.py; loaded at startup
+# when present, otherwise the defaults below apply
+SETTINGS_PATH = "data/vision_settings.json"
+
+DEFAULT_SETTINGS = {
+    "max_side": None,       # downscale until the longest side fits (None: native)
+    "crop": None,           # (left, top, right, bottom) as fractions of the frame
+    "max_tokens": MAX_TOKENS,
+}
+
+PROMPT_TEMPLATE = """You are analyzing a Logic Pro interface screenshot ({width}x{height} pixels).
+The user wants to: "{command}"
+
+Find the UI element(s) needed and return a JSON response:
+{{
+  "steps": [
+    {{
+      "action": "click",
+      "x": 123,
+      "y": 456,
+      "element": "play_button",
+      "description": "Click the play button"
+    }}
+  ],
+  "reasoning": "Explanation of what you found"
+}}
+
+Return ONLY valid JSON, no other text."""
+
+# Several intents resolved against the same frame in one generate call —
+# the image prefill (most of the prompt) is paid once instead of per intent
+MULTI_PROMPT_TEMPLATE = """You are analyzing a Logic Pro interface screenshot ({width}x{height} pixels).
+The user wants to do these things, in this order:
+{intents}
+
+For EACH of them, find the UI element(s) needed and return a JSON response:
+{{
+  "intents": [
+    {{
+      "command": "metronome_on",
+      "steps": [
+        {{
+          "action": "click",
+          "x": 123,
+          "y": 456,
+          "element": "metronome_button",
+          "description": "Click the metronome button"
+        }}
+      ]
+    }}
+  ],
+  "reasoning": "Explanation of what you found"
+}}
+
+List the intents in the order given, using the command names exactly as written.
+Return ONLY valid JSON, no other text."""
+
+
+def load_mlx_model(model_name: str) -> tuple:
+    """
+    Default model loader.
+
+    Returns:
+        Tuple of (model, processor, config)
+    """
+    if load is None:
+        raise RuntimeError("mlx-vlm is not installed (it needs Apple Silicon)")
+    model, processor = load(model_name)
+    return model, processor, load_config(model_name)
+
+
+def load_settings(path: Optional[str] = SETTINGS_PATH) -> Dict:
+    """
+    Read tuned vision settings, falling back to DEFAULT_SETTINGS.
+
+    Args:
+        path: Settings file written by vision_tuner.py (None: defaults)
+
+    Returns:
+        Dict with max_side, crop and max_tokens
+    """
+    settings = dict(DEFAULT_SETTINGS)
+    if not path or not os.path.exists(path):
+        return settings
+    try:
+        with open(path) as f:
+            tuned = json.load(f).get("settings", {})
+    except (OSError, ValueError, AttributeError) as e:
+        print(f"  Ignoring vision settings in {path}: {e}")
+        return settings
+    settings.update({k: v for k, v in tuned.items() if k in DEFAULT_SETTINGS})
+    return settings
+
+
+def describe_settings(settings: Dict) -> str:
+    """One-line summary, e.g. "1280px, crop (0.0, 0.03, 1.0, 1.0), 256 tokens"."""
+    side = f"{settings['max_side']}px" if settings.get("max_side") else "native"
+    crop = f"crop {tuple(settings['crop'])}" if settings.get("crop") else "full frame"
+    return f"{side}, {crop}, {settings['max_tokens']} tokens"
+
+
+def crop_box(image: Image.Image, crop: Optional[tuple]) -> Optional[tuple]:
+    """A fractional (left, top, right, bottom) crop in pixels of this frame."""
+    if crop is None:
+        return None
+    return (round(crop[0] * image.width), round(crop[1] * image.height),
+            round(crop[2] * image.width), round(crop[3] * image.height))
+
+
+def prepare_frame(image: Image.Image, max_side: Optional[int] = None,
+                  crop: Optional[tuple] = None) -> tuple:
+    """
+    Crop and downscale a screenshot before inference.
+
+    Qwen2.5-VL spends one visual token per 28x28 patch, so prefill time
+    grows with the pixel count — and small icons vanish if it shrinks
+    too far. vision_tuner.py finds the balance.
+
+    Args:
+        image: Full screenshot
+        max_side: Resize so the longest side is at most this (None: keep)
+        crop: (left, top, right, bottom) as fractions of the frame
+
+    Returns:
+        (image, mapping) — mapping holds "offset" and "factor" for
+        map_steps(), which takes clicks back to full-screen coordinates
+    """
+    offset = (0, 0)
+    box = crop_box(image, crop)
+    if box is not None:
+        image = image.crop(box)
+        offset = box[:2]
+    factor = 1.0
+    if max_side and max(image.size) > max_side:
+        factor = max(image.size) / max_side
+        size = (max(1, round(image.width / factor)), max(1, round(image.height / factor)))
+        image = image.resize(size, Image.BILINEAR, reducing_gap=2.0)
+    return image, {"offset": offset, "factor": factor}
+
+
+def _release_mlx_cache():
+    """Hand freed Metal buffers back to the OS (older mlx has it under mx.metal)."""
+    try:
+        import mlx.core as mx
+        (getattr(mx, "clear_cache", None) or mx.metal.clear_cache)()
+    except (ImportError, AttributeError):
+        pass
+
+
+def _worker_analyzer(model_name: str) -> "VisionAnalyzer":
+    """Build the in-process analyzer that runs inside a VisionWorker."""
+    return VisionAnalyzer(model_name=model_name)
+
 
 class VisionAnalyzer:
     """Uses a local Qwen2.5-VL model to understand Logic Pro interface."""
 
-    def __init__(self):
+    def __init__(
+        self,
+        isolated: bool = False,
+        idle_timeout: Optional[float] = None,
+        model_name: str = MODEL_NAME,
+        loader: Optional[Callable[[str], tuple]] = None,
+        worker_analyzer: Optional[Callable] = None,
+        server_url: Optional[str] = None,
+        settings_path: Optional[str] = SETTINGS_PATH
+    ):
         """
         Initialize the vision analyzer with local model.
 
-        TODO: Implement this
-        Hints:
-        - Use load() from mlx_vlm to load model and processor
-        - load() returns (model, processor) tuple
-        - Store as self.model and self.processor
-        - Also load config with load_config() for chat template
-        - First run downloads the model (~4-5GB), subsequent runs are instant
-        - Print a message so user knows model is loading
-
-        Example:
-            self.model, self.processor = load(MODEL_NAME)
-            self.config = load_config(MODEL_NAME)
-        """
-        print(f"Loading vision model: {MODEL_NAME}")
-        print("(First run will download ~4-5GB, this is a one-time setup)")
-        # TODO: Your implementation here
-        pass
+        First run downloads the model (~4-5GB), subsequent runs are instant.
+
+        Args:
+            isolated: Load the model in a separate worker process instead
+                      (see vision_worker.py) so inference never competes
+                      with the audio threads for the GIL
+            idle_timeout: Unload the model after this many seconds without
+                          a command (None keeps it resident). It reloads on
+                          the next command, or early via warm_up().
+            model_name: Model to load (SMALL_MODEL_NAME for quick testing)
+            loader: Callable(model_name) -> (model, processor, config);
+                    swap in a stand-in to exercise eviction without MLX
+            worker_analyzer: Picklable factory for the isolated worker's
+                             analyzer; swap in vision_worker.BusyAnalyzer
+                             to exercise the worker without MLX
+            server_url: Use a shared vision server (vision_server.py)
+                        instead of loading a model on this machine
+            settings_path: Tuned resolution/crop/token budget (see
+                           vision_tuner.py); None uses the defaults
+        """
+        self.model_name = model_name
+        self.idle_timeout = idle_timeout
+        self._loader = loader or load_mlx_model
+        self.model = None
+        self.processor = None
+        self.config = None
+        self.worker = None
+        self.remote = None
+        self.settings = load_settings(settings_path)
+        if settings_path and os.path.exists(settings_path):
+            print(f"Vision settings from {settings_path}: {describe_settings(self.settings)}")
+
+        # Seconds the most recent (re)load took to become ready
+        self.last_load_seconds: Optional[float] = None
+        self._last_used = time.monotonic()
+        # Held while loading, unloading or running inference
+        self._model_lock = threading.RLock()
+        self._warm_thread: Optional[threading.Thread] = None
+        self._stop_idle = threading.Event()
+
+        if server_url:
+            from vision_server import VisionClient
+            print(f"Using vision server at {server_url}")
+            self.remote = VisionClient(server_url)
+            self.apply_settings(self.settings)
+        elif isolated:
+            from vision_worker import VisionWorker
+            print(f"Starting vision worker process for {model_name}")
+            self.worker = VisionWorker(
+                analyzer_factory=worker_analyzer or partial(_worker_analyzer, model_name))
+            self.worker.start()
+        else:
+            self.load()
+
+        if idle_timeout and self.remote is None:
+            threading.Thread(target=self._idle_monitor, daemon=True).start()
+
+    def apply_settings(self, settings: Dict):
+        """
+        Switch preprocessing and token budget (the tuner calls this per setting).
+
+        With a vision server, frame size and crop apply to what is sent;
+        the token budget is the server's own. An isolated worker gets the
+        settings with every request.
+
+        Args:
+            settings: Any of the DEFAULT_SETTINGS keys
+        """
+        self.settings = {**self.settings, **settings}
+        if self.remote is not None:
+            self.remote.max_side = self.settings["max_side"] or MAX_SEND_SIDE
+
+    @property
+    def is_loaded(self) -> bool:
+        """True if the model is resident (or the worker process is up)."""
+        if self.remote is not None:
+            return True
+        if self.worker is not None:
+            return self.worker.is_running()
+        return self.model is not None
+
+    @property
+    def interruptible(self) -> bool:
+        """
+        True if cancel_event stops an inference that has already started.
+
+        In-process and in the worker, generation is streamed and stops at
+        the next token once cancel_event is set (the image prefill still
+        runs to completion), so the model is free for the next request
+        almost at once. The vision server has no cancel: the client stops
+        waiting, but the server finishes the inference anyway.
+        """
+        if self.remote is not None:
+            return False
+        return self.worker is not None or stream_generate is not None
+
+    def load(self):
+        """Load the model if it isn't resident. Blocks until ready."""
+        with self._model_lock:
+            self._last_used = time.monotonic()
+            if self.is_loaded:
+                return
+            if self.worker is not None:
+                self.worker.start()
+                return
+
+            before = resident_memory_mb()
+            print(f"Loading vision model: {self.model_name}")
+            print("(First run will download ~4-5GB, this is a one-time setup)")
+            start = time.perf_counter()
+            self.model, self.processor, self.config = self._loader(self.model_name)
+            self.last_load_seconds = time.perf_counter() - start
+            print(f"  Vision model ready in {self.last_load_seconds:.2f}s "
+                  f"(RSS {format_mb(before)} -> {format_mb(resident_memory_mb())})")
+
+    def unload(self):
+        """Drop the model to free memory. The next command reloads it."""
+        with self._model_lock:
+            if not self.is_loaded or self.remote is not None:
+                return
+            if self.worker is not None:
+                before = resident_memory_mb(self.worker.pid)
+                self.worker.close()
+                print(f"  Vision worker stopped (freed {format_mb(before)})")
+                return
+
+            before = resident_memory_mb()
+            self.model = self.processor = self.config = None
+            gc.collect()
+            _release_mlx_cache()
+            print(f"  Vision model unloaded "
+                  f"(RSS {format_mb(before)} -> {format_mb(resident_memory_mb())})")
+
+    def warm_up(self):
+        """
+        Start reloading in the background if the model was evicted.
+
+        Non-blocking — meant to be called on wake-word detection so the
+        reload overlaps the rest of the utterance.
+        """
+        self._last_used = time.monotonic()
+        if self.remote is not None:
+            self.remote.warm()  # the model is remote; the connection isn't
+            return
+        if self.is_loaded or (self._warm_thread and self._warm_thread.is_alive()):
+            return
+        self._warm_thread = threading.Thread(target=self.load, daemon=True)
+        self._warm_thread.start()
+
+    def _idle_monitor(self):
+        """Background thread: unload once idle for longer than idle_timeout."""
+        interval = min(5.0, self.idle_timeout / 4)
+        while not self._stop_idle.wait(interval):
+            if not self.is_loaded:
+                continue
+            if time.monotonic() - self._last_used < self.idle_timeout:
+                continue
+            # Don't wait behind a running inference — check again later
+            if self._model_lock.acquire(blocking=False):
+                try:
+                    if time.monotonic() - self._last_used >= self.idle_timeout:
+                        print(f"\n  Vision idle for {self.idle_timeout:.0f}s, unloading")
+                        self.unload()
+                finally:
+                    self._model_lock.release()
 
     def analyze_ui_for_command(
         self,
@@ -62,93 +392,235 @@ class VisionAnalyzer:
         """
         Analyze Logic Pro screenshot to find how to execute a command.
 
-        TODO: Implement this method
-        This is the CORE of the project!
+        Args:
+            screenshot_base64: Base64 encoded screenshot
+            user_command: What the user wants to do (e.g., "play", "record")
+
+        Returns:
+            Dict with 'steps' and 'reasoning'
+        """
+        image = self._decode_base64_image(screenshot_base64)
+        return self.analyze_image(image, user_command)
+
+    def analyze_image(
+        self,
+        image: Image.Image,
+        user_command: str,
+        cancel_event=None
+    ) -> Dict:
+        """
+        Analyze an already-decoded screenshot.
+
+        Skips the PNG/base64 round trip, and is what the worker process
+        calls on frames it reads out of shared memory. Reloads the model
+        first if it was evicted.
 
-        Hints:
-        - Decode the base64 screenshot back to a PIL Image
-        - Build a prompt asking the model to find UI elements
-        - Use apply_chat_template() to format the prompt with the image
-        - Use generate() to run inference
-        - Parse the JSON response
+        Args:
+            image: Screenshot as a PIL Image
+            user_command: What the user wants to do
+            cancel_event: Optional threading.Event; once set, generation
+                          stops at the next token and an empty plan is
+                          returned (see interruptible — not for the
+                          vision server)
 
-        Prompt engineering tips for Qwen2.5-VL:
-        - Be specific: "Find the play button in this Logic Pro screenshot"
-        - Ask for JSON format with coordinates
-        - Request (x, y) pixel coordinates for clicks
-        - Ask for step-by-step actions if multi-step
+        Returns:
+            Dict with 'steps' and 'reasoning'
+        """
+        if self.remote is not None:
+            return self.remote.analyze(image, user_command, region=crop_box(image, self.settings["crop"]))
+        if self.worker is not None:
+            return self._analyze_in_worker(image, user_command, cancel_event)
+
+        frame, mapping = prepare_frame(image, self.settings["max_side"], self.settings["crop"])
+        prompt = PROMPT_TEMPLATE.format(
+            width=frame.width, height=frame.height, command=user_command
+        )
+        response, elapsed_ns = self._generate(frame, prompt, cancel_event)
+        if response is None:
+            return {"steps": [], "reasoning": "cancelled"}
+        # Newer mlx-vlm versions return a GenerationResult instead of str
+        result = self.parse_response(getattr(response, "text", response))
+        result["steps"] = map_steps(result["steps"], mapping)
+        result["stats"] = self._generation_stats(response, elapsed_ns)
+        self._trace_generation(result["stats"])
+        return result
+
+    def analyze_commands(
+        self,
+        image: Image.Image,
+        commands: List[str],
+        cancel_event=None
+    ) -> Dict:
+        """
+        Plan several intents against one frame in a single inference.
 
-        Example prompt:
-        '''
-        You are analyzing a Logic Pro interface screenshot.
-        The user wants to: "{user_command}"
+        Args:
+            image: Screenshot as a PIL Image
+            commands: Intents in execution order (see
+                      CommandProcessor.parse_intents())
+            cancel_event: As for analyze_image()
 
-        Find the UI element(s) needed and return a JSON response:
-        {{
-          "steps": [
-            {{
-              "action": "click",
-              "x": 123,
-              "y": 456,
-              "element": "play_button",
-              "description": "Click the play button"
-            }}
-          ],
-          "reasoning": "Explanation of what you found"
-        }}
+        Returns:
+            Dict with the combined 'steps' (in intent order), 'per_intent'
+            steps, 'missing' intents the model found nothing for, and
+            'stats' including the estimated prefill saved
+        """
+        if len(commands) == 1:
+            result = self.analyze_image(image, commands[0], cancel_event=cancel_event)
+            result["per_intent"] = {commands[0]: result["steps"]}
+            result["missing"] = [] if result["steps"] else list(commands)
+            return result
+
+        if self.remote is not None:
+            return self.remote.analyze(image, list(commands), region=crop_box(image, self.settings["crop"]))
+        if self.worker is not None:
+            return self._analyze_in_worker(image, list(commands), cancel_event)
+
+        frame, mapping = prepare_frame(image, self.settings["max_side"], self.settings["crop"])
+        prompt = MULTI_PROMPT_TEMPLATE.format(
+            width=frame.width, height=frame.height,
+            intents="\n".join(f'{i + 1}. "{command}"' for i, command in enumerate(commands)),
+        )
+        response, elapsed_ns = self._generate(frame, prompt, cancel_event)
+        if response is None:
+            return {"steps": [], "per_intent": {}, "missing": list(commands), "reasoning": "cancelled"}
+        result = self.parse_multi_response(getattr(response, "text", response), commands)
+        result["steps"] = map_steps(result["steps"], mapping)
+        result["per_intent"] = {k: map_steps(v, mapping) for k, v in result["per_intent"].items()}
+
+        # Sequential calls would each prefill the whole image again
+        stats = self._generation_stats(response, elapsed_ns)
+        extra = len(commands) - 1
+        stats["batched_intents"] = len(commands)
+        stats["prefill_tokens_saved"] = extra * stats["prompt_tokens"]
+        stats["prefill_ns_saved"] = extra * stats["prefill_ns"]
+        result["stats"] = stats
+        self._trace_generation(stats)
+        return result
+
+    def _analyze_in_worker(self, image: Image.Image, command, cancel_event=None) -> Dict:
+        """
+        Run one request in the worker process.
+
+        Holds _model_lock like in-process inference does, so the idle
+        monitor can't close the worker while it is busy.
+        """
+        with self._model_lock:
+            self._last_used = time.monotonic()
+            try:
+                result = self.worker.analyze(image, command, cancel_event=cancel_event,
+                                             settings=self.settings)
+            finally:
+                self._last_used = time.monotonic()
+        # Prefill/decode ran in the worker; trace them on this side
+        self._trace_generation(result.get("stats"))
+        return result
+
+    def _generate(self, image: Image.Image, prompt: str, cancel_event=None) -> tuple:
+        """
+        Run one generate call, reloading the model first if evicted.
 
-        Return ONLY valid JSON, no other text.
-        '''
+        With a cancel_event, tokens are streamed and generation stops at
+        the first one after the event is set, releasing _model_lock.
 
-        To generate a response:
+        Returns:
+            Tuple of (mlx-vlm response, or None if cancelled; elapsed
+            nanoseconds)
+        """
+        with self._model_lock:
+            self.load()
             formatted = apply_chat_template(
                 self.processor, self.config, prompt, num_images=1
             )
-            response = generate(
-                self.model, self.processor, formatted,
-                images=[image], max_tokens=500, verbose=False
-            )
-
-        Args:
-            screenshot_base64: Base64 encoded screenshot
-            user_command: What the user wants to do (e.g., "play", "record")
+            start_ns = time.perf_counter_ns()
+            if cancel_event is None or stream_generate is None:
+                response = generate(
+                    self.model, self.processor, formatted,
+                    images=[image], max_tokens=self.settings["max_tokens"], verbose=False
+                )
+            else:
+                response = self._stream(formatted, image, cancel_event)
+            elapsed_ns = time.perf_counter_ns() - start_ns
+            self._last_used = time.monotonic()
+        return response, elapsed_ns
+
+    def _stream(self, formatted: str, image: Image.Image, cancel_event):
+        """stream_generate() until done or cancelled; a generate()-like result, or None."""
+        text, chunk = "", None
+        for chunk in stream_generate(
+            self.model, self.processor, formatted,
+            images=[image], max_tokens=self.settings["max_tokens"]
+        ):
+            if cancel_event.is_set():
+                return None
+            text += chunk.text
+        # The last chunk carries the token counts and rates
+        return SimpleNamespace(
+            text=text,
+            prompt_tokens=getattr(chunk, "prompt_tokens", 0),
+            prompt_tps=getattr(chunk, "prompt_tps", 0),
+            generation_tokens=getattr(chunk, "generation_tokens", 0),
+        )
+
+    @staticmethod
+    def _generation_stats(response, elapsed_ns: int) -> Dict:
+        """
+        Split generate() wall time into prefill and decode.
 
-        Returns:
-            Dict with 'steps' and 'reasoning'
+        mlx-vlm reports token counts and tokens/sec for both phases; when
+        it doesn't (older versions return a plain str) all of the time is
+        counted as decode.
         """
-        # TODO: Your implementation here
-        pass
+        prompt_tokens = getattr(response, "prompt_tokens", 0) or 0
+        prompt_tps = getattr(response, "prompt_tps", 0) or 0
+        prefill_ns = int(prompt_tokens / prompt_tps * 1e9) if prompt_tps else 0
+        prefill_ns = min(prefill_ns, elapsed_ns)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "generation_tokens": getattr(response, "generation_tokens", 0) or 0,
+            "prefill_ns": prefill_ns,
+            "decode_ns": elapsed_ns - prefill_ns,
+        }
+
+    @staticmethod
+    def _trace_generation(stats: Optional[Dict]):
+        """Record prefill and decode as back-to-back spans ending now."""
+        if not stats or "decode_ns" not in stats:
+            return
+        end_ns = time.perf_counter_ns()
+        decode_start = end_ns - stats["decode_ns"]
+        tracing.record("vision.prefill", stats["prefill_ns"], decode_start - stats["prefill_ns"])
+        tracing.record("vision.decode", stats["decode_ns"], decode_start)
+
+    def close(self):
+        """Stop the idle monitor and the worker process, if any."""
+        self._stop_idle.set()
+        if self.remote is not None:
+            self.remote.http.close()
+        if self.worker is not None:
+            self.worker.close()
+            self.worker = None
+        self.remote = None
 
     def _decode_base64_image(self, base64_string: str) -> Image.Image:
         """
         Decode a base64 string back to a PIL Image.
 
-        TODO: Implement this helper
-        Hints:
-        - Use base64.b64decode() to get bytes
-        - Wrap in io.BytesIO()
-        - Open with Image.open()
-
         Args:
             base64_string: Base64 encoded image
 
         Returns:
             PIL Image object
         """
-        # TODO: Your implementation here
-        pass
+        return Image.open(io.BytesIO(base64.b64decode(base64_string))).convert("RGB")
 
     def parse_response(self, response_text: str) -> Dict:
         """
         Parse the model's text response into structured actions.
 
-        TODO: Implement this
-        Hints:
-        - The model should return JSON, but sometimes adds extra text
-        - Try json.loads() first
-        - If that fails, try to find JSON in the response (look for { and })
-        - Handle errors gracefully — return empty steps if parsing fails
-        - Return a dict with 'steps' list and 'reasoning' string
+        The model should return JSON, but sometimes wraps it in markdown
+        fences or adds extra text, so fall back to the outermost {...}.
+        Never raises — unparseable output becomes an empty plan.
 
         Args:
             response_text: Raw text response from model
@@ -156,31 +628,148 @@ class VisionAnalyzer:
         Returns:
             Parsed dict with actions
         """
-        # TODO: Your implementation here
-        pass
+        text = (response_text or "").strip()
+        data = self._extract_json(text)
+        if not isinstance(data, dict):
+            return {"steps": [], "reasoning": f"Could not parse model output: {text[:200]}"}
+
+        return {
+            "steps": self._step_list(data.get("steps")),
+            "reasoning": str(data.get("reasoning", "")),
+        }
+
+    def parse_multi_response(self, response_text: str, commands: List[str]) -> Dict:
+        """
+        Parse a MULTI_PROMPT_TEMPLATE response into per-intent steps.
+
+        Intents are matched by command name, falling back to position when
+        the model renames them. A flat "steps" list (the single-intent
+        shape) is accepted too: steps tagged with an "intent" go to it,
+        untagged ones are kept after the matched ones. Never raises.
+
+        Args:
+            response_text: Raw text response from model
+            commands: Intents in execution order
+
+        Returns:
+            Dict with combined 'steps' (each tagged with its 'intent'),
+            'per_intent', 'missing' and 'reasoning'
+        """
+        text = (response_text or "").strip()
+        per_intent = {command: [] for command in commands}
+        untagged = []
+        data = self._extract_json(text)
+        if not isinstance(data, dict):
+            data = {"reasoning": f"Could not parse model output: {text[:200]}"}
+
+        entries = data.get("intents")
+        if isinstance(entries, list):
+            for i, entry in enumerate(entries):
+                if not isinstance(entry, dict):
+                    continue
+                command = entry.get("command")
+                if command not in per_intent:
+                    command = commands[i] if i < len(commands) else None
+                steps = self._step_list(entry.get("steps"))
+                (per_intent[command] if command else untagged).extend(steps)
+        else:
+            for step in self._step_list(data.get("steps")):
+                command = step.get("intent")
+                (per_intent[command] if command in per_intent else untagged).append(step)
+
+        combined = []
+        for command in commands:
+            for step in per_intent[command]:
+                step["intent"] = command
+                combined.append(step)
+        return {
+            "steps": combined + untagged,
+            "per_intent": per_intent,
+            "missing": [] if untagged else [c for c in commands if not per_intent[c]],
+            "reasoning": str(data.get("reasoning", "")),
+        }
+
+    @staticmethod
+    def _extract_json(text: str):
+        """Decode text as JSON, else its outermost {...}; None if neither parses."""
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            start, end = text.find("{"), text.rfind("}")
+            try:
+                return json.loads(text[start:end + 1]) if start != -1 and end > start else None
+            except json.JSONDecodeError:
+                return None
+
+    @staticmethod
+    def _step_list(steps) -> List[Dict]:
+        """Keep only dict entries of a model-provided steps list."""
+        return [s for s in steps if isinstance(s, dict)] if isinstance(steps, list) else []
 
 
 # Example usage / test
 def test_vision():
     """
-    Test the vision analyzer.
-
-    TODO: Implement this test
-    - Create VisionAnalyzer (will load model)
-    - Take a screenshot or load a test image
-    - Try analyzing for command "play"
-    - Print the results
+    Test the vision analyzer on a live screenshot for command "play".
 
     Note: First run will download ~4-5GB model!
     """
+    from screen_capture import ScreenCapture
+
     print("Testing vision analyzer...")
     print("This will download the Qwen2.5-VL model on first run.")
 
-    # TODO: Your test code here
-    # analyzer = VisionAnalyzer()
-    # result = analyzer.analyze_ui_for_command(screenshot_b64, "play")
-    # print(result)
+    analyzer = VisionAnalyzer()
+    image = ScreenCapture().capture_screen()
+    result = analyzer.analyze_image(image, "play")
+    print(json.dumps(result, indent=2))
+
+
+def test_idle_eviction(idle_timeout: float = 2.0):
+    """
+    Exercise unload / warm-up / reload with a stand-in model (no MLX needed).
+
+    The stand-in "model" is a 512MB buffer that takes 0.5s to load, so the
+    RSS and time-to-ready lines are easy to read. Then checks that an
+    isolated worker busy for longer than the timeout isn't evicted in the
+    middle of its inference.
+    """
+    def standin_loader(model_name):
+        time.sleep(0.5)
+        return bytearray(512 * 1024 * 1024), None, None
+
+    print("Testing idle eviction...")
+    analyzer = VisionAnalyzer(idle_timeout=idle_timeout, loader=standin_loader)
+    print(f"  Loaded: {analyzer.is_loaded}; waiting {idle_timeout * 1.5:.0f}s idle...")
+    time.sleep(idle_timeout * 1.5)
+    print(f"  Loaded after idle: {analyzer.is_loaded}")
+
+    start = time.perf_counter()
+    analyzer.warm_up()  # what the wake word triggers
+    time.sleep(0.3)     # ...while the rest of the utterance streams in
+    analyzer.load()     # the command arrives and needs the model
+    print(f"  Ready {time.perf_counter() - start:.2f}s after wake word "
+          f"(load took {analyzer.last_load_seconds:.2f}s, 0.3s overlapped)")
+    analyzer.close()
+
+    from vision_worker import BusyAnalyzer
+    work_ms = idle_timeout * 2000
+    analyzer = VisionAnalyzer(isolated=True, idle_timeout=idle_timeout, settings_path=None,
+                              worker_analyzer=partial(BusyAnalyzer, work_ms))
+    try:
+        result = analyzer.analyze_image(Image.new("RGB", (64, 64)), "play")
+        # An eviction attempted mid-inference would close the worker as it returns
+        time.sleep(idle_timeout / 2)
+        print(f"  Worker busy for {work_ms / 1000:.0f}s with a {idle_timeout:.0f}s timeout: "
+              f"{len(result['steps'])} step(s), still running: {analyzer.is_loaded}")
+        assert result["steps"] and analyzer.is_loaded, result
+    finally:
+        analyzer.close()
 
 
 if __name__ == "__main__":
-    test_vision()
+    test_idle_eviction()
+    if load is not None:
+        test_vision()
+    else:
+        print("mlx-vlm not installed; skipping test_vision")
@@ -0,0 +1,565 @@
+"""
+Vision inference server and its client.
+
+One machine with enough memory hosts the vision model; every room's Mac
+runs the agent with VisionAnalyzer(server_url=...) instead of loading
+the model itself.
+
+Server: requests are queued and run on the backend one at a time, in
+arrival order. mlx-vlm generates one sequence at a time, so there is
+nothing to gain from grouping them — concurrent rooms wait their turn.
+Each reply says how long that request queued and how long its own
+inference took, so a busy server shows up as queue time rather than as
+a slow model.
+
+Client: frames are made compact before they cross the network — an
+optional region crop, an integer downscale (the model downsamples
+anyway) and lossless PNG — and click coordinates are mapped back to the
+full screen on return.
+
+Wire format (POST /v1/analyze):
+    4-byte big-endian JSON length | JSON metadata | PNG frame
+
+LEARNING GOALS:
+- Understand why a shared queue alone doesn't buy throughput
+- Learn to separate queueing time from service time
+- Practice designing a compact binary request format
+"""
+
+import io
+import os
+import hmac
+import json
+import math
+import time
+import queue
+import struct
+import argparse
+import ipaddress
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Union
+
+from PIL import Image
+
+import tracing
+from http_client import PooledHTTPClient
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Longest side of the frame sent to the server, in pixels
+MAX_SEND_SIDE = 1920
+
+# Inference can take a while on a busy server
+CLIENT_READ_TIMEOUT = 120.0
+
+# Shared secret; when set, requests without it are refused. Required to
+# serve anything but this machine
+TOKEN_ENV = "LOGICPRO_VISION_TOKEN"
+
+# Largest request body accepted (a MAX_SEND_SIDE PNG is a few MB)
+MAX_REQUEST_BYTES = 32 * 1024 * 1024
+
+
+# --- Frame encoding --------------------------------------------------------
+
+def encode_frame(image: Image.Image, region: Optional[tuple] = None, max_side: int = MAX_SEND_SIDE) -> tuple:
+    """
+    Crop, downscale and PNG-encode a frame for sending.
+
+    Args:
+        image: Full screenshot
+        region: Optional (left, top, right, bottom) to send instead of all
+        max_side: Downscale (by a whole factor) until the longest side fits
+
+    Returns:
+        (png bytes, mapping) — mapping holds "offset" and "factor" for
+        map_steps()
+    """
+    offset = (0, 0)
+    if region is not None:
+        image = image.crop(region)
+        offset = (int(region[0]), int(region[1]))
+    factor = max(1, math.ceil(max(image.size) / max_side))
+    if factor > 1:
+        image = image.reduce(factor)  # box filter by a whole factor: fast and sharp enough for UI
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue(), {"offset": offset, "factor": factor}
+
+
+def map_steps(steps: List[Dict], mapping: Dict) -> List[Dict]:
+    """Scale click coordinates from the sent frame back to the full screen."""
+    factor = mapping["factor"]
+    left, top = mapping["offset"]
+    mapped = []
+    for step in steps:
+        step = dict(step)
+        if isinstance(step.get("x"), (int, float)) and isinstance(step.get("y"), (int, float)):
+            step["x"] = int(round((step["x"] + 0.5) * factor - 0.5)) + left
+            step["y"] = int(round((step["y"] + 0.5) * factor - 0.5)) + top
+        mapped.append(step)
+    return mapped
+
+
+def pack_request(meta: Dict, frame: bytes) -> bytes:
+    """Length-prefixed JSON metadata followed by the frame."""
+    header = json.dumps(meta).encode()
+    return struct.pack(">I", len(header)) + header + frame
+
+
+def unpack_request(body: bytes) -> tuple:
+    """
+    Inverse of pack_request().
+
+    Raises:
+        ValueError: If the metadata isn't an object with a "command" (a
+                    string or a list of strings)
+    """
+    (length,) = struct.unpack(">I", body[:4])
+    meta = json.loads(body[4:4 + length])
+    command = meta.get("command") if isinstance(meta, dict) else None
+    if not (isinstance(command, str) or
+            (isinstance(command, list) and command and all(isinstance(c, str) for c in command))):
+        raise ValueError('metadata needs a "command" string or list of strings')
+    return meta, body[4 + length:]
+
+
+def is_loopback(host: str) -> bool:
+    """True if binding host only accepts connections from this machine."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+# --- Server ----------------------------------------------------------------
+
+class _PendingRequest:
+    """One request waiting for (or in) inference."""
+
+    __slots__ = ("image", "command", "enqueued_ns", "done", "result", "timings")
+
+    def __init__(self, image: Image.Image, command: Union[str, List[str]]):
+        self.image = image
+        self.command = command
+        self.enqueued_ns = time.perf_counter_ns()
+        self.done = threading.Event()
+        self.result: Optional[Dict] = None
+        self.timings: Dict[str, float] = {}
+
+
+class VisionServer:
+    """HTTP front end that queues concurrent requests for one backend."""
+
+    def __init__(
+        self,
+        backend,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        token: Optional[str] = None
+    ):
+        """
+        Initialize the server (call start() or serve_forever()).
+
+        Args:
+            backend: Object with analyze_image(image, command) and
+                     analyze_commands(image, commands) — a VisionAnalyzer
+            host: Interface to bind (0.0.0.0 to serve other machines)
+            port: TCP port (0 picks a free one)
+            token: Shared secret clients must send (default: $LOGICPRO_VISION_TOKEN)
+
+        Raises:
+            ValueError: If host isn't a loopback address and there is no token
+        """
+        self.backend = backend
+        self.token = token if token is not None else os.environ.get(TOKEN_ENV)
+        if not self.token and not is_loopback(host):
+            raise ValueError(f"Refusing to serve {host} without a token: set ${TOKEN_ENV}")
+        # Updated from every handler thread and the inference thread
+        self.stats = {"requests": 0, "served": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+        self._queue: "queue.Queue[_PendingRequest]" = queue.Queue()
+        self._stop = threading.Event()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self.url = f"http://{host if host != '0.0.0.0' else '127.0.0.1'}:{self.port}"
+        self._worker = threading.Thread(target=self._inference_loop, name="vision-inference", daemon=True)
+
+    def start(self) -> "VisionServer":
+        """Serve on background threads."""
+        self._worker.start()
+        threading.Thread(target=self._httpd.serve_forever, name="vision-http", daemon=True).start()
+        return self
+
+    def serve_forever(self):
+        """Serve until interrupted."""
+        self._worker.start()
+        print(f"Vision server listening on {self.url}")
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def submit(self, image: Image.Image, command: Union[str, List[str]], timeout: float = CLIENT_READ_TIMEOUT) -> Dict:
+        """
+        Queue one request and wait for its plan.
+
+        Returns:
+            Plan dict with "server" timings (queue_ms, inference_ms)
+        """
+        self._count("requests")
+        pending = _PendingRequest(image, command)
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("vision server did not answer in time")
+        result = dict(pending.result)
+        result["server"] = pending.timings
+        return result
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _inference_loop(self):
+        """Inference thread: run queued requests on the backend in turn."""
+        while not self._stop.is_set():
+            try:
+                pending = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            started_ns = time.perf_counter_ns()
+            try:
+                if isinstance(pending.command, str):
+                    result = self.backend.analyze_image(pending.image, pending.command)
+                else:
+                    result = self.backend.analyze_commands(pending.image, pending.command)
+                self._count("served")
+            except Exception as e:
+                self._count("errors")
+                result = {"steps": [], "reasoning": f"Server error: {type(e).__name__}: {e}"}
+            self._release(pending, result, started_ns)
+
+    @staticmethod
+    def _release(pending: _PendingRequest, result: Dict, started_ns: int):
+        """Answer one request, timing its queue wait and inference."""
+        end_ns = time.perf_counter_ns()
+        queued_ns = max(0, started_ns - pending.enqueued_ns)
+        tracing.record("server.queue", queued_ns, pending.enqueued_ns)
+        tracing.record("server.inference", end_ns - started_ns, started_ns)
+        pending.result = result
+        pending.timings = {
+            "queue_ms": queued_ns / 1e6,
+            "inference_ms": (end_ns - started_ns) / 1e6,
+        }
+        pending.done.set()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path != "/v1/health":
+                    return self._reply(404, {"error": "not found"})
+                with server._stats_lock:
+                    stats = dict(server.stats)
+                self._reply(200, {"ok": True, "stats": stats})
+
+            def do_POST(self):
+                if self.path != "/v1/analyze":
+                    return self._reply(404, {"error": "not found"})
+                supplied = self.headers.get("Authorization", "").encode()
+                if server.token and not hmac.compare_digest(supplied, f"Bearer {server.token}".encode()):
+                    self.close_connection = True
+                    return self._reply(401, {"error": "bad token"})
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                except ValueError:
+                    length = -1
+                if not 0 < length <= MAX_REQUEST_BYTES:
+                    # The body isn't read, so the connection can't be reused
+                    self.close_connection = True
+                    status = 413 if length > MAX_REQUEST_BYTES else 400
+                    return self._reply(status, {"error": f"bad Content-Length (limit {MAX_REQUEST_BYTES} bytes)"})
+                try:
+                    body = self.rfile.read(length)
+                    start_ns = time.perf_counter_ns()
+                    meta, frame = unpack_request(body)
+                    image = Image.open(io.BytesIO(frame))
+                    image.load()
+                    decode_ms = (time.perf_counter_ns() - start_ns) / 1e6
+                except Exception as e:
+                    return self._reply(400, {"error": f"bad request: {e}"})
+                try:
+                    result = server.submit(image, meta["command"])
+                except TimeoutError as e:
+                    return self._reply(504, {"error": str(e)})
+                result["server"]["decode_ms"] = decode_ms
+                self._reply(200, result)
+
+            def _reply(self, status: int, payload: Dict):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+# --- Client ----------------------------------------------------------------
+
+class VisionClient:
+    """Sends frames to a VisionServer; the remote backend of VisionAnalyzer."""
+
+    def __init__(self, url: str, max_side: int = MAX_SEND_SIDE,
+                 region: Optional[tuple] = None, token: Optional[str] = None):
+        """
+        Initialize the client.
+
+        Args:
+            url: Server root ("http://studio-gpu.local:8765")
+            max_side: Longest side sent (see encode_frame())
+            region: Screen region to send instead of the full frame
+            token: Shared secret (default: $LOGICPRO_VISION_TOKEN)
+        """
+        self.http = PooledHTTPClient(url, read_timeout=CLIENT_READ_TIMEOUT)
+        self.max_side = max_side
+        self.region = region
+        self.token = token if token is not None else os.environ.get(TOKEN_ENV)
+
+    def warm(self):
+        """Open the connection in the background (see PooledHTTPClient)."""
+        self.http.warm_async()
+
+    def analyze(self, image: Image.Image, command: Union[str, List[str]], region: Optional[tuple] = None) -> Dict:
+        """
+        Plan one command (or several, in one inference) remotely.
+
+        Args:
+            image: Full screenshot
+            command: Command, or list of commands for analyze_commands()
+            region: Overrides the client's default region
+
+        Returns:
+            Plan with steps in full-screen coordinates, and "stats" with
+            encode/round-trip times plus the server's queue and inference
+            times
+        """
+        start_ns = time.perf_counter_ns()
+        with tracing.span("vision.encode"):
+            frame, mapping = encode_frame(image, region or self.region, self.max_side)
+        encode_ms = (time.perf_counter_ns() - start_ns) / 1e6
+
+        body = pack_request({"command": command}, frame)
+        headers = {"Content-Type": "application/octet-stream"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        sent_ns = time.perf_counter_ns()
+        with self.http.request("POST", "/v1/analyze", body, headers) as response:
+            payload = response.read()
+        round_trip_ms = (time.perf_counter_ns() - sent_ns) / 1e6
+        if response.status != 200:
+            raise RuntimeError(f"Vision server error {response.status}: {payload[:200]!r}")
+
+        result = json.loads(payload)
+        server = result.pop("server", {})
+        result["steps"] = map_steps(result.get("steps", []), mapping)
+        if "per_intent" in result:
+            result["per_intent"] = {k: map_steps(v, mapping) for k, v in result["per_intent"].items()}
+        server_ms = server.get("queue_ms", 0) + server.get("inference_ms", 0) + server.get("decode_ms", 0)
+        result["stats"] = {
+            **(result.get("stats") or {}),
+            "encode_ms": encode_ms,
+            "frame_bytes": len(frame),
+            "round_trip_ms": round_trip_ms,
+            "network_ms": max(0.0, round_trip_ms - server_ms),
+            **server,
+        }
+        tracing.record("vision.server_queue", int(server.get("queue_ms", 0) * 1e6))
+        return result
+
+
+# --- Load testing ----------------------------------------------------------
+
+class StandInModel:
+    """
+    Model stand-in: each request takes per_item_ms, and every plan clicks
+    the center of the frame it was given.
+    """
+
+    def __init__(self, per_item_ms: float = 120.0):
+        self.per_item_ms = per_item_ms
+
+    def analyze_image(self, image: Image.Image, command: str) -> Dict:
+        time.sleep(self.per_item_ms / 1000)
+        return {"steps": [{"action": "click", "x": image.width // 2,
+                           "y": image.height // 2, "element": command}],
+                "reasoning": "stand-in"}
+
+    def analyze_commands(self, image: Image.Image, commands: List[str]) -> Dict:
+        plan = self.analyze_image(image, ", ".join(commands))
+        return {**plan, "per_intent": {c: plan["steps"] for c in commands}}
+
+
+def run_load(url: str, clients: int, requests_per_client: int, image: Image.Image) -> Dict:
+    """
+    Fire requests from concurrent clients and summarize latency.
+
+    Returns:
+        Dict of throughput, p50/p95 latency and mean queue/inference ms
+    """
+    results: List[Dict] = []
+    lock = threading.Lock()
+
+    def client_loop(i: int):
+        client = VisionClient(url)
+        for j in range(requests_per_client):
+            start = time.perf_counter()
+            plan = client.analyze(image, f"play-{i}-{j}")
+            latency = (time.perf_counter() - start) * 1000
+            with lock:
+                results.append({"latency_ms": latency, **plan["stats"], "steps": plan["steps"]})
+        client.http.close()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client_loop, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    latencies = sorted(r["latency_ms"] for r in results)
+    mean = lambda key: sum(r[key] for r in results) / len(results)
+    return {
+        "requests": len(results),
+        "throughput": len(results) / wall,
+        "p50_ms": latencies[len(latencies) // 2],
+        "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "queue_ms": mean("queue_ms"),
+        "inference_ms": mean("inference_ms"),
+        "encode_ms": mean("encode_ms"),
+        "frame_kb": mean("frame_bytes") / 1024,
+        "first_click": results[0]["steps"][0],
+    }
+
+
+# Example usage / test
+def test_vision_server(clients: int = 8, requests_per_client: int = 6):
+    """
+    Load-test the server with a stand-in model.
+
+    Prints throughput, latency and the queue/inference split under
+    concurrent clients. Requests run one at a time, so throughput is
+    bounded by one over the per-request cost, the wait shows up as
+    queue_ms, and each request's inference_ms stays one request's cost.
+    Checks that bad requests and bad tokens are refused. Then shows what
+    encode_frame() does to a
+    5K screenshot and that a click survives the downscale round trip.
+    The load uses frames already at MAX_SEND_SIDE so client encoding
+    (which would share this process's GIL) doesn't skew the numbers.
+    """
+    print("Testing vision server...")
+    from PIL import ImageDraw
+    model = StandInModel()
+    server = VisionServer(model, port=0).start()
+    try:
+        report = run_load(server.url, clients, requests_per_client, Image.new("RGB", (1920, 1080)))
+        stats = server.stats
+    finally:
+        server.close()
+    print(f"  {clients} clients: {report['throughput']:5.1f} req/s, "
+          f"p50 {report['p50_ms']:5.0f} ms, p95 {report['p95_ms']:5.0f} ms, "
+          f"queue {report['queue_ms']:4.0f} ms, inference {report['inference_ms']:4.0f} ms")
+    assert report["inference_ms"] < model.per_item_ms * 1.5, "inference_ms should be per request"
+    assert stats["requests"] == stats["served"] == clients * requests_per_client, stats
+
+    import http.client
+    server = VisionServer(StandInModel(per_item_ms=0), port=0, token="secret").start()
+    try:
+        frame, _ = encode_frame(Image.new("RGB", (64, 64)))
+        statuses = []
+        for body, headers in [(pack_request({"command": "play"}, frame), {"Authorization": "Bearer wrong"}),
+                              (pack_request({"cmd": "play"}, frame), {}),
+                              (pack_request(["play"], frame), {}),
+                              (b"", {"Content-Length": str(MAX_REQUEST_BYTES + 1)})]:
+            conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+            conn.putrequest("POST", "/v1/analyze")
+            conn.putheader("Content-Length", headers.get("Content-Length", str(len(body))))
+            conn.putheader("Authorization", headers.get("Authorization", "Bearer secret"))
+            conn.endheaders(body)
+            statuses.append(conn.getresponse().status)
+            conn.close()
+    finally:
+        server.close()
+    assert statuses == [401, 400, 400, 413], statuses
+    try:
+        VisionServer(StandInModel(), host="0.0.0.0", port=0, token="")
+        raise AssertionError("served 0.0.0.0 without a token")
+    except ValueError:
+        pass
+    print(f"  Bad token / bad metadata / oversized body: {statuses}; 0.0.0.0 without a token refused")
+
+    screen = Image.new("RGB", (5120, 2880), (40, 40, 44))
+    draw = ImageDraw.Draw(screen)
+    for y in range(0, 2880, 46):
+        draw.line((0, y, 5120, y), fill=(20, 20, 20))
+        draw.text((40, y + 10), f"Audio {y // 46 + 1}", fill=(200, 200, 200))
+    start = time.perf_counter()
+    frame, mapping = encode_frame(screen)
+    encode_ms = (time.perf_counter() - start) * 1000
+    raw_kb = len(screen.tobytes()) / 1024
+    click = map_steps([{"x": 853, "y": 480}], mapping)[0]
+    print(f"  5K frame: {raw_kb:.0f} KB raw -> {len(frame) / 1024:.0f} KB sent "
+          f"(÷{mapping['factor']}, {encode_ms:.0f} ms); click (853, 480) -> ({click['x']}, {click['y']})")
+
+    cropped, crop_map = encode_frame(screen, region=(0, 0, 5120, 240))
+    print(f"  Control-bar crop: {len(cropped) / 1024:.0f} KB (÷{crop_map['factor']})")
+
+
+def main():
+    """Run the vision server with the real model (or --load-test)."""
+    from vision import VisionAnalyzer, MODEL_NAME
+
+    parser = argparse.ArgumentParser(description="Shared vision inference server")
+    parser.add_argument("--host", default=DEFAULT_HOST,
+                        help="Interface to bind; 0.0.0.0 serves other machines")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--load-test", action="store_true",
+                        help="Benchmark the server with a stand-in model instead of serving")
+    args = parser.parse_args()
+
+    if args.load_test:
+        test_vision_server()
+        return
+    if not os.environ.get(TOKEN_ENV) and not is_loopback(args.host):
+        parser.error(f"serving {args.host} needs a shared secret in ${TOKEN_ENV}")
+
+    analyzer = VisionAnalyzer(model_name=args.model)
+    VisionServer(analyzer, args.host, args.port).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
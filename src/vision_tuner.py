@@ -0,0 +1,437 @@
+"""
+Tune the vision model's input resolution, crop and token budget.
+
+How far a screenshot is scaled down before inference, and how many
+tokens the model may generate, trade latency against accuracy:
+Qwen2.5-VL's prefill cost grows with the pixel count, but below some
+resolution small icons stop being found, and too small a token budget
+cuts the JSON plan off mid-way.
+
+This tool runs a labelled fixture set (screenshots with ground-truth
+click targets) through the vision backend for every combination of
+max_side × crop × max_tokens, measuring:
+
+    hit rate   — the first click lands within N pixels of the target
+    latency    — p50/p95 wall time of analyze_image(), preprocessing included
+
+It keeps the Pareto-optimal settings (nothing else is both faster and at
+least as accurate), picks the fastest one within --max-hit-loss of the
+best hit rate, and writes it to data/vision_settings.json, which
+VisionAnalyzer loads at startup.
+
+Fixture manifest (paths relative to the manifest):
+
+    [{"image": "arrange_01.png", "command": "play", "target": [1262, 64]},
+     {"image": "arrange_01.png", "command": "mute track 3", "target": [208, 231],
+      "radius": 12}]
+
+Usage:
+    python src/vision_tuner.py data/fixtures/vision/fixtures.json
+    python src/vision_tuner.py fixtures.json --max-sides 0,1920,1280 --max-tokens 500,256
+    python src/vision_tuner.py --demo        # synthetic fixtures, stand-in model
+
+LEARNING GOALS:
+- Understand accuracy/latency trade-offs and Pareto frontiers
+- Learn how image resolution drives vision-language model cost
+- Practice evaluating a model against labelled ground truth
+"""
+
+import os
+import re
+import json
+import time
+import argparse
+import tempfile
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+from PIL import Image
+
+from vision import VisionAnalyzer, MODEL_NAME, SETTINGS_PATH, describe_settings, load_settings
+
+
+FIXTURES_PATH = "data/fixtures/vision/fixtures.json"
+
+# A click counts as a hit within this many pixels of the target (full-
+# screen pixels: 20 is 10pt on a Retina display)
+HIT_RADIUS_PX = 20
+
+# Candidate grid. max_side None keeps the native resolution.
+MAX_SIDES = (None, 1920, 1600, 1280, 1024, 768)
+MAX_TOKEN_BUDGETS = (500, 320, 200, 128)
+
+# Crops as (left, top, right, bottom) fractions of the frame
+CROP_PRESETS = {
+    "full": None,
+    "below_menu_bar": (0.0, 0.03, 1.0, 1.0),
+    "top_half": (0.0, 0.0, 1.0, 0.5),
+}
+
+# How much hit rate to give up for speed when choosing from the frontier
+DEFAULT_MAX_HIT_LOSS = 0.0
+
+
+def load_fixtures(path: str) -> List[Dict]:
+    """
+    Load a fixture manifest and its screenshots.
+
+    Args:
+        path: Manifest JSON (a list, or {"fixtures": [...]})
+
+    Returns:
+        Fixtures with "image" replaced by the loaded PIL Image
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    entries = manifest["fixtures"] if isinstance(manifest, dict) else manifest
+    root = os.path.dirname(path)
+    images = {}
+    fixtures = []
+    for entry in entries:
+        name = entry["image"]
+        if name not in images:
+            images[name] = Image.open(os.path.join(root, name)).convert("RGB")
+        fixtures.append({**entry, "image": images[name], "name": name})
+    return fixtures
+
+
+def settings_grid(max_sides=MAX_SIDES, crops=tuple(CROP_PRESETS), token_budgets=MAX_TOKEN_BUDGETS) -> List[Dict]:
+    """Every combination of the candidate values, as VisionAnalyzer settings."""
+    return [
+        {"max_side": side, "crop": CROP_PRESETS[crop], "crop_name": crop, "max_tokens": tokens}
+        for side in max_sides for crop in crops for tokens in token_budgets
+    ]
+
+
+def first_click(steps: List[Dict]) -> Optional[tuple]:
+    """(x, y) of the first click step, or None if the plan has none."""
+    for step in steps:
+        if step.get("action", "click") == "click" and isinstance(step.get("x"), (int, float)) \
+                and isinstance(step.get("y"), (int, float)):
+            return step["x"], step["y"]
+    return None
+
+
+def evaluate(analyzer: VisionAnalyzer, fixtures: List[Dict], settings: Dict,
+             radius: float = HIT_RADIUS_PX) -> Dict:
+    """
+    Run every fixture with one setting.
+
+    Args:
+        analyzer: In-process analyzer (settings are applied to it)
+        fixtures: From load_fixtures()
+        settings: One entry of settings_grid()
+        radius: Default hit radius (fixtures may set their own)
+
+    Returns:
+        Dict with the settings, hit_rate, empty (plans with no click),
+        mean_error_px over found targets, and p50/p95 latency in ms
+    """
+    analyzer.apply_settings({k: settings[k] for k in ("max_side", "crop", "max_tokens")})
+    latencies, errors = [], []
+    hits = empty = 0
+    for fixture in fixtures:
+        start = time.perf_counter()
+        result = analyzer.analyze_image(fixture["image"], fixture["command"])
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        click = first_click(result.get("steps", []))
+        if click is None:
+            empty += 1
+            continue
+        error = float(np.hypot(click[0] - fixture["target"][0], click[1] - fixture["target"][1]))
+        errors.append(error)
+        hits += error <= fixture.get("radius", radius)
+
+    return {
+        "settings": settings,
+        "hit_rate": hits / len(fixtures),
+        "empty": empty,
+        "mean_error_px": round(float(np.mean(errors)), 1) if errors else None,
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+    }
+
+
+def pareto_front(results: List[Dict]) -> List[Dict]:
+    """
+    Keep the results no other result beats on both hit rate and p50 latency.
+
+    Returns:
+        Frontier ordered from fastest to most accurate
+    """
+    front = []
+    for result in sorted(results, key=lambda r: (r["p50_ms"], -r["hit_rate"])):
+        if not front or result["hit_rate"] > front[-1]["hit_rate"]:
+            front.append(result)
+    return front
+
+
+def choose(front: List[Dict], max_hit_loss: float = DEFAULT_MAX_HIT_LOSS) -> Dict:
+    """The fastest frontier point within max_hit_loss of the best hit rate."""
+    best = max(r["hit_rate"] for r in front)
+    return next(r for r in front if r["hit_rate"] >= best - max_hit_loss - 1e-9)
+
+
+def write_settings(path: str, chosen: Dict, front: List[Dict], meta: Dict):
+    """
+    Save the chosen setting (plus the frontier for reference) atomically.
+
+    VisionAnalyzer reads only the "settings" key.
+    """
+    def entry(result):
+        settings = result["settings"]
+        return {
+            "label": label(settings),
+            "hit_rate": round(result["hit_rate"], 3),
+            "p50_ms": result["p50_ms"],
+            "p95_ms": result["p95_ms"],
+            **{k: settings[k] for k in ("max_side", "crop", "max_tokens")},
+        }
+
+    chosen_entry = entry(chosen)
+    document = {
+        "settings": {k: chosen_entry[k] for k in ("max_side", "crop", "max_tokens")},
+        "hit_rate": chosen_entry["hit_rate"],
+        "p50_ms": chosen_entry["p50_ms"],
+        "p95_ms": chosen_entry["p95_ms"],
+        **meta,
+        "pareto": [entry(r) for r in front],
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(document, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def label(settings: Dict) -> str:
+    """Short name for a setting, e.g. "1280px/below_menu_bar/200tok"."""
+    side = f"{settings['max_side']}px" if settings["max_side"] else "native"
+    crop = settings.get("crop_name") or ("crop" if settings["crop"] else "full")
+    return f"{side}/{crop}/{settings['max_tokens']}tok"
+
+
+def tune(analyzer: VisionAnalyzer, fixtures: List[Dict], grid: List[Dict],
+         radius: float = HIT_RADIUS_PX, max_hit_loss: float = DEFAULT_MAX_HIT_LOSS) -> tuple:
+    """
+    Evaluate the grid and pick a setting.
+
+    Returns:
+        (all results, Pareto front, chosen result)
+    """
+    # First inference pays for loading and compiling; keep it out of the numbers
+    analyzer.analyze_image(fixtures[0]["image"], fixtures[0]["command"])
+
+    results = []
+    for i, settings in enumerate(grid):
+        result = evaluate(analyzer, fixtures, settings, radius)
+        results.append(result)
+        print(f"  [{i + 1:3d}/{len(grid)}] {label(settings):34} hit {result['hit_rate']:6.1%}  "
+              f"p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms")
+    front = pareto_front(results)
+    return results, front, choose(front, max_hit_loss)
+
+
+def print_front(front: List[Dict], chosen: Dict):
+    """Print the Pareto frontier, marking the chosen setting."""
+    print("\nPareto frontier (fastest first):")
+    print(f"    {'setting':34} {'hit':>7} {'p50':>10} {'p95':>10} {'err px':>7}")
+    for result in front:
+        mark = "->" if result is chosen else "  "
+        error = result["mean_error_px"]
+        print(f"  {mark}{label(result['settings']):34} {result['hit_rate']:7.1%} "
+              f"{result['p50_ms']:7.1f} ms {result['p95_ms']:7.1f} ms "
+              f"{error if error is not None else '-':>7}")
+
+
+# --- Synthetic fixtures and stand-in model (for --demo) --------------------
+
+class _StandInResponse:
+    """Mimics mlx-vlm's GenerationResult."""
+
+    def __init__(self, text: str, prompt_tokens: int, prompt_tps: float, generation_tokens: int):
+        self.text = text
+        self.prompt_tokens = prompt_tokens
+        self.prompt_tps = prompt_tps
+        self.generation_tokens = generation_tokens
+
+
+class StandInVisionModel(VisionAnalyzer):
+    """
+    A VisionAnalyzer whose "model" finds targets by their colour.
+
+    Each command's target is drawn in its own colour. After the real
+    crop/downscale (prepare_frame()) small targets blur into their
+    surroundings and are no longer found, like small icons for the real
+    model. Latency follows the model's cost shape: one visual token per
+    28x28 patch at prefill_tps, plus generated tokens at decode_tps. The
+    answer is cut off at max_tokens, which breaks the JSON.
+    """
+
+    def __init__(self, colors: Dict[str, tuple], prefill_tps: float = 200000.0,
+                 decode_tps: float = 10000.0, tolerance: int = 30):
+        self.colors = colors
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.tolerance = tolerance
+        super().__init__(loader=lambda name: (object(), None, None), settings_path=None)
+
+    def load(self):
+        # Nothing to load; skip the banner
+        if self.model is None:
+            self.model, self.processor, self.config = self._loader(self.model_name)
+
+    def _generate(self, image: Image.Image, prompt: str) -> tuple:
+        start_ns = time.perf_counter_ns()
+        command = re.search(r'wants to: "(.*)"', prompt).group(1)
+        pixels = np.asarray(image)
+        match = np.ones(pixels.shape[:2], dtype=bool)
+        for channel, value in enumerate(self.colors.get(command, (0, 0, 0))):
+            plane = pixels[:, :, channel]
+            match &= (plane >= max(0, value - self.tolerance)) & (plane <= value + self.tolerance)
+        ys, xs = np.nonzero(match)
+
+        # Longer explanations for some commands, so small budgets truncate
+        words = 12 + (sum(map(ord, command)) % 5) * 18
+        reasoning = " ".join(["The element sits in the expected spot"] * (words // 7))
+        if len(xs):
+            steps = [{"action": "click", "x": int(round(xs.mean())), "y": int(round(ys.mean())),
+                      "element": command.replace(" ", "_"), "description": f"Click {command}"}]
+        else:
+            steps = []
+            reasoning = "Could not find the element. " + reasoning
+        text = json.dumps({"steps": steps, "reasoning": reasoning}, indent=2)
+        tokens = len(text) // 4  # ~4 characters per token
+        budget = self.settings["max_tokens"]
+        if tokens > budget:
+            text, tokens = text[:budget * 4], budget
+
+        prompt_tokens = image.width * image.height // (28 * 28) + 120
+        cost = prompt_tokens / self.prefill_tps + tokens / self.decode_tps
+        time.sleep(max(0.0, cost - (time.perf_counter_ns() - start_ns) / 1e9))
+        response = _StandInResponse(text, prompt_tokens, self.prefill_tps, tokens)
+        return response, time.perf_counter_ns() - start_ns
+
+
+def synthetic_fixtures(size=(2560, 1600), seed: int = 0) -> tuple:
+    """
+    Draw Logic-like screens with coloured targets of different sizes.
+
+    Returns:
+        (fixtures, colors) — colors maps each command to its target colour
+    """
+    from PIL import ImageDraw
+    rng = np.random.default_rng(seed)
+    width, height = size
+    # command: (target size in px, (x, y) as fractions of the frame)
+    targets = {
+        "play": (28, (0.493, 0.04)),
+        "record": (28, (0.506, 0.04)),
+        "metronome on": (20, (0.632, 0.04)),
+        "low latency mode": (12, (0.66, 0.04)),
+        "mute track 2": (14, (0.081, 0.16)),
+        "solo track 5": (14, (0.088, 0.30)),
+        "arm track 7": (7, (0.095, 0.39)),
+        "open the mixer": (24, (0.02, 0.62)),
+        "master fader": (9, (0.92, 0.80)),
+    }
+    colors = {}
+    for i, command in enumerate(targets):
+        hue = i / len(targets)
+        colors[command] = tuple(int(c) for c in 60 + 180 * np.clip(
+            np.abs((hue * 6 + np.array([0, 4, 2])) % 6 - 3) - 1, 0, 1))
+
+    fixtures = []
+    for screen in range(2):
+        image = Image.new("RGB", size, (38, 38, 40))
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((0, 0, width, int(0.025 * height)), fill=(222, 222, 224))  # menu bar
+        draw.rectangle((0, int(0.025 * height), width, int(0.075 * height)), fill=(58, 58, 62))
+        for row in range(20):  # track headers with grey buttons
+            y = int(0.1 * height + row * 0.035 * height)
+            draw.rectangle((0, y, int(0.2 * width), y + int(0.03 * height)), fill=(50, 50, 54))
+            for b in range(4):
+                x = int((0.06 + 0.012 * b) * width)
+                draw.rectangle((x, y + 8, x + 14, y + 22), fill=(90, 90, 96))
+        for command, (side, (fx, fy)) in targets.items():
+            # Screens differ slightly: windows are never in exactly the same place
+            x = int(fx * width + rng.integers(-20, 21))
+            y = int(fy * height + rng.integers(-6, 7))
+            draw.rectangle((x - side // 2, y - side // 2, x + (side - 1) // 2, y + (side - 1) // 2),
+                           fill=colors[command])
+            fixtures.append({"image": image, "name": f"screen_{screen}", "command": command,
+                             "target": [x, y]})
+    return fixtures, colors
+
+
+def test_vision_tuner():
+    """
+    Tune against synthetic fixtures with the stand-in model.
+
+    Targets range from 28 px transport buttons down to a 9 px record-arm
+    button, and some sit in the lower half of the screen, so both heavy
+    downscaling and the top_half crop cost hits.
+    """
+    print("Tuning vision settings (synthetic fixtures, stand-in model)...")
+    fixtures, colors = synthetic_fixtures()
+    analyzer = StandInVisionModel(colors)
+    grid = settings_grid(max_sides=(None, 1920, 1280, 960, 640), token_budgets=(500, 200, 128))
+    _, front, chosen = tune(analyzer, fixtures, grid)
+    print_front(front, chosen)
+    print(f"\n  Chosen: {describe_settings(chosen['settings'])}")
+
+    # Round trip through the settings file the analyzer reads at startup
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "vision_settings.json")
+        write_settings(path, chosen, front, {"model": "stand-in", "fixtures": len(fixtures),
+                                             "radius_px": HIT_RADIUS_PX})
+        print(f"  Analyzer loads back: {describe_settings(load_settings(path))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune vision resolution, crop and token budget")
+    parser.add_argument("fixtures", nargs="?", default=FIXTURES_PATH, help="Fixture manifest JSON")
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--output", default=SETTINGS_PATH)
+    parser.add_argument("--radius", type=float, default=HIT_RADIUS_PX,
+                        help="Hit radius in full-screen pixels")
+    parser.add_argument("--max-sides", default=",".join(str(s or 0) for s in MAX_SIDES),
+                        help="Comma-separated longest sides (0 = native)")
+    parser.add_argument("--crops", default=",".join(CROP_PRESETS),
+                        help=f"Comma-separated crop presets ({', '.join(CROP_PRESETS)})")
+    parser.add_argument("--max-tokens", default=",".join(map(str, MAX_TOKEN_BUDGETS)))
+    parser.add_argument("--max-hit-loss", type=float, default=DEFAULT_MAX_HIT_LOSS,
+                        help="Hit rate to give up for speed, e.g. 0.02")
+    parser.add_argument("--demo", action="store_true",
+                        help="Synthetic fixtures and a stand-in model (no MLX needed)")
+    args = parser.parse_args()
+
+    if args.demo:
+        test_vision_tuner()
+        return
+
+    fixtures = load_fixtures(args.fixtures)
+    grid = settings_grid(
+        max_sides=[int(s) or None for s in args.max_sides.split(",")],
+        crops=args.crops.split(","),
+        token_budgets=[int(t) for t in args.max_tokens.split(",")],
+    )
+    print(f"Tuning {len(grid)} settings over {len(fixtures)} fixtures...")
+    # Start from the defaults, not whatever was tuned last time
+    analyzer = VisionAnalyzer(model_name=args.model, settings_path=None)
+    _, front, chosen = tune(analyzer, fixtures, grid, args.radius, args.max_hit_loss)
+    print_front(front, chosen)
+
+    write_settings(args.output, chosen, front, {
+        "model": args.model,
+        "fixtures": len(fixtures),
+        "radius_px": args.radius,
+        "tuned_at": datetime.now().isoformat(timespec="seconds"),
+    })
+    print(f"\nWrote {describe_settings(chosen['settings'])} to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,462 @@
+"""
+Vision inference in an isolated worker process.
+
+Running the VLM in the same process as VoiceInput._stream_mic and TTS
+playback means heavy inference competes with the audio threads for the
+GIL, which shows up as late mic reads (underruns). VisionWorker moves the
+model into its own process:
+
+- Frames travel through multiprocessing.shared_memory as raw RGB bytes,
+  not pickled PNG/base64 — one memcpy in, one memcpy out.
+- Each request carries an id; stale results (after a cancel or timeout)
+  are discarded by id.
+- Cancelling reaches the child: the analyzer gets a cancel flag for the
+  request it is running and stops at its next check (for the real model,
+  the next generated token), so the next request doesn't queue behind a
+  request nobody is waiting for.
+- A hung or crashed worker is terminated and restarted, up to a budget.
+
+LEARNING GOALS:
+- Understand why the GIL makes threads a poor fit for CPU-heavy work
+- Learn multiprocessing with the "spawn" start method and shared memory
+- Practice supervising a child process (timeouts, crashes, restarts)
+"""
+
+import time
+import queue
+import itertools
+import threading
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from functools import partial
+from typing import Callable, Dict, List, Optional, Union
+
+from PIL import Image
+
+import tracing
+
+
+# Model load can take a while (first run downloads ~4-5GB)
+STARTUP_TIMEOUT = 600.0
+
+# One inference should never take this long — assume the worker is hung
+REQUEST_TIMEOUT = 60.0
+
+# Give up after this many restarts in one session
+MAX_RESTARTS = 3
+
+# How often the waiting side wakes up to check cancel / liveness
+POLL_INTERVAL = 0.05
+
+
+class VisionWorkerError(RuntimeError):
+    """The worker process timed out, crashed, or could not be restarted."""
+
+
+def _default_analyzer():
+    """Build the real analyzer inside the worker process."""
+    from vision import VisionAnalyzer
+    return VisionAnalyzer()
+
+
+class _CancelFlag:
+    """A threading.Event look-alike, set once the parent cancels this request."""
+
+    def __init__(self, cancelled_upto, request_id: int):
+        self.cancelled_upto = cancelled_upto
+        self.request_id = request_id
+
+    def is_set(self) -> bool:
+        return self.request_id <= self.cancelled_upto.value
+
+
+def _worker_main(requests, responses, cancelled_upto, analyzer_factory):
+    """
+    Worker process loop.
+
+    Messages in:  (request_id, shm_name, size, mode, command, settings) or
+                  None to exit; a list of commands is planned in one batched
+                  inference, and settings (frame size, crop, token budget)
+                  are applied to the analyzer first
+    Messages out: ("ready" | "result" | "error" | "skipped", request_id, payload)
+    """
+    analyzer = analyzer_factory()
+    responses.put(("ready", None, None))
+
+    segment = None
+    try:
+        while True:
+            message = requests.get()
+            if message is None:
+                break
+            request_id, shm_name, size, mode, command, settings = message
+
+            # Cancelled while queued — don't burn an inference on it
+            if request_id <= cancelled_upto.value:
+                responses.put(("skipped", request_id, None))
+                continue
+
+            if segment is None or segment.name != shm_name:
+                if segment is not None:
+                    segment.close()
+                segment = shared_memory.SharedMemory(name=shm_name)
+
+            nbytes = size[0] * size[1] * len(mode)
+            frame = Image.frombytes(mode, size, bytes(segment.buf[:nbytes]))
+            cancel = _CancelFlag(cancelled_upto, request_id)
+            try:
+                if settings and hasattr(analyzer, "apply_settings"):
+                    analyzer.apply_settings(settings)
+                if isinstance(command, list):
+                    result = analyzer.analyze_commands(frame, command, cancel_event=cancel)
+                else:
+                    result = analyzer.analyze_image(frame, command, cancel_event=cancel)
+                responses.put(("result", request_id, result))
+            except Exception as e:
+                responses.put(("error", request_id, f"{type(e).__name__}: {e}"))
+    finally:
+        if segment is not None:
+            segment.close()
+
+
+class VisionWorker:
+    """Runs a VisionAnalyzer in a child process and talks to it via shared memory."""
+
+    def __init__(
+        self,
+        analyzer_factory: Optional[Callable] = None,
+        timeout: float = REQUEST_TIMEOUT,
+        startup_timeout: float = STARTUP_TIMEOUT,
+        max_restarts: int = MAX_RESTARTS
+    ):
+        """
+        Initialize (but don't start) the worker.
+
+        Args:
+            analyzer_factory: Picklable zero-arg callable that builds the
+                              analyzer inside the child (default: real model)
+            timeout: Seconds one inference may take before the worker is
+                     considered hung and restarted
+            startup_timeout: Seconds to wait for the model to load
+            max_restarts: Restart budget before giving up
+        """
+        self.analyzer_factory = analyzer_factory or _default_analyzer
+        self.timeout = timeout
+        self.startup_timeout = startup_timeout
+        self.max_restarts = max_restarts
+        self.restarts = 0
+
+        self._ctx = mp.get_context("spawn")
+        self._process = None
+        self._requests = None
+        self._responses = None
+        self._cancelled_upto = self._ctx.Value("q", 0, lock=False)
+        self._ready = False
+        self._started_at = 0.0
+        # Seconds from spawn to "ready" for the most recent worker
+        self.last_ready_seconds: Optional[float] = None
+        self._shm: Optional[shared_memory.SharedMemory] = None
+        self._ids = itertools.count(1)
+        # One request in flight at a time: the frame buffer is shared
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Spawn the worker process. Returns without waiting for model load."""
+        self._requests = self._ctx.Queue()
+        self._responses = self._ctx.Queue()
+        self._ready = False
+        self._started_at = time.monotonic()
+        self._process = self._ctx.Process(
+            target=_worker_main,
+            args=(self._requests, self._responses, self._cancelled_upto,
+                  self.analyzer_factory),
+            daemon=True,
+        )
+        self._process.start()
+
+    def is_running(self) -> bool:
+        """True if the worker process is alive (it may still be loading)."""
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def pid(self) -> Optional[int]:
+        """Worker process id, for memory reporting."""
+        return self._process.pid if self._process is not None else None
+
+    def analyze(
+        self,
+        image: Image.Image,
+        user_command: Union[str, List[str]],
+        timeout: Optional[float] = None,
+        cancel_event: Optional[threading.Event] = None,
+        settings: Optional[Dict] = None
+    ) -> Dict:
+        """
+        Run one inference in the worker.
+
+        Args:
+            image: Screenshot as a PIL Image
+            user_command: What the user wants to do, or several intents
+                          to plan together (VisionAnalyzer.analyze_commands)
+            timeout: Override the per-request timeout
+            cancel_event: When set, stop waiting and return an empty plan;
+                          the worker's analyzer stops the inference too
+            settings: VisionAnalyzer settings for this request, so changes
+                      made in the parent (tuner, load governor) reach the
+                      worker's analyzer
+
+        Returns:
+            Dict with 'steps' and 'reasoning'
+
+        Raises:
+            VisionWorkerError: On timeout, crash or exhausted restart budget
+        """
+        with self._lock:
+            if not self.is_running():
+                self._restart("worker not running")
+            if not self._ready and not self._wait_ready(cancel_event):
+                return {"steps": [], "reasoning": "cancelled"}
+
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            request_id = next(self._ids)
+            self._write_frame(image)
+            self._requests.put(
+                (request_id, self._shm.name, image.size, image.mode, user_command, settings)
+            )
+            return self._wait_result(request_id, timeout or self.timeout, cancel_event)
+
+    def _write_frame(self, image: Image.Image):
+        """Copy raw pixels into the shared segment, growing it if needed."""
+        with tracing.span("vision.encode"):
+            data = image.tobytes()
+            if self._shm is None or self._shm.size < len(data):
+                self._release_shm()
+                self._shm = shared_memory.SharedMemory(create=True, size=len(data))
+            self._shm.buf[:len(data)] = data
+
+    def _wait_ready(self, cancel_event: Optional[threading.Event]) -> bool:
+        """Wait for the model to load. Returns False if cancelled first."""
+        deadline = time.monotonic() + self.startup_timeout
+        while not self._ready:
+            kind, _, _ = self._next_message(deadline, cancel_event, "model load")
+            if kind == "cancelled":
+                return False
+            if kind == "ready":
+                self._ready = True
+                self.last_ready_seconds = time.monotonic() - self._started_at
+                print(f"  Vision worker ready in {self.last_ready_seconds:.2f}s")
+        return True
+
+    def _wait_result(
+        self,
+        request_id: int,
+        timeout: float,
+        cancel_event: Optional[threading.Event]
+    ) -> Dict:
+        deadline = time.monotonic() + timeout
+        while True:
+            kind, message_id, payload = self._next_message(
+                deadline, cancel_event, f"request {request_id}", request_id
+            )
+            if kind == "cancelled":
+                return {"steps": [], "reasoning": "cancelled"}
+            if message_id != request_id:
+                continue  # stale reply from a cancelled or timed-out request
+            if kind == "result":
+                return payload
+            if kind == "error":
+                raise VisionWorkerError(payload)
+
+    def _next_message(self, deadline, cancel_event, what, request_id=None):
+        """Poll the response queue, watching cancel, liveness and the deadline."""
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                if request_id is not None:
+                    self._cancelled_upto.value = request_id
+                return ("cancelled", request_id, None)
+            try:
+                return self._responses.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+            if not self._process.is_alive():
+                code = self._process.exitcode
+                self._restart(f"worker exited with code {code}")
+                raise VisionWorkerError(f"Vision worker crashed during {what} (exit {code})")
+            if time.monotonic() > deadline:
+                self._restart(f"timed out during {what}")
+                raise VisionWorkerError(f"Vision worker timed out during {what}")
+
+    def _restart(self, reason: str):
+        """Kill the current worker (if any) and spawn a fresh one."""
+        if self._process is not None:
+            if self.restarts >= self.max_restarts:
+                raise VisionWorkerError(f"Vision worker gave up after {self.restarts} restarts ({reason})")
+            self.restarts += 1
+            print(f"  Restarting vision worker ({reason})")
+            self._stop_process()
+        self.start()
+
+    def _stop_process(self):
+        if self._process is None:
+            return
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join(timeout=5)
+        self._process = None
+
+    def _release_shm(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def close(self):
+        """Ask the worker to exit and free the shared frame buffer."""
+        with self._lock:
+            if self._process is not None and self._process.is_alive():
+                self._requests.put(None)
+                self._process.join(timeout=5)
+            self._stop_process()
+            self._release_shm()
+
+
+class BusyAnalyzer:
+    """
+    Stand-in analyzer that holds the GIL like a pure-Python hot loop.
+
+    Used by the jitter benchmark so it runs without the real model. Like
+    token-by-token generation, it checks cancel_event as it goes.
+    """
+
+    def __init__(self, work_ms: float = 200.0):
+        self.work_ms = work_ms
+        self.settings = {}
+
+    def apply_settings(self, settings: Dict):
+        self.settings = {**self.settings, **settings}
+
+    def analyze_image(self, image, user_command, cancel_event=None) -> Dict:
+        end = time.perf_counter() + self.work_ms / 1000
+        total = 0
+        while time.perf_counter() < end:
+            if cancel_event is not None and cancel_event.is_set():
+                return {"steps": [], "reasoning": "cancelled"}
+            for i in range(1000):
+                total += i * i
+        return {"steps": [{"action": "click", "x": 10, "y": 10,
+                           "element": user_command, "description": "stand-in"}],
+                "reasoning": "BusyAnalyzer", "settings": self.settings}
+
+
+def _measure_callback_jitter(run_inference, period_ms: float = 10.0,
+                             rounds: int = 5) -> list:
+    """
+    Run a periodic "audio callback" thread while inference runs.
+
+    Returns how late (ms) each callback woke up versus its schedule.
+    """
+    lateness = []
+    stop = threading.Event()
+
+    def callback_loop():
+        period = period_ms / 1000
+        next_tick = time.perf_counter() + period
+        while not stop.is_set():
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            lateness.append(max(0.0, (time.perf_counter() - next_tick) * 1000))
+            next_tick += period
+
+    thread = threading.Thread(target=callback_loop, daemon=True)
+    thread.start()
+    for _ in range(rounds):
+        run_inference()
+    stop.set()
+    thread.join()
+    return lateness
+
+
+def _summarize(name: str, lateness: list):
+    ordered = sorted(lateness)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    print(f"  {name:12} callbacks={len(ordered):4}  p50={pick(0.5):6.2f} ms  "
+          f"p99={pick(0.99):6.2f} ms  max={ordered[-1]:6.2f} ms")
+
+
+def benchmark_audio_jitter(work_ms: float = 200.0, rounds: int = 5):
+    """
+    Compare audio-callback jitter with in-process vs isolated inference.
+
+    A 10 ms periodic thread stands in for the sounddevice callback; each
+    inference is a BusyAnalyzer burning work_ms of GIL-holding CPU on a
+    1920x1080 frame.
+    """
+    print("Benchmarking audio callback jitter...")
+    frame = Image.new("RGB", (1920, 1080), (40, 40, 40))
+
+    inline = BusyAnalyzer(work_ms)
+    _summarize("in-process", _measure_callback_jitter(
+        lambda: inline.analyze_image(frame, "play"), rounds=rounds))
+
+    worker = VisionWorker(analyzer_factory=partial(BusyAnalyzer, work_ms))
+    worker.start()
+    worker.analyze(frame, "warmup")
+    try:
+        _summarize("isolated", _measure_callback_jitter(
+            lambda: worker.analyze(frame, "play"), rounds=rounds))
+    finally:
+        worker.close()
+
+
+# Example usage / test
+def test_vision_worker():
+    """
+    Exercise the worker with the stand-in analyzer (no model needed).
+
+    Checks a normal request, a cancelled one, recovery from a crash, and
+    that cancelling stops an inference already running in the worker.
+    """
+    print("Testing vision worker...")
+    frame = Image.new("RGB", (640, 400), (0, 0, 0))
+    worker = VisionWorker(analyzer_factory=partial(BusyAnalyzer, 100.0), timeout=5.0)
+    worker.start()
+    try:
+        print(f"  Result: {worker.analyze(frame, 'play')['steps'][0]['element']}")
+
+        result = worker.analyze(frame, "play", settings={"max_side": 1024})
+        assert result["settings"] == {"max_side": 1024}, result["settings"]
+        print(f"  Settings reach the worker: {result['settings']}")
+
+        cancel = threading.Event()
+        threading.Timer(0.02, cancel.set).start()
+        print(f"  Cancelled: {worker.analyze(frame, 'stop', cancel_event=cancel)}")
+
+        worker._process.kill()
+        worker._process.join()
+        print(f"  After crash: {worker.analyze(frame, 'record')['steps'][0]['element']}"
+              f" (restarts={worker.restarts})")
+    finally:
+        worker.close()
+
+    # Cancel a long inference after 100 ms: the next request must not wait it out
+    worker = VisionWorker(analyzer_factory=partial(BusyAnalyzer, 1000.0), timeout=5.0)
+    worker.start()
+    try:
+        worker.analyze(frame, "warmup")
+        cancel = threading.Event()
+        threading.Timer(0.1, cancel.set).start()
+        worker.analyze(frame, "play", cancel_event=cancel)
+        start = time.perf_counter()
+        worker.analyze(frame, "stop")
+        next_ms = (time.perf_counter() - start) * 1000
+        print(f"  Next request after cancelling a 1000 ms inference: {next_ms:.0f} ms")
+        assert next_ms < 1500, "the cancelled inference kept running"
+    finally:
+        worker.close()
+
+
+if __name__ == "__main__":
+    test_vision_worker()
+    benchmark_audio_jitter()